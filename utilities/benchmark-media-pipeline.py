@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the rsLSM media pipeline
+=======================================
+
+Times pieces of smart-media-selector.py against a folder of real photos so
+changes can be compared before and after.
+
+Usage:
+    # Fast thumbnail path vs. full decode + LANCZOS resize
+    python utilities/benchmark-media-pipeline.py thumbnails \
+        --photos-dir "/path/to/photos" --limit 200
+
+    # Diversity-aware selection vs. the original select_best_media
+    python utilities/benchmark-media-pipeline.py selection --sizes 1000 10000 100000
+
+    # Whole pipeline (scan, catalog, thumbnail, analyse, select, convert) on a
+    # synthetic corpus, against a local stand-in for the API
+    python utilities/benchmark-media-pipeline.py pipeline --sizes 1000 10000 100000 \
+        --latency 0.5 --failure-rate 0.02 --json results.json
+
+    # Every Pillow mode (palette, 1-bit, 16-bit...) through thumbnails,
+    # hashing and srcset conversion; exits non-zero if any fails
+    python utilities/benchmark-media-pipeline.py modes
+
+    # Analysis dispatch against the stand-in API: 429/529 retries, retry-after,
+    # the request-rate bucket, the in-flight cap and bisection of a batch the
+    # API refuses; exits non-zero if any check fails
+    python utilities/benchmark-media-pipeline.py dispatch
+
+The synthetic corpus (JPEG/PNG/HEIC with EXIF capture dates, short MOV/MP4
+clips) is generated once per seed and image size and reused; smaller sizes
+are nested inside larger ones, so a 100k corpus also serves 1k and 10k runs.
+
+Requirements:
+    pip install anthropic Pillow pillow-heif numpy   (ffmpeg for video clips)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+UTILITIES_DIR = Path(__file__).resolve().parent
+
+
+def load_script(module_name: str, file_name: str):
+    """Import a utilities script whose file name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location(module_name, UTILITIES_DIR / file_name)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_selector():
+    return load_script('smart_media_selector', 'smart-media-selector.py')
+
+
+def list_images(photos_dir: Path, limit: int) -> List[Path]:
+    image_exts = {'.jpg', '.jpeg', '.png', '.heic', '.heif'}
+    paths = sorted(p for p in photos_dir.rglob('*') if p.suffix.lower() in image_exts)
+    return paths[:limit] if limit else paths
+
+
+def benchmark_thumbnails(selector, paths: List[Path], max_size: int, repeat: int) -> Dict:
+    """Thumbnails/second for the full-decode path and the fast path."""
+    results = {}
+    for label, fast in (('full_decode', False), ('fast', True)):
+        best = float('inf')
+        total_bytes = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            total_bytes = 0
+            for path in paths:
+                data = selector.convert_to_jpeg_thumbnail(path, max_size=max_size, fast=fast)
+                total_bytes += len(data or b'')
+            best = min(best, time.perf_counter() - start)
+        results[label] = {
+            'seconds': round(best, 4),
+            'thumbnails_per_second': round(len(paths) / best, 2) if best > 0 else None,
+            'output_bytes': total_bytes,
+        }
+
+    full, fast = results['full_decode']['seconds'], results['fast']['seconds']
+    results['speedup'] = round(full / fast, 2) if fast > 0 else None
+    return results
+
+
+def legacy_select_best_media(media_files: List, image_count: int = 12,
+                             video_count: int = 2) -> Tuple[List, List]:
+    """select_best_media as it was before the diversity-aware engine (baseline)."""
+    images = [m for m in media_files if m.media_type == 'image']
+    videos = [m for m in media_files if m.media_type == 'video']
+    images.sort(key=lambda x: x.quality_score, reverse=True)
+    videos.sort(key=lambda x: x.quality_score, reverse=True)
+
+    selected_images = []
+    for phase in ['design', 'illumination', 'imaging', 'electronics', 'software', 'result', 'general']:
+        phase_images = [m for m in images if m.build_phase == phase and m not in selected_images]
+        if phase_images and len(selected_images) < image_count:
+            selected_images.append(phase_images[0])
+
+    remaining = [m for m in images if m not in selected_images]
+    for img in remaining:
+        if len(selected_images) >= image_count:
+            break
+        selected_images.append(img)
+
+    selected_images.sort(key=lambda x: x.date or datetime.min)
+    return selected_images, videos[:video_count]
+
+
+def synthetic_candidates(selector, count: int, seed: int = 0) -> List:
+    """Random MediaFile records spread over a year of build work."""
+    rng = random.Random(seed)
+    phases = ['design', 'illumination', 'imaging', 'electronics', 'software', 'result', 'general']
+    start = datetime(2025, 1, 1)
+    return [
+        selector.MediaFile(
+            path=Path(f'/synthetic/IMG_{i:06d}.HEIC'),
+            date=start + timedelta(seconds=rng.uniform(0, 365 * 86400)),
+            media_type='image' if rng.random() < 0.95 else 'video',
+            quality_score=round(rng.uniform(0, 10), 1),
+            build_phase=rng.choice(phases),
+            visual_hash=rng.getrandbits(64),
+        )
+        for i in range(count)
+    ]
+
+
+def spread_days(selected: List) -> float:
+    """Median gap in days between consecutive selected images (higher = more spread)."""
+    dates = sorted(m.date for m in selected if m.date)
+    gaps = sorted((b - a).total_seconds() / 86400 for a, b in zip(dates, dates[1:]))
+    return round(gaps[len(gaps) // 2], 2) if gaps else 0.0
+
+
+def benchmark_selection(selector, sizes: List[int], count: int) -> Dict:
+    """Wall time and selection quality of the legacy and diversity-aware selectors."""
+    results = {}
+    for size in sizes:
+        candidates = synthetic_candidates(selector, size)
+        row = {}
+        for label, fn in (('legacy', legacy_select_best_media),
+                          ('diverse', selector.select_best_media)):
+            start = time.perf_counter()
+            images, _ = fn(candidates, image_count=count)
+            elapsed = time.perf_counter() - start
+            row[label] = {
+                'seconds': round(elapsed, 4),
+                'mean_score': round(sum(m.quality_score for m in images) / max(1, len(images)), 2),
+                'phases': len({m.build_phase for m in images}),
+                'median_gap_days': spread_days(images),
+            }
+        results[str(size)] = row
+    return results
+
+
+# -- synthetic corpus ----------------------------------------------------------
+
+DEFAULT_CORPUS_DIR = Path.home() / '.cache' / 'rslsm' / 'benchmark-corpus'
+CORPUS_START = datetime(2025, 1, 1)
+SHARD_SIZE = 1000
+
+
+def corpus_file(level_dir: Path, index: int, seed: int, video_fraction: float,
+                has_heif: bool, has_ffmpeg: bool) -> Path:
+    """Deterministic path (and so kind) of corpus file number index."""
+    rng = random.Random(seed * 1_000_003 + index)
+    roll = rng.random()
+    if has_ffmpeg and roll < video_fraction:
+        ext = rng.choice(['.mov', '.mp4'])
+    else:
+        ext = rng.choices(['.jpg', '.png', '.heic'], weights=[70, 15, 15 if has_heif else 0])[0]
+    return level_dir / f"shard-{index // SHARD_SIZE:03d}" / f"IMG_{index:06d}{ext}"
+
+
+def write_corpus_file(job: Tuple[Path, int, int, Tuple[int, int]]) -> int:
+    """Process-pool worker: write one synthetic photo or clip; returns bytes written."""
+    path, index, seed, (width, height) = job
+    rng = random.Random(seed * 1_000_003 + index)
+    captured = CORPUS_START + timedelta(seconds=rng.uniform(0, 365 * 86400))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.stem}.tmp{path.suffix}")
+
+    if path.suffix in ('.mov', '.mp4'):
+        hue = rng.randrange(360)
+        subprocess.run([
+            'ffmpeg', '-v', 'error', '-y', '-f', 'lavfi',
+            '-i', f'testsrc=size={width}x{height}:rate=15:duration=2',
+            '-vf', f'hue=h={hue}', '-c:v', 'libx264', '-preset', 'ultrafast',
+            '-metadata', f"creation_time={captured.isoformat()}Z", str(tmp_path)
+        ], check=True, capture_output=True)
+    else:
+        import numpy as np
+        from PIL import Image
+        if path.suffix == '.heic':
+            import pillow_heif
+            pillow_heif.register_heif_opener()
+        # Smooth random field: compressible like a photo, distinct per file
+        np_rng = np.random.default_rng(seed * 1_000_003 + index)
+        coarse = (np_rng.random((6, 8, 3)) * 255).astype(np.uint8)
+        img = Image.fromarray(coarse).resize((width, height), Image.BICUBIC)
+        exif = Image.Exif()
+        exif.get_ifd(0x8769)[0x9003] = captured.strftime('%Y:%m:%d %H:%M:%S')
+        fmt = {'.jpg': 'JPEG', '.png': 'PNG', '.heic': 'HEIF'}[path.suffix]
+        img.save(tmp_path, fmt, exif=exif.tobytes())
+
+    os.replace(tmp_path, path)
+    return path.stat().st_size
+
+
+def generate_corpus(root: Path, sizes: Sequence[int], seed: int = 0,
+                    image_size: Tuple[int, int] = (640, 480), video_fraction: float = 0.01,
+                    workers: Optional[int] = None) -> Dict[int, Path]:
+    """Create (or complete) a nested corpus; returns {size: directory with exactly size files}.
+
+    root/n100000/n10000/n1000 holds files 0-999, n10000 adds 1000-9999 next to
+    it, and so on, so every size is a prefix of the next.
+    """
+    try:
+        import pillow_heif  # noqa: F401
+        has_heif = True
+    except ImportError:
+        has_heif = False
+    has_ffmpeg = shutil.which('ffmpeg') is not None
+    if not has_ffmpeg and video_fraction > 0:
+        print("⚠️  ffmpeg not found: the corpus will have no video clips")
+
+    sizes = sorted(set(sizes))
+    root = root / f"seed{seed}-{image_size[0]}x{image_size[1]}-v{video_fraction:g}"
+    dirs, level_dir = {}, root
+    for size in reversed(sizes):
+        level_dir = level_dir / f"n{size}"
+        dirs[size] = level_dir
+
+    jobs, previous = [], 0
+    for size in sizes:
+        for index in range(previous, size):
+            path = corpus_file(dirs[size], index, seed, video_fraction, has_heif, has_ffmpeg)
+            if not path.exists():
+                jobs.append((path, index, seed, image_size))
+        previous = size
+
+    if jobs:
+        print(f"\n🧪 Generating {len(jobs)} synthetic files in {root}...")
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            total = sum(pool.map(write_corpus_file, jobs, chunksize=64))
+        print(f"   {total / 1e6:.0f} MB in {time.perf_counter() - start:.1f}s")
+    return dirs
+
+
+# -- pipeline stages -----------------------------------------------------------
+
+# Optional stages; the scan that builds the file list always runs first
+PIPELINE_STAGES = ('catalog', 'thumbnail', 'analyse', 'select', 'convert')
+
+def timed(label: str, fn, items: int) -> Tuple[object, Dict]:
+    """Run fn() once; returns its result and {seconds, items, items_per_second}."""
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    stats = {'seconds': round(elapsed, 4), 'items': items,
+             'items_per_second': round(items / elapsed, 2) if elapsed > 0 else None}
+    print(f"   {label:<10} {stats['seconds']:>9.3f}s  ({stats['items_per_second']} items/s)")
+    return result, stats
+
+
+def scan_corpus(selector, catalog, directory: Path) -> List:
+    """Catalog the folder and load its MediaFile records, as the selector does."""
+    catalog.refresh(directory)
+    return selector.load_media_files(catalog, directory)
+
+
+async def prepare_only(selector, media_files: List, workers: int) -> int:
+    """Thumbnail and pack every file as the analysis stage would, without sending anything."""
+    planner = selector.BatchPlanner()
+    batches = 0
+    async for _ in selector.prepare_batches(media_files, planner, workers):
+        batches += 1
+    return batches
+
+
+def benchmark_pipeline(selector, mock, corpus_dirs: Dict[int, Path], stages: Sequence[str],
+                       workers: int, concurrency: int, latency: float,
+                       failure_rate: float, port: int, count: int) -> Dict:
+    """Time each stage of smart-media-selector.py at every corpus size."""
+    import anthropic
+
+    server = mock.serve(port, latency=latency, failure_rate=failure_rate)
+    client = anthropic.AsyncAnthropic(api_key='benchmark', base_url=f'http://127.0.0.1:{port}',
+                                      max_retries=0)
+    results = {}
+    try:
+        for size, directory in sorted(corpus_dirs.items()):
+            print(f"\n⏱️  n={size}")
+            row = {}
+            with tempfile.TemporaryDirectory() as tmp:
+                catalog = selector.MediaCatalog(Path(tmp) / 'catalog.sqlite3')
+                media_files, row['scan'] = timed(
+                    'scan', lambda: scan_corpus(selector, catalog, directory), size)
+                if 'catalog' in stages:
+                    _, row['catalog'] = timed('catalog', lambda: catalog.refresh(directory), size)
+                catalog.close()
+
+            if 'thumbnail' in stages:
+                batches, row['thumbnail'] = timed(
+                    'thumbnail', lambda: asyncio.run(prepare_only(selector, media_files, workers)),
+                    len(media_files))
+                row['thumbnail']['batches'] = batches
+
+            if 'analyse' in stages:
+                served_before = server.state.requests_served
+                _, row['analyse'] = timed('analyse', lambda: selector.analyze_media_with_claude(
+                    client, media_files, concurrency=concurrency,
+                    requests_per_minute=1e6, prep_workers=workers), len(media_files))
+                row['analyse']['requests'] = server.state.requests_served - served_before
+            else:
+                rng = random.Random(size)
+                for m in media_files:
+                    m.quality_score = round(rng.uniform(0, 10), 1)
+
+            if 'select' in stages or 'convert' in stages:
+                (images, videos), row['select'] = timed(
+                    'select', lambda: selector.select_best_media(media_files, image_count=count),
+                    len(media_files))
+
+            if 'convert' in stages:
+                with tempfile.TemporaryDirectory() as tmp:
+                    _, row['convert'] = timed('convert', lambda: selector.process_selected_media(
+                        images, videos, Path(tmp) / 'images', Path(tmp) / 'videos',
+                        workers=workers), len(images) + len(videos))
+
+            results[str(size)] = row
+    finally:
+        server.shutdown()
+    return results
+
+
+# Pillow modes photos and microscope exports arrive in, and the format each is saved as
+IMAGE_MODES = {'RGB': 'PNG', 'RGBA': 'PNG', 'L': 'PNG', 'LA': 'PNG', 'P': 'PNG', 'P+tRNS': 'PNG',
+               '1': 'PNG', 'I;16': 'PNG', 'I': 'TIFF', 'F': 'TIFF', 'CMYK': 'TIFF'}
+
+
+def benchmark_modes(selector, image_size: Tuple[int, int], max_size: int) -> Dict:
+    """Run every image mode through the reduce-on-load paths; reports time or the error."""
+    import numpy as np
+    from PIL import Image
+    import media_derivatives
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        gradient = np.linspace(0, 1, image_size[0] * image_size[1]).reshape(image_size[1], image_size[0])
+        base = Image.fromarray((gradient * 255).astype(np.uint8)).convert('RGB')
+        for mode, fmt in IMAGE_MODES.items():
+            options = {}
+            if mode == 'I;16':
+                img = Image.fromarray((gradient * 65535).astype(np.uint16))
+            elif mode == 'P+tRNS':
+                img, options = base.convert('P'), {'transparency': 0}
+            else:
+                img = base.convert(mode)
+            path = tmp / f"mode-{mode.replace(';', '').replace('+', '-')}.{fmt.lower()}"
+            img.save(path, fmt, **options)
+
+            start = time.perf_counter()
+            try:
+                for fast in (True, False):
+                    if selector.load_reduced_image(path, max_size, fast=fast) is None:
+                        raise ValueError('no image')
+                if selector.load_hash_thumbnail(path) is None:
+                    raise ValueError('no hash thumbnail')
+                media_derivatives.write_derivatives(path, tmp, path.stem, formats=['jpeg'])
+                results[mode] = {'ok': True, 'seconds': round(time.perf_counter() - start, 3)}
+            except Exception as e:
+                results[mode] = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+    return results
+
+
+def check_dispatch(selector, mock, count: int, concurrency: int, requests_per_minute: float,
+                   port: int, max_item_retries: int = 2) -> Dict:
+    """Analyze generated images against the stand-in API and check what it received.
+
+    The 'transient' run answers a share of requests with 529 and 429; every
+    file must still be analyzed, no request may arrive during a retry-after
+    pause, and the arrival rate and in-flight count must stay within the
+    limiter's bucket and the concurrency. The 'bisection' run refuses every
+    request holding one file with a 400; the batch must be split down to that
+    file rather than resent whole.
+    """
+    import anthropic
+    from PIL import Image
+
+    retry_after = 2.0  # longer than the first backoff, so only the header explains a pause
+    rate = requests_per_minute / 60.0
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for k in range(count):
+            paths.append(Path(tmp) / f"IMG_{k:04d}.jpg")
+            Image.new('RGB', (320, 240), (k * 37 % 256, k * 91 % 256, k * 53 % 256)).save(paths[-1])
+        rejected = paths[count // 2].name
+
+        def run(batch_size: int, **options):
+            server = mock.serve(port, latency=0.05, **options)
+            client = anthropic.AsyncAnthropic(api_key='dispatch-check',
+                                              base_url=f'http://127.0.0.1:{port}', max_retries=0)
+            media = [selector.MediaFile(path=p, date=None, media_type='image') for p in paths]
+            try:
+                selector.analyze_media_with_claude(
+                    client, media, batch_size=batch_size, concurrency=concurrency,
+                    requests_per_minute=requests_per_minute, prep_workers=2,
+                    max_item_retries=max_item_retries)
+            finally:
+                server.shutdown()
+                server.server_close()
+            analyzed = {m.path.name for m in media if m.description == f"Build photo {m.path.name}"}
+            return analyzed, server.state
+
+        print("\n⏱️  Transient failures (529 and 429 with retry-after)...")
+        # Seed 4 draws both a 529 and a 429 within the first few requests
+        analyzed, state = run(2, failure_rate=0.15, rate_limit_rate=0.1, retry_after=retry_after,
+                              seed=4)
+        arrivals = sorted(state.arrivals)
+        early = [t for t in arrivals if any(refused + 0.1 < t < refused + retry_after - 0.05
+                                            for refused, _ in state.refusals)]
+        busiest = max((sum(1 for u in arrivals if t <= u < t + 1) for t in arrivals), default=0)
+        allowed = concurrency + rate + 1  # a full bucket plus one second of refill
+        statuses = [status for _, status in state.refusals]
+        results['transient'] = {
+            'all analyzed': (len(analyzed) == count, f"{len(analyzed)}/{count} files"),
+            'retried': (statuses.count(429) > 0 and statuses.count(529) > 0,
+                        f"{statuses.count(529)} x 529, {statuses.count(429)} x 429"),
+            'retry-after': (not early, f"{len(early)} requests inside a {retry_after}s pause"),
+            'request rate': (busiest <= allowed, f"at most {busiest} requests in 1s "
+                                                 f"(bucket allows {allowed:.0f})"),
+            'in flight': (state.max_in_flight <= concurrency,
+                          f"at most {state.max_in_flight} at once (limit {concurrency})"),
+        }
+
+        print(f"\n⏱️  One file refused with a 400 ({rejected})...")
+        batch_size = 8
+        analyzed, state = run(batch_size, reject_files=[rejected])
+        refused = len(state.refusals)
+        # Halving down to the file, then its own retries
+        most = (batch_size - 1).bit_length() + 1 + max_item_retries
+        results['bisection'] = {
+            'others analyzed': (analyzed == {p.name for p in paths} - {rejected},
+                                f"{len(analyzed)}/{count - 1} files"),
+            'requests refused': (refused <= most, f"{refused} refused (at most {most})"),
+        }
+
+    return {run: {name: {'ok': ok, 'detail': detail} for name, (ok, detail) in checks.items()}
+            for run, checks in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the rsLSM media pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    thumbs = subparsers.add_parser('thumbnails', help='Fast vs. full-decode analysis thumbnails')
+    thumbs.add_argument('--photos-dir', required=True, help='Directory containing photos')
+    thumbs.add_argument('--limit', type=int, default=100, help='Number of images to use (0 = all)')
+    thumbs.add_argument('--max-size', type=int, default=800, help='Thumbnail long side in pixels')
+    thumbs.add_argument('--repeat', type=int, default=3, help='Runs per path; the best time is kept')
+    thumbs.add_argument('--json', help='Also write results to this JSON file')
+
+    select = subparsers.add_parser('selection', help='Diversity-aware vs. legacy select_best_media')
+    select.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Candidate pool sizes')
+    select.add_argument('--count', type=int, default=12, help='Images to select')
+    select.add_argument('--json', help='Also write results to this JSON file')
+
+    pipeline = subparsers.add_parser('pipeline', help='Time every stage on a synthetic corpus')
+    pipeline.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                          help='Corpus sizes (files)')
+    pipeline.add_argument('--stages', nargs='+', default=list(PIPELINE_STAGES),
+                          choices=PIPELINE_STAGES,
+                          help='Stages to time; the scan (a cold catalog refresh that finds the '
+                               'files) always runs, catalog times the warm refresh after it')
+    pipeline.add_argument('--corpus-dir', default=str(DEFAULT_CORPUS_DIR),
+                          help='Where the synthetic corpus is generated and kept')
+    pipeline.add_argument('--seed', type=int, default=0, help='Corpus seed')
+    pipeline.add_argument('--image-size', default='640x480', help='Synthetic photo size, WxH')
+    pipeline.add_argument('--video-fraction', type=float, default=0.01,
+                          help='Fraction of corpus files that are MOV/MP4 clips')
+    pipeline.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                          help='Process-pool size for generation, thumbnails and conversion')
+    pipeline.add_argument('--concurrency', type=int, default=8, help='Analysis requests in flight')
+    pipeline.add_argument('--latency', type=float, default=0.5,
+                          help='Seconds the stand-in API takes per request')
+    pipeline.add_argument('--failure-rate', type=float, default=0.0,
+                          help='Fraction of API requests answered with 529 Overloaded')
+    pipeline.add_argument('--port', type=int, default=8765, help='Port for the stand-in API')
+    pipeline.add_argument('--count', type=int, default=12, help='Images to select and convert')
+    pipeline.add_argument('--json', help='Also write results to this JSON file')
+
+    modes = subparsers.add_parser('modes', help='Check every image mode through reduce-on-load')
+    modes.add_argument('--image-size', default='4000x3000', help='Test image size, WxH')
+    modes.add_argument('--max-size', type=int, default=800, help='Thumbnail long side in pixels')
+    modes.add_argument('--json', help='Also write results to this JSON file')
+
+    dispatch = subparsers.add_parser('dispatch', help='Check retries, rate limits and bisection '
+                                                      'against the stand-in API')
+    dispatch.add_argument('--files', type=int, default=40, help='Images to analyze per run')
+    dispatch.add_argument('--concurrency', type=int, default=4, help='Analysis requests in flight')
+    dispatch.add_argument('--requests-per-minute', type=float, default=300,
+                          help='Client-side request rate cap to check against')
+    dispatch.add_argument('--port', type=int, default=8766, help='Port for the stand-in API')
+    dispatch.add_argument('--json', help='Also write results to this JSON file')
+
+    args = parser.parse_args()
+    selector = load_selector()
+
+    if args.command == 'thumbnails':
+        paths = list_images(Path(args.photos_dir).expanduser(), args.limit)
+        if not paths:
+            print("❌ No images found!")
+            sys.exit(1)
+
+        print(f"\n⏱️  Benchmarking {len(paths)} thumbnails at {args.max_size}px...")
+        results = benchmark_thumbnails(selector, paths, args.max_size, args.repeat)
+        for label in ('full_decode', 'fast'):
+            r = results[label]
+            print(f"   {label:<12} {r['thumbnails_per_second']:>8} thumbnails/s  ({r['seconds']:.2f}s)")
+        print(f"   Speedup: {results['speedup']}x")
+
+    elif args.command == 'selection':
+        print(f"\n⏱️  Benchmarking selection of {args.count} images...")
+        results = benchmark_selection(selector, args.sizes, args.count)
+        for size, row in results.items():
+            for label, r in row.items():
+                print(f"   n={size:<7} {label:<8} {r['seconds']:>8.3f}s  mean score {r['mean_score']:<5} "
+                      f"phases {r['phases']}  median gap {r['median_gap_days']} days")
+
+    elif args.command == 'pipeline':
+        width, height = (int(v) for v in args.image_size.lower().split('x'))
+        corpus_dirs = generate_corpus(Path(args.corpus_dir).expanduser(), args.sizes, args.seed,
+                                      (width, height), args.video_fraction, args.workers)
+        mock = load_script('mock_anthropic_server', 'mock-anthropic-server.py')
+        results = {
+            'config': {k: v for k, v in vars(args).items() if k not in ('command', 'json')},
+            'results': benchmark_pipeline(selector, mock, corpus_dirs, args.stages, args.workers,
+                                          args.concurrency, args.latency, args.failure_rate,
+                                          args.port, args.count),
+        }
+
+    elif args.command == 'modes':
+        width, height = (int(v) for v in args.image_size.lower().split('x'))
+        print(f"\n⏱️  Decoding every image mode at {width}x{height}...")
+        results = benchmark_modes(selector, (width, height), args.max_size)
+        for mode, r in results.items():
+            shown = f"{r['seconds']:.2f}s" if r['ok'] else f"FAILED  {r['error']}"
+            print(f"   {mode:<6} {shown}")
+
+    elif args.command == 'dispatch':
+        mock = load_script('mock_anthropic_server', 'mock-anthropic-server.py')
+        results = check_dispatch(selector, mock, args.files, args.concurrency,
+                                 args.requests_per_minute, args.port)
+        print()
+        for run, checks in results.items():
+            for name, r in checks.items():
+                print(f"   {'✓' if r['ok'] else '✗'} {run:<10} {name:<17} {r['detail']}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f"\n   Results written to {args.json}")
+    if args.command == 'modes' and not all(r['ok'] for r in results.values()):
+        sys.exit(1)
+    if args.command == 'dispatch' and not all(r['ok'] for checks in results.values()
+                                              for r in checks.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
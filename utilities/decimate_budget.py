@@ -0,0 +1,127 @@
+"""
+Size-budgeted decimation planning for glTF models.
+
+Instead of one ratio for every mesh, the planner picks a single surface
+error tolerance for the whole model and gives each mesh as many triangles
+as it needs to stay within it. Quadric error already rates curved regions
+above flat ones, so a flat housing gives up most of its triangles while a
+fillet keeps them. The tolerance is also scaled by object size: a part
+whose bounding box is a fraction of the model's (a screw, a hidden mount)
+covers few pixels in the viewer and may deviate further, relative to its
+size.
+
+Each mesh is decimated once to a floor while recording its error curve
+(triangles remaining against RMS error, mesh_decimate.error_curve). The
+tolerance is then bisected against the predicted GLB size of all curves
+together, which costs no further decimation, and the final pass decimates
+each primitive to the triangle count its curve gives at that tolerance.
+"""
+
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import gltf_io
+
+SIZE_EXPONENT = 0.5      # tolerance grows as (model size / object size) ** this
+FLOOR_FACES = 8          # error curves stop here; no mesh is planned below it
+BISECTION_STEPS = 60
+POSITION_BYTES = 12      # float32 VEC3 written for POSITION and NORMAL
+NORMAL_BYTES = 12
+
+# {mesh: [(errors, triangle counts, vertex_layout()) per decimated primitive]}
+Curves = Dict[int, List[Tuple[np.ndarray, np.ndarray, Tuple[float, float]]]]
+
+
+def accessor_bytes(document: Dict, index: int) -> int:
+    accessor = document['accessors'][index]
+    itemsize = np.dtype(gltf_io.COMPONENT_DTYPES[accessor['componentType']]).itemsize
+    return accessor['count'] * gltf_io.TYPE_SIZES[accessor['type']] * itemsize
+
+
+def vertex_layout(document: Dict, primitive: Dict) -> Tuple[float, float]:
+    """(vertices per triangle, bytes per vertex) the decimated primitive is expected to have.
+
+    The exported vertex-to-triangle ratio stands in for how many vertices
+    seams and creases will split after decimation.
+    """
+    attributes = primitive['attributes']
+    vertices = document['accessors'][attributes['POSITION']]['count']
+    faces = (document['accessors'][primitive['indices']]['count'] if 'indices' in primitive
+             else vertices) // 3
+    stride = 0.0
+    for name, index in attributes.items():
+        if name == 'POSITION':
+            stride += POSITION_BYTES
+        elif name == 'NORMAL':
+            stride += NORMAL_BYTES
+        else:
+            stride += accessor_bytes(document, index) / max(1, vertices)
+    return min(3.0, max(0.5, vertices / max(1, faces))), stride
+
+
+def primitive_bytes(faces: int, layout: Tuple[float, float]) -> float:
+    """Predicted output bytes of a primitive decimated to faces triangles."""
+    vertices_per_face, stride = layout
+    vertices = faces * vertices_per_face
+    return faces * 3 * (2 if vertices < 65535 else 4) + vertices * stride
+
+
+def mesh_extent(document: Dict, mesh: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Bounding box of a mesh from the POSITION min/max glTF requires."""
+    lows, highs = [], []
+    for primitive in mesh['primitives']:
+        accessor = document['accessors'][primitive['attributes']['POSITION']]
+        if 'min' in accessor and 'max' in accessor:
+            lows.append(accessor['min'])
+            highs.append(accessor['max'])
+    if not lows:
+        return np.zeros(3), np.zeros(3)
+    return np.min(lows, axis=0), np.max(highs, axis=0)
+
+
+def tolerance_scales(document: Dict, meshes: List[int]) -> Dict[int, float]:
+    """Per-mesh multiplier of the global tolerance, from bounding-box size."""
+    extents = {i: mesh_extent(document, document['meshes'][i]) for i in meshes}
+    if not extents:
+        return {}
+    low = np.min([lo for lo, _ in extents.values()], axis=0)
+    high = np.max([hi for _, hi in extents.values()], axis=0)
+    model = max(float(np.linalg.norm(high - low)), 1e-12)
+    return {i: (model / max(float(np.linalg.norm(hi - lo)), model * 1e-6)) ** SIZE_EXPONENT
+            for i, (lo, hi) in extents.items()}
+
+
+def faces_at(errors: np.ndarray, counts: np.ndarray, tolerance: float) -> int:
+    """Fewest triangles the curve reaches without exceeding tolerance."""
+    return int(counts[max(0, np.searchsorted(errors, tolerance, side='right') - 1)])
+
+
+def predict_bytes(curves: Curves, scales: Dict[int, float], tolerance: float) -> float:
+    return sum(primitive_bytes(faces_at(errors, counts, tolerance * scales[i]), layout)
+               for i, primitives in curves.items() for errors, counts, layout in primitives)
+
+
+def plan(curves: Curves, scales: Dict[int, float], budget: float) -> Tuple[float, Dict[int, List[int]]]:
+    """(tolerance, {mesh: triangle target per primitive}) fitting the decimated meshes in budget bytes.
+
+    Bisects the tolerance in log space; if even the floors do not fit, the
+    largest tolerance on any curve is used.
+    """
+    top = max((errors[-1] / scales[i] for i, primitives in curves.items()
+               for errors, _, _ in primitives), default=0.0)
+    if top <= 0 or predict_bytes(curves, scales, top) > budget:
+        tolerance = top
+    else:
+        low, high = math.log(top * 1e-9), math.log(top)
+        for _ in range(BISECTION_STEPS):
+            middle = (low + high) / 2
+            if predict_bytes(curves, scales, math.exp(middle)) > budget:
+                low = middle
+            else:
+                high = middle
+        tolerance = math.exp(high)
+    targets = {i: [faces_at(errors, counts, tolerance * scales[i]) for errors, counts, _ in primitives]
+               for i, primitives in curves.items()}
+    return tolerance, targets
@@ -0,0 +1,165 @@
+"""
+Memory-aware scheduling for image decodes.
+
+A 100 MP panorama decodes to ~300 MB of RGB before any copy is made, so a
+process pool that starts several at once can run the machine out of memory
+while ordinary photos use a few tens of MB each. The schedulers here
+estimate each file's decode footprint from its header (dimensions, mode,
+and the JPEG DCT scale a reduced decode will use) and only start work while
+the estimates of everything in flight fit a RAM budget. A file larger than
+the whole budget still runs, but alone.
+
+load_reduced() is the matching reduce-on-load path: JPEGs are decoded at
+1/2, 1/4 or 1/8 scale and other formats are box-reduced by an integer
+factor straight after decoding, so the conversions and resizes that follow
+work on a small image instead of full-resolution copies.
+"""
+
+import os
+import math
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from pathlib import Path
+from collections import deque
+from typing import Callable, Deque, Iterator, Optional, Sequence, Tuple
+
+from PIL import Image
+
+BYTES_PER_PIXEL = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'I;16': 2, 'RGB': 3, 'YCbCr': 3,
+                   'RGBA': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+# Decoders that hold their own copy of the pixels next to Pillow's
+DECODER_COPIES = {'HEIF': 2}
+# Resized/converted copies alive after the reduce step, relative to the target size
+WORKING_COPIES = 3
+VIDEO_DECODE_BYTES = 256 << 20      # ffmpeg frame buffers for a 4K clip
+UNKNOWN_DECODE_BYTES = 128 << 20    # header unreadable: assume a large photo
+
+# Modes Image.reduce() rejects (or, for palettes, would average the indices
+# of), and what to box-reduce them as instead
+REDUCE_MODES = {'1': 'L', 'P': 'RGB', 'PA': 'RGBA',
+                'I;16': 'I', 'I;16L': 'I', 'I;16B': 'I', 'I;16N': 'I'}
+
+ORIENTATION_TAG = 0x0112
+# EXIF orientation → transpose that makes the image upright (same table as ImageOps.exif_transpose)
+TRANSPOSE_FOR_ORIENTATION = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def default_budget_bytes(fraction: float = 0.5) -> int:
+    """A share of physical RAM (4 GB if it cannot be determined)."""
+    try:
+        return int(os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') * fraction)
+    except (ValueError, OSError, AttributeError):
+        return 4 << 30
+
+
+def draft_scale(fmt: Optional[str], size: Tuple[int, int], target: Tuple[int, int]) -> int:
+    """Denominator Pillow's JPEG draft mode picks for target (1 for other formats)."""
+    if fmt != 'JPEG':
+        return 1
+    scale = min(size[0] // max(1, target[0]), size[1] // max(1, target[1]))
+    for denominator in (8, 4, 2):
+        if scale >= denominator:
+            return denominator
+    return 1
+
+
+def estimate_decode_bytes(path: Path, max_size: Optional[int] = None) -> int:
+    """Peak memory to decode path and reduce it to max_size, from the header alone."""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            mode, fmt = img.mode, img.format
+    except Exception:
+        return UNKNOWN_DECODE_BYTES
+
+    bands = max(3, BYTES_PER_PIXEL.get(mode, 4))
+    target_pixels = width * height
+    scale = 1
+    if max_size:
+        ratio = min(max_size / max(width, height), 1.0)
+        target = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+        scale = draft_scale(fmt, (width, height), target)
+        target_pixels = target[0] * target[1]
+    decoded = math.ceil(width / scale) * math.ceil(height / scale) * bands
+    return decoded * DECODER_COPIES.get(fmt, 1) + target_pixels * bands * WORKING_COPIES
+
+
+def load_reduced(img: 'Image.Image', target: Tuple[int, int]) -> 'Image.Image':
+    """Decode img no larger than needed to still cover target (width, height).
+
+    JPEG uses a DCT-scaled draft decode; everything else is box-reduced by an
+    integer factor right after decoding, before any conversion copies it.
+    """
+    img.draft('RGB', target)
+    img.load()
+    factor = min(img.width // max(1, target[0]), img.height // max(1, target[1]))
+    if factor >= 2:
+        mode = REDUCE_MODES.get(img.mode)
+        if img.mode == 'P' and 'transparency' in img.info:
+            mode = 'RGBA'
+        if mode:
+            img = img.convert(mode)
+        img = img.reduce(factor)
+    return img
+
+
+def upright(img: 'Image.Image', orientation: int) -> 'Image.Image':
+    """Rotate/flip by an EXIF orientation read before load_reduced (reduce drops EXIF)."""
+    method = TRANSPOSE_FOR_ORIENTATION.get(orientation)
+    return img.transpose(method) if method is not None else img
+
+
+class MemoryBudget:
+    """Bytes reserved by work in flight, against a fixed limit (single-threaded use)."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.used = 0
+
+    def clamp(self, cost: int) -> int:
+        """A file bigger than the whole budget reserves all of it and so runs alone."""
+        return min(max(0, int(cost)), self.limit)
+
+    def try_reserve(self, cost: int) -> bool:
+        cost = self.clamp(cost)
+        if self.used and self.used + cost > self.limit:
+            return False
+        self.used += cost
+        return True
+
+    def release(self, cost: int) -> None:
+        self.used = max(0, self.used - self.clamp(cost))
+
+
+def budgeted_map(submit: Callable[[object], Future], jobs: Sequence, costs: Sequence[int],
+                 budget: MemoryBudget, max_in_flight: int) -> Iterator:
+    """Like pool.map, in job order, but only starting jobs whose cost fits the budget.
+
+    submit(job) must return a Future (e.g. partial(pool.submit, fn)). Jobs
+    start in order; when the next one does not fit, this waits for running
+    ones to finish and free their share.
+    """
+    pending: Deque[Future] = deque()   # submitted, not yet yielded, in job order
+    running = {}                        # future -> cost still reserved
+    next_job = 0
+    while next_job < len(jobs) or pending:
+        while (next_job < len(jobs) and len(running) < max_in_flight
+               and budget.try_reserve(costs[next_job])):
+            future = submit(jobs[next_job])
+            running[future] = costs[next_job]
+            pending.append(future)
+            next_job += 1
+
+        if running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                budget.release(running.pop(future))
+        while pending and pending[0] not in running:
+            yield pending.popleft().result()
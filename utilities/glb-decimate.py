@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Headless GLB Decimation for the rsLSM CAD Model
+
+Standalone replacement for blender-decimate.py: reads a glTF/GLB, reduces
+every mesh with quadric-error-metric edge collapse (mesh_decimate.py, pure
+NumPy) and writes a GLB, without Blender. Meshes are decimated in parallel
+across a process pool. Same knobs and semantics as the Blender script:
+meshes keep DECIMATE_RATIO of their triangles, meshes with fewer than
+MIN_FACES triangles are copied through untouched and unused materials are
+dropped. Unlike the Blender script, only exactly coincident vertices are
+merged before decimating by default: a fixed distance like its 0.001 would
+fuse the details of small parts in a model exported in metres.
+--merge-distance merges by distance as Blender's remove_doubles does.
+
+Repeated parts (the same screw or mount exported as many meshes, each with
+its placement baked in) are found first, decimated once and stored once;
+the copies become EXT_mesh_gpu_instancing instances, drawn in a single call
+by three.js, or nodes sharing the mesh with --instancing nodes.
+
+The input is memory-mapped and every worker reads only its own mesh from
+it, while the output is streamed to disk mesh by mesh, so peak memory
+follows the largest mesh (times the worker count) rather than the file:
+multi-GB exports larger than RAM work.
+
+Nodes, materials, textures, animations and skins are carried over as they
+are. Primitives that are not triangle lists or that have morph targets are
+copied unchanged. Draco- or meshopt-compressed inputs must be decompressed
+first (e.g. gltf-transform copy).
+
+Usage:
+    python utilities/glb-decimate.py model.glb -o website/public/models/rslsm.glb
+
+    --ratio 0.05 keeps 5% of the triangles; --workers sets the pool size.
+
+    --target-mb 10 replaces the single ratio with a per-object plan: one
+    surface-error tolerance, looser for small objects, searched so the GLB
+    comes out under 10 MB (see decimate_budget.py).
+
+Requirements:
+    pip install numpy
+"""
+
+import os
+import sys
+import copy
+import json
+import argparse
+from pathlib import Path
+from itertools import repeat
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Try to import optional dependencies
+try:
+    import numpy as np
+    import gltf_io
+    import mesh_decimate
+    import mesh_instancing
+    import decimate_budget
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Configuration - adjust these values if needed
+DECIMATE_RATIO = 0.02  # 2% of original geometry (aggressive but usually looks fine for web)
+MIN_FACES = 100        # Don't decimate objects with fewer faces than this
+MERGE_DISTANCE = 0.0   # Merge vertices this close before decimating (0 = exact duplicates)
+
+RESULTS_PER_WORKER = 2  # decimated meshes queued ahead of the writer, per worker
+BUDGET_ATTEMPTS = 3     # --target-mb replans when the written GLB overshoots
+
+UNSUPPORTED_EXTENSIONS = ('KHR_draco_mesh_compression', 'EXT_meshopt_compression')
+
+
+def can_decimate(primitive: Dict) -> bool:
+    return (primitive.get('mode', gltf_io.MODE_TRIANGLES) == gltf_io.MODE_TRIANGLES
+            and 'targets' not in primitive)
+
+
+def face_count(source: 'gltf_io.GltfFile', mesh: Dict) -> int:
+    """Triangles in a mesh, from accessor counts alone."""
+    total = 0
+    for primitive in mesh['primitives']:
+        if primitive.get('mode', gltf_io.MODE_TRIANGLES) != gltf_io.MODE_TRIANGLES:
+            continue
+        key = primitive.get('indices', primitive['attributes']['POSITION'])
+        total += source.json['accessors'][key]['count'] // 3
+    return total
+
+
+def load_primitives(source: 'gltf_io.GltfFile', mesh: Dict) -> List[Tuple[Dict, 'np.ndarray']]:
+    """(attribute arrays, indices) of a mesh's decimatable primitives."""
+    primitives = []
+    for primitive in mesh['primitives']:
+        if not can_decimate(primitive):
+            continue
+        attributes = {name: source.accessor(index) for name, index in primitive['attributes'].items()}
+        indices = source.accessor(primitive['indices']) if 'indices' in primitive else None
+        primitives.append((attributes, indices))
+    return primitives
+
+
+_sources: Dict[str, 'gltf_io.GltfFile'] = {}
+
+
+def _open_source(path: str) -> 'gltf_io.GltfFile':
+    if path not in _sources:
+        _sources[path] = gltf_io.GltfFile.load(path)
+    return _sources[path]
+
+
+def decimate_from_file(path: str, mesh_index: int, ratio: float, merge_distance: float,
+                       targets: Optional[List[int]] = None) -> List:
+    """Worker: decimate one mesh, reading it from the (memory-mapped) source file."""
+    source = _open_source(path)
+    return mesh_decimate.decimate_mesh(load_primitives(source, source.json['meshes'][mesh_index]),
+                                       ratio, merge_distance, targets)
+
+
+def error_curves_from_file(path: str, mesh_index: int, merge_distance: float) -> List:
+    """Worker: error curve of each decimatable primitive of one mesh."""
+    source = _open_source(path)
+    return [mesh_decimate.primitive_error_curve(attributes, indices, merge_distance,
+                                                decimate_budget.FLOOR_FACES)
+            for attributes, indices in load_primitives(source, source.json['meshes'][mesh_index])]
+
+
+def write_primitive(writer: 'gltf_io.GlbWriter', source: 'gltf_io.GltfFile', primitive: Dict,
+                    attributes: Dict, indices: 'np.ndarray') -> Dict:
+    """A primitive's JSON pointing at newly written decimated accessors."""
+    new = dict(primitive)
+    new['attributes'] = {}
+    for name, values in attributes.items():
+        original = source.json['accessors'][primitive['attributes'][name]]
+        new['attributes'][name] = writer.add_accessor(
+            values, gltf_io.TARGET_ARRAY_BUFFER, normalized=original.get('normalized', False),
+            with_bounds=(name == 'POSITION'), accessor_type=original['type'])
+    new['indices'] = writer.add_accessor(indices, gltf_io.TARGET_ELEMENT_ARRAY_BUFFER)
+    return new
+
+
+def copy_primitive(writer: 'gltf_io.GlbWriter', source: 'gltf_io.GltfFile', primitive: Dict,
+                   copied: Dict[int, int]) -> Dict:
+    new = dict(primitive)
+    new['attributes'] = {name: copy_accessor(writer, source, index, copied)
+                         for name, index in primitive['attributes'].items()}
+    if 'indices' in primitive:
+        new['indices'] = copy_accessor(writer, source, primitive['indices'], copied)
+    if 'targets' in primitive:
+        new['targets'] = [{name: copy_accessor(writer, source, index, copied)
+                           for name, index in target.items()} for target in primitive['targets']]
+    return new
+
+
+def copy_accessor(writer: 'gltf_io.GlbWriter', source: 'gltf_io.GltfFile', index: int,
+                  copied: Dict[int, int]) -> int:
+    """Copy an accessor once, however many places refer to it."""
+    if index not in copied:
+        copied[index] = writer.copy_accessor(source, index)
+    return copied[index]
+
+
+def remove_unused_materials(document: Dict) -> int:
+    """Drop materials no primitive uses (like the Blender script's material cleanup)."""
+    materials = document.get('materials', [])
+    used = sorted({p['material'] for mesh in document.get('meshes', [])
+                   for p in mesh['primitives'] if 'material' in p})
+    if len(used) == len(materials):
+        return 0
+    new_index = {old: new for new, old in enumerate(used)}
+    document['materials'] = [materials[i] for i in used]
+    for mesh in document.get('meshes', []):
+        for primitive in mesh['primitives']:
+            if 'material' in primitive:
+                primitive['material'] = new_index[primitive['material']]
+    return len(materials) - len(used)
+
+
+def fixed_bytes(source: 'gltf_io.GltfFile', copied_meshes: List[int], decimated: List[int]) -> int:
+    """Predicted output size of everything a budget plan does not decimate."""
+    document = source.json
+    total = len(json.dumps(document, separators=(',', ':')))
+    for i in set(copied_meshes) | set(decimated):
+        for primitive in document['meshes'][i]['primitives']:
+            if i in decimated and can_decimate(primitive):
+                continue
+            accessors = list(primitive['attributes'].values())
+            accessors += [primitive['indices']] if 'indices' in primitive else []
+            accessors += [a for target in primitive.get('targets', []) for a in target.values()]
+            total += sum(decimate_budget.accessor_bytes(document, a) for a in accessors)
+    for image in document.get('images', []):
+        if 'bufferView' in image:
+            total += document['bufferViews'][image['bufferView']]['byteLength']
+    return total
+
+
+def write_decimated(source: 'gltf_io.GltfFile', pool: ProcessPoolExecutor, workers: int,
+                    input_path: Path, output_path: Path, counts: List[int], selected: List[int],
+                    repeats: Dict, ratio: float, merge_distance: float, instancing: str,
+                    targets: Optional[Dict[int, List[int]]] = None) -> Dict:
+    """Decimate the selected meshes, copy the rest and write the GLB; returns the statistics."""
+    meshes = source.json.get('meshes', [])
+    total_objects = len(meshes)
+    stats = {'processed': 0, 'skipped': 0, 'instanced': 0,
+             'faces_before': sum(counts), 'faces_after': 0}
+    output_faces: Dict[int, int] = {}  # triangles written per mesh
+
+    document = copy.deepcopy(source.json)
+    writer = gltf_io.GlbWriter(document, spool_dir=output_path.parent)
+    copied: Dict[int, int] = {}
+
+    # Workers map the file and read their own mesh; only a few decimated
+    # results wait here at a time, and each is written out as it arrives
+    upcoming = iter(selected)
+    pending: Deque[Future] = deque()
+    chosen = set(selected)
+
+    for i, mesh in enumerate(meshes):
+        while len(pending) < workers * RESULTS_PER_WORKER:
+            job = next(upcoming, None)
+            if job is None:
+                break
+            pending.append(pool.submit(decimate_from_file, str(input_path), job, ratio,
+                                       merge_distance, targets[job] if targets else None))
+
+        name = mesh.get('name', f"mesh {i}")
+        if i in repeats:
+            part = meshes[repeats[i][0]].get('name', f"mesh {repeats[i][0]}")
+            print(f"[{i+1}/{total_objects}] INSTANCE: {name} ({counts[i]} faces - copy of {part})")
+            stats['instanced'] += 1
+            continue
+        if i not in chosen:
+            print(f"[{i+1}/{total_objects}] SKIP: {name} ({counts[i]} faces - too few)")
+            document['meshes'][i]['primitives'] = [copy_primitive(writer, source, p, copied)
+                                                   for p in mesh['primitives']]
+            stats['skipped'] += 1
+            output_faces[i] = counts[i]
+            continue
+
+        print(f"[{i+1}/{total_objects}] Processing: {name} ({counts[i]} faces)")
+        try:
+            results = iter(pending.popleft().result())
+        except Exception as e:
+            print(f"         → Error decimating mesh: {e}")
+            document['meshes'][i]['primitives'] = [copy_primitive(writer, source, p, copied)
+                                                   for p in mesh['primitives']]
+            output_faces[i] = counts[i]
+            continue
+
+        primitives, new_face_count = [], 0
+        for primitive in mesh['primitives']:
+            if can_decimate(primitive):
+                attributes, indices = next(results)
+                primitives.append(write_primitive(writer, source, primitive, attributes, indices))
+                new_face_count += len(indices) // 3
+            else:
+                primitives.append(copy_primitive(writer, source, primitive, copied))
+                if primitive.get('mode', gltf_io.MODE_TRIANGLES) == gltf_io.MODE_TRIANGLES:
+                    new_face_count += face_count(source, {'primitives': [primitive]})
+        document['meshes'][i]['primitives'] = primitives
+        stats['processed'] += 1
+        output_faces[i] = new_face_count
+        print(f"         → Reduced to {new_face_count} faces ({new_face_count/counts[i]*100:.1f}%)")
+
+    # Stored triangles count once; every instance still draws its part's
+    stats['faces_stored'] = sum(output_faces.values())
+    stats['faces_after'] = stats['faces_stored'] + sum(output_faces[repeats[i][0]] for i in repeats)
+
+    if repeats:
+        placed = mesh_instancing.instance_repeats(document, repeats, writer, gpu=(instancing == 'gpu'))
+        mesh_instancing.remove_unused_meshes(document)
+        print(f"\nInstancing {len(repeats)} repeated meshes...")
+        print(f"GPU instances: {placed['instanced']}, shared-mesh nodes: {placed['shared']}")
+
+    # Everything else that lives in the binary buffer
+    for skin in document.get('skins', []):
+        if 'inverseBindMatrices' in skin:
+            skin['inverseBindMatrices'] = copy_accessor(writer, source, skin['inverseBindMatrices'], copied)
+    for animation in document.get('animations', []):
+        for sampler in animation['samplers']:
+            sampler['input'] = copy_accessor(writer, source, sampler['input'], copied)
+            sampler['output'] = copy_accessor(writer, source, sampler['output'], copied)
+    for image in document.get('images', []):
+        if 'bufferView' in image:
+            image['bufferView'] = writer.copy_buffer_view(source, image['bufferView'])
+
+    print(f"\nSimplifying materials...")
+    print(f"Found {len(document.get('materials', []))} materials")
+    print(f"Removed {remove_unused_materials(document)} unused materials")
+
+    stats['output_bytes'] = writer.write(output_path)
+    return stats
+
+
+def decimate_glb(input_path: Path, output_path: Path, ratio: float = DECIMATE_RATIO,
+                 min_faces: int = MIN_FACES, merge_distance: float = MERGE_DISTANCE,
+                 workers: int = None, instancing: str = 'gpu',
+                 target_bytes: Optional[int] = None) -> Dict:
+    """Decimate every mesh of input_path into output_path; returns the statistics.
+
+    instancing is 'gpu' (EXT_mesh_gpu_instancing), 'nodes' (copies become
+    nodes sharing one mesh) or 'off'. With target_bytes, ratio is replaced
+    by a per-mesh plan (decimate_budget) sized so the GLB fits.
+    """
+    source = gltf_io.GltfFile.load(input_path)
+    required = set(source.json.get('extensionsRequired', [])) & set(UNSUPPORTED_EXTENSIONS)
+    if required:
+        raise ValueError(f"{input_path} uses {', '.join(sorted(required))}; "
+                         f"decompress it first (e.g. gltf-transform copy)")
+
+    meshes = source.json.get('meshes', [])
+    total_objects = len(meshes)
+    counts = [face_count(source, mesh) for mesh in meshes]
+    repeats: mesh_instancing.Repeats = {}
+    if instancing != 'off':
+        # Skinned meshes deform per node, so their copies stay separate
+        skinned = {node['mesh'] for node in source.json.get('nodes', []) if 'skin' in node}
+        repeats = mesh_instancing.find_repeats(
+            source, [i for i in range(total_objects) if i not in skinned])
+    selected = [i for i, n in enumerate(counts) if n >= min_faces and i not in repeats]
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        targets, tolerance = None, None
+        if target_bytes:
+            print(f"\nMeasuring decimation error of {len(selected)} meshes...")
+            curves: decimate_budget.Curves = {}
+            for i, primitive_curves in zip(selected, pool.map(
+                    error_curves_from_file, repeat(str(input_path)), selected, repeat(merge_distance))):
+                decimated = [p for p in meshes[i]['primitives'] if can_decimate(p)]
+                curves[i] = [(errors, faces, decimate_budget.vertex_layout(source.json, p))
+                             for (errors, faces), p in zip(primitive_curves, decimated)]
+            scales = decimate_budget.tolerance_scales(source.json, selected)
+            copied_meshes = [i for i in range(total_objects) if i not in repeats and i not in selected]
+            fixed = fixed_bytes(source, copied_meshes, selected)
+            budget = target_bytes - fixed
+
+        for attempt in range(1, (BUDGET_ATTEMPTS if target_bytes else 1) + 1):
+            if target_bytes:
+                tolerance, targets = decimate_budget.plan(curves, scales, max(budget, 0))
+
+            print(f"\n{'='*60}")
+            print(f"DECIMATING {total_objects} MESH OBJECTS")
+            if target_bytes:
+                print(f"Target size: {target_bytes/1e6:.1f} MB (surface error ≤ {tolerance:.3g}, "
+                      f"scaled by object size)")
+            else:
+                print(f"Target ratio: {ratio} ({ratio*100:.1f}% of original)")
+            print(f"{'='*60}\n")
+
+            stats = write_decimated(source, pool, workers, input_path, output_path, counts,
+                                    selected, repeats, ratio, merge_distance, instancing, targets)
+            if not target_bytes or stats['output_bytes'] <= target_bytes:
+                break
+            if attempt < BUDGET_ATTEMPTS:
+                print(f"\nOutput is {stats['output_bytes']/1e6:.2f} MB, over the "
+                      f"{target_bytes/1e6:.2f} MB budget - replanning...")
+                # Scale by how far the prediction was off for the decimated geometry
+                predicted = decimate_budget.predict_bytes(curves, scales, tolerance)
+                actual = max(1, stats['output_bytes'] - fixed)
+                budget = (target_bytes - fixed) * predicted / actual * 0.98
+    stats['input_bytes'] = os.path.getsize(input_path)
+
+    print(f"\n{'='*60}")
+    print(f"DECIMATION COMPLETE")
+    print(f"{'='*60}")
+    print(f"Objects processed: {stats['processed']}")
+    print(f"Objects skipped:   {stats['skipped']}")
+    print(f"Objects instanced: {stats['instanced']}")
+    print(f"Total faces before: {stats['faces_before']:,}")
+    print(f"Total faces after:  {stats['faces_after']:,}")
+    if stats['instanced']:
+        print(f"Faces stored once:  {stats['faces_stored']:,} (instances share their part's)")
+    if stats['faces_before']:
+        print(f"Reduction: {(1 - stats['faces_after']/stats['faces_before'])*100:.1f}%")
+    print(f"\nFile size: {stats['input_bytes']/1e6:.1f} MB → {stats['output_bytes']/1e6:.1f} MB")
+    if target_bytes and stats['output_bytes'] > target_bytes:
+        print(f"Warning: still over the {target_bytes/1e6:.1f} MB target "
+              f"(copied meshes, textures and floors do not fit)")
+    print(f"Saved as: {output_path}")
+    print(f"{'='*60}\n")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decimate a glTF/GLB model without Blender')
+    parser.add_argument('input', help='Input .glb or .gltf file')
+    parser.add_argument('-o', '--output', default='rslsm.glb', help='Output .glb file')
+    parser.add_argument('--ratio', type=float, default=DECIMATE_RATIO,
+                        help=f'Fraction of triangles to keep per mesh (default: {DECIMATE_RATIO})')
+    parser.add_argument('--min-faces', type=int, default=MIN_FACES,
+                        help=f'Leave meshes with fewer triangles untouched (default: {MIN_FACES})')
+    parser.add_argument('--merge-distance', type=float, default=MERGE_DISTANCE,
+                        help=f'Merge vertices closer than this first; 0 merges exact duplicates only '
+                             f'(default: {MERGE_DISTANCE})')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Meshes decimated in parallel (default: CPU count)')
+    parser.add_argument('--target-mb', type=float,
+                        help='Plan per-object triangle counts so the GLB fits this size, '
+                             'instead of one --ratio for every mesh')
+    parser.add_argument('--instancing', choices=['gpu', 'nodes', 'off'], default='gpu',
+                        help='Store repeated parts once, placed with EXT_mesh_gpu_instancing (gpu) '
+                             'or nodes sharing a mesh (nodes) (default: gpu)')
+    args = parser.parse_args()
+
+    if not HAS_NUMPY:
+        print("Error: numpy not installed. Run: pip install numpy")
+        sys.exit(1)
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"Error: {input_path} not found")
+        sys.exit(1)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        decimate_glb(input_path, output_path, args.ratio, args.min_faces,
+                     args.merge_distance, args.workers, args.instancing,
+                     int(args.target_mb * 1e6) if args.target_mb else None)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Minimal glTF 2.0 / GLB reading and writing with NumPy, for files larger than RAM.
+
+GltfFile memory-maps a .glb's binary chunk (or a .gltf's external .bin
+buffers) and returns accessors as zero-copy NumPy views into the mapping,
+honouring byteStride and componentType; only sparse accessors are
+materialised. Pages are read from disk as an accessor is touched, and other
+processes opening the same file share them through the page cache.
+
+GlbWriter builds a new GLB: the JSON of the source document is carried over
+and geometry is re-added accessor by accessor, so nodes, materials and scene
+structure survive untouched. Buffer data is streamed to a spool file as it
+is added rather than held in memory, so writing a model costs roughly one
+accessor of RAM at a time.
+"""
+
+import os
+import json
+import mmap
+import base64
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+GLB_MAGIC = 0x46546C67          # b'glTF'
+CHUNK_JSON = 0x4E4F534A         # b'JSON'
+CHUNK_BIN = 0x004E4942          # b'BIN\0'
+
+COMPONENT_DTYPES = {
+    5120: np.int8,
+    5121: np.uint8,
+    5122: np.int16,
+    5123: np.uint16,
+    5125: np.uint32,
+    5126: np.float32,
+}
+COMPONENT_TYPES = {np.dtype(v): k for k, v in COMPONENT_DTYPES.items()}
+TYPE_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
+TYPE_NAMES = {1: 'SCALAR', 2: 'VEC2', 3: 'VEC3', 4: 'VEC4', 16: 'MAT4'}
+
+TARGET_ARRAY_BUFFER = 34962
+TARGET_ELEMENT_ARRAY_BUFFER = 34963
+MODE_TRIANGLES = 4
+COPY_BLOCK_SIZE = 16 << 20
+
+
+def _map_file(path: Path, offset: int = 0, length: Optional[int] = None) -> memoryview:
+    """Read-only memory map of (part of) a file."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return memoryview(b'')
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    end = size if length is None else offset + length
+    return memoryview(mapped)[offset:end]
+
+
+class GltfFile:
+    """A loaded glTF document: its JSON plus (memory-mapped) bytes of every buffer."""
+
+    def __init__(self, document: Dict, buffers: List[memoryview]):
+        self.json = document
+        self.buffers = buffers
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'GltfFile':
+        path = Path(path)
+        with open(path, 'rb') as f:
+            header = f.read(12)
+            if len(header) == 12 and struct.unpack_from('<I', header)[0] == GLB_MAGIC:
+                document, binary = _split_glb(f, header, path)
+            else:
+                document, binary = json.loads(header + f.read()), None
+
+        buffers = []
+        for i, buffer in enumerate(document.get('buffers', [])):
+            uri = buffer.get('uri')
+            if uri is None:
+                if binary is None or i != 0:
+                    raise ValueError(f"buffer {i} has no uri and there is no GLB binary chunk")
+                buffers.append(binary)
+            elif uri.startswith('data:'):
+                buffers.append(memoryview(base64.b64decode(uri.split(',', 1)[1])))
+            else:
+                buffers.append(_map_file(path.parent / uri))
+        return cls(document, buffers)
+
+    def buffer_view(self, index: int) -> memoryview:
+        view = self.json['bufferViews'][index]
+        start = view.get('byteOffset', 0)
+        return self.buffers[view['buffer']][start:start + view['byteLength']]
+
+    def _view(self, buffer_view: int, byte_offset: int, dtype: np.dtype,
+              count: int, components: int) -> np.ndarray:
+        """Zero-copy (count, components) array over a bufferView, following its byteStride."""
+        view = self.json['bufferViews'][buffer_view]
+        stride = view.get('byteStride') or dtype.itemsize * components
+        return np.ndarray((count, components), dtype=dtype, buffer=self.buffers[view['buffer']],
+                          offset=view.get('byteOffset', 0) + byte_offset,
+                          strides=(stride, dtype.itemsize))
+
+    def accessor(self, index: int) -> np.ndarray:
+        """Accessor data as an array of shape (count,) or (count, components).
+
+        A read-only view into the file unless the accessor is sparse (or has
+        no bufferView), in which case a dense copy is built.
+        """
+        accessor = self.json['accessors'][index]
+        dtype = np.dtype(COMPONENT_DTYPES[accessor['componentType']])
+        components = TYPE_SIZES[accessor['type']]
+        count = accessor['count']
+
+        if 'bufferView' in accessor:
+            array = self._view(accessor['bufferView'], accessor.get('byteOffset', 0),
+                               dtype, count, components)
+        else:
+            array = np.zeros((count, components), dtype=dtype)
+
+        sparse = accessor.get('sparse')
+        if sparse:
+            indices, values = sparse['indices'], sparse['values']
+            rows = self._view(indices['bufferView'], indices.get('byteOffset', 0),
+                              np.dtype(COMPONENT_DTYPES[indices['componentType']]),
+                              sparse['count'], 1)[:, 0]
+            array = array.copy()
+            array[rows] = self._view(values['bufferView'], values.get('byteOffset', 0),
+                                     dtype, sparse['count'], components)
+
+        return array[:, 0] if components == 1 else array
+
+
+def _split_glb(f, header: bytes, path: Path):
+    """(JSON document, memory-mapped binary chunk or None) of an open GLB file."""
+    _, version, length = struct.unpack('<III', header)
+    if version != 2:
+        raise ValueError(f"unsupported GLB version {version}")
+    document, binary = None, None
+    offset = 12
+    while offset < length:
+        f.seek(offset)
+        chunk_length, chunk_type = struct.unpack('<II', f.read(8))
+        if chunk_type == CHUNK_JSON:
+            document = json.loads(f.read(chunk_length))
+        elif chunk_type == CHUNK_BIN and binary is None:
+            binary = _map_file(path, offset + 8, chunk_length)
+        offset += 8 + chunk_length
+    if document is None:
+        raise ValueError("GLB has no JSON chunk")
+    return document, binary
+
+
+def _pad(length: int, alignment: int = 4) -> int:
+    return (alignment - length % alignment) % alignment
+
+
+class GlbWriter:
+    """Build a GLB from a document skeleton plus arrays added one by one.
+
+    Binary data goes straight to an anonymous spool file (in spool_dir, by
+    default the system temp directory) and is copied behind the JSON chunk
+    by write(), once the final document is known.
+    """
+
+    def __init__(self, document: Dict, spool_dir: Optional[Union[str, Path]] = None):
+        self.json = document
+        self.json['accessors'] = []
+        self.json['bufferViews'] = []
+        self.json['buffers'] = []
+        self.spool = tempfile.TemporaryFile(dir=spool_dir)
+        self.length = 0
+
+    def add_buffer_view(self, data, target: Optional[int] = None,
+                        byte_stride: Optional[int] = None) -> int:
+        """Append bytes-like data (or a C-contiguous array) as a bufferView."""
+        size = memoryview(data).nbytes
+        view = {'buffer': 0, 'byteOffset': self.length, 'byteLength': size}
+        if target is not None:
+            view['target'] = target
+        if byte_stride:
+            view['byteStride'] = byte_stride
+        self.spool.write(data)
+        self.spool.write(b'\0' * _pad(size))
+        self.length += size + _pad(size)
+        self.json['bufferViews'].append(view)
+        return len(self.json['bufferViews']) - 1
+
+    def add_accessor(self, array: np.ndarray, target: Optional[int] = None,
+                     normalized: bool = False, with_bounds: bool = False,
+                     accessor_type: Optional[str] = None) -> int:
+        """Store array as a tightly packed accessor; returns its index."""
+        array = np.ascontiguousarray(array)
+        components = 1 if array.ndim == 1 else array.shape[1]
+        accessor = {
+            'bufferView': self.add_buffer_view(array, target),
+            'componentType': COMPONENT_TYPES[array.dtype],
+            'count': int(array.shape[0]),
+            'type': accessor_type or TYPE_NAMES[components],
+        }
+        if normalized:
+            accessor['normalized'] = True
+        if with_bounds and len(array):
+            flat = array.reshape(len(array), -1)
+            accessor['min'] = flat.min(axis=0).tolist()
+            accessor['max'] = flat.max(axis=0).tolist()
+        self.json['accessors'].append(accessor)
+        return len(self.json['accessors']) - 1
+
+    def copy_accessor(self, source: GltfFile, index: int) -> int:
+        """Carry an accessor of source over unchanged (type, bounds and flags included)."""
+        original = source.json['accessors'][index]
+        target = None
+        if 'bufferView' in original:
+            target = source.json['bufferViews'][original['bufferView']].get('target')
+        new = self.add_accessor(source.accessor(index), target,
+                                normalized=original.get('normalized', False),
+                                accessor_type=original['type'])
+        for key in ('min', 'max', 'name', 'extras'):
+            if key in original:
+                self.json['accessors'][new][key] = original[key]
+        return new
+
+    def copy_buffer_view(self, source: GltfFile, index: int) -> int:
+        """Carry raw bufferView bytes (an embedded image, say) over unchanged."""
+        view = source.json['bufferViews'][index]
+        return self.add_buffer_view(source.buffer_view(index), view.get('target'),
+                                    view.get('byteStride'))
+
+    def write(self, path: Union[str, Path]) -> int:
+        """Write the GLB; returns its size in bytes."""
+        if self.length:
+            self.json['buffers'] = [{'byteLength': self.length}]
+        else:
+            del self.json['buffers']
+        document = json.dumps(self.json, separators=(',', ':')).encode()
+        document += b' ' * _pad(len(document))
+        total = 12 + 8 + len(document) + (8 + self.length if self.length else 0)
+
+        path = Path(path)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(struct.pack('<III', GLB_MAGIC, 2, total))
+            f.write(struct.pack('<II', len(document), CHUNK_JSON))
+            f.write(document)
+            if self.length:
+                f.write(struct.pack('<II', self.length, CHUNK_BIN))
+                self.spool.seek(0)
+                shutil.copyfileobj(self.spool, f, COPY_BLOCK_SIZE)
+        tmp_path.replace(path)
+        self.spool.close()
+        return total
@@ -0,0 +1,367 @@
+"""
+Persistent, incremental media catalog shared by the photo selection scripts.
+
+Keeps one SQLite row per media file (path, size, mtime, inode, content hash,
+capture date, dimensions, media type). A refresh only stats the folder and
+re-reads files whose size, mtime or inode changed, so repeat runs on large
+NAS folders take seconds. Content hashes are computed lazily, the first time
+something (e.g. the analysis cache) asks for them. Perceptual fingerprints
+for near-duplicate detection are stored by content hash, so an image is only
+decoded for them once.
+
+watch() keeps the catalog current as new files land, using inotify when
+inotify_simple is installed and periodic stat-only rescans otherwise.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from media_scan import IMAGE_EXTENSIONS, VIDEO_EXTENSIONS, iter_media_entries, media_type_for, scan_file
+
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    HAS_INOTIFY = True
+except ImportError:
+    HAS_INOTIFY = False
+
+DEFAULT_CATALOG_PATH = Path.home() / '.cache' / 'rslsm' / 'media-catalog.sqlite3'
+MEDIA_EXTENSIONS = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+QUERY_CHUNK = 500  # bound parameters per IN (...) query, below SQLite's limit
+
+# (pHash, dHash, sharpness) of an image, see media_dedup
+Fingerprint = Tuple[int, int, float]
+
+
+class CatalogEntry(NamedTuple):
+    path: Path
+    size: int
+    mtime: float
+    inode: int
+    content_hash: Optional[str]
+    date: Optional[datetime]
+    width: Optional[int]
+    height: Optional[int]
+    media_type: str
+    date_from_metadata: bool = False
+
+
+class RefreshResult(NamedTuple):
+    added: List[Path]
+    updated: List[Path]
+    removed: List[Path]
+
+    @property
+    def changed(self) -> List[Path]:
+        """New or modified files (the ones worth processing again)."""
+        return self.added + self.updated
+
+
+def file_content_hash(filepath: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _to_signed(value: int) -> int:
+    """64-bit hash as the signed integer SQLite can store."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def read_dimensions(filepath: Path) -> Tuple[Optional[int], Optional[int]]:
+    """Image width/height from the header (PIL opens lazily, without decoding)."""
+    if not HAS_PIL or media_type_for(filepath) != 'image':
+        return None, None
+    try:
+        with Image.open(filepath) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+
+def _read_entry(path: Path, st: os.stat_result) -> CatalogEntry:
+    scanned = scan_file(path, st.st_size, st.st_mtime)
+    width, height = read_dimensions(path)
+    return CatalogEntry(path, st.st_size, st.st_mtime, st.st_ino, None,
+                        scanned.date, width, height, scanned.media_type,
+                        scanned.date_from_metadata)
+
+
+class MediaCatalog:
+    """SQLite-backed index of media files, refreshed incrementally."""
+
+    def __init__(self, db_path: Path = DEFAULT_CATALOG_PATH, workers: int = 16):
+        self.db_path = Path(db_path).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                inode INTEGER NOT NULL,
+                content_hash TEXT,
+                capture_date TEXT,
+                width INTEGER,
+                height INTEGER,
+                media_type TEXT NOT NULL,
+                date_from_metadata INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        if 'date_from_metadata' not in columns:
+            # Older catalogs: a date differing from the mtime cannot be the fallback
+            self.conn.execute("ALTER TABLE files ADD COLUMN "
+                              "date_from_metadata INTEGER NOT NULL DEFAULT 0")
+            rows = self.conn.execute("SELECT path, mtime, capture_date FROM files").fetchall()
+            self.conn.executemany(
+                "UPDATE files SET date_from_metadata = 1 WHERE path = ?",
+                [(path,) for path, mtime, capture_date in rows
+                 if capture_date and capture_date != datetime.fromtimestamp(mtime).isoformat()])
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                content_hash TEXT PRIMARY KEY,
+                phash INTEGER NOT NULL,
+                dhash INTEGER NOT NULL,
+                sharpness REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    # -- reading -------------------------------------------------------------
+
+    @staticmethod
+    def _prefix(directory: Path) -> str:
+        return str(Path(directory).expanduser().resolve()) + os.sep
+
+    @staticmethod
+    def _row_to_entry(row) -> CatalogEntry:
+        (path, size, mtime, inode, content_hash, capture_date, width, height, media_type,
+         date_from_metadata) = row
+        date = datetime.fromisoformat(capture_date) if capture_date else None
+        return CatalogEntry(Path(path), size, mtime, inode, content_hash,
+                            date, width, height, media_type, bool(date_from_metadata))
+
+    def query(self, directory: Path, extensions: Optional[Set[str]] = None) -> List[CatalogEntry]:
+        """All catalogued files under directory, sorted by path."""
+        prefix = self._prefix(directory)
+        rows = self.conn.execute(
+            "SELECT * FROM files WHERE substr(path, 1, ?) = ? ORDER BY path",
+            (len(prefix), prefix)
+        ).fetchall()
+        entries = [self._row_to_entry(row) for row in rows]
+        if extensions is not None:
+            entries = [e for e in entries if e.path.suffix.lower() in extensions]
+        return entries
+
+    def get(self, path: Path) -> Optional[CatalogEntry]:
+        row = self.conn.execute(
+            "SELECT * FROM files WHERE path = ?", (str(Path(path).resolve()),)
+        ).fetchone()
+        return self._row_to_entry(row) if row else None
+
+    def ensure_hashes(self, paths: Iterable[Path]) -> Dict[Path, str]:
+        """Content hashes for paths, computing (in parallel) and storing any missing."""
+        hashes = {}
+        missing = []
+        for path in paths:
+            entry = self.get(path)
+            if entry is not None and entry.content_hash:
+                hashes[path] = entry.content_hash
+            else:
+                missing.append(path)
+
+        def hash_one(path: Path) -> Tuple[Path, Optional[str]]:
+            try:
+                return path, file_content_hash(path)
+            except OSError:
+                return path, None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for path, digest in pool.map(hash_one, missing):
+                if digest is None:
+                    continue
+                hashes[path] = digest
+                self.conn.execute("UPDATE files SET content_hash = ? WHERE path = ?",
+                                  (digest, str(Path(path).resolve())))
+        self.conn.commit()
+        return hashes
+
+    def fingerprints(self, content_hashes: Iterable[str]) -> Dict[str, Fingerprint]:
+        """Stored perceptual fingerprints for whichever content hashes have one."""
+        wanted = list(set(content_hashes))
+        found = {}
+        for start in range(0, len(wanted), QUERY_CHUNK):
+            chunk = wanted[start:start + QUERY_CHUNK]
+            rows = self.conn.execute(
+                f"SELECT content_hash, phash, dhash, sharpness FROM fingerprints "
+                f"WHERE content_hash IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for content_hash, phash, dhash, sharpness in rows:
+                found[content_hash] = (phash & 0xFFFFFFFFFFFFFFFF, dhash & 0xFFFFFFFFFFFFFFFF,
+                                       sharpness)
+        return found
+
+    def store_fingerprints(self, fingerprints: Dict[str, Fingerprint]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+            [(content_hash, _to_signed(phash), _to_signed(dhash), sharpness)
+             for content_hash, (phash, dhash, sharpness) in fingerprints.items()]
+        )
+        self.conn.commit()
+
+    # -- updating ------------------------------------------------------------
+
+    def _store(self, entry: CatalogEntry) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(entry.path), entry.size, entry.mtime, entry.inode, entry.content_hash,
+             entry.date.isoformat() if entry.date else None,
+             entry.width, entry.height, entry.media_type, int(entry.date_from_metadata))
+        )
+
+    def _update(self, stats: Dict[Path, os.stat_result]) -> Tuple[List[Path], List[Path]]:
+        """Re-read files whose size/mtime/inode differ from the catalog."""
+        known = {}
+        for path in stats:
+            row = self.conn.execute(
+                "SELECT size, mtime, inode FROM files WHERE path = ?", (str(path),)
+            ).fetchone()
+            if row is not None:
+                known[path] = row
+
+        stale = [p for p, st in stats.items()
+                 if known.get(p) != (st.st_size, st.st_mtime, st.st_ino)]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for entry in pool.map(lambda p: _read_entry(p, stats[p]), stale):
+                self._store(entry)
+        self.conn.commit()
+
+        added = [p for p in stale if p not in known]
+        updated = [p for p in stale if p in known]
+        return added, updated
+
+    def _drop_orphan_fingerprints(self) -> None:
+        """Forget fingerprints no catalogued file has (removed or changed files)."""
+        self.conn.execute(
+            "DELETE FROM fingerprints WHERE content_hash NOT IN "
+            "(SELECT content_hash FROM files WHERE content_hash IS NOT NULL)"
+        )
+
+    def refresh(self, directory: Path, extensions: Set[str] = MEDIA_EXTENSIONS) -> RefreshResult:
+        """Bring the catalog in line with directory, reading only changed files."""
+        stats = {}
+        for entry in iter_media_entries(Path(directory).expanduser().resolve(), extensions):
+            try:
+                stats[Path(entry.path)] = entry.stat()
+            except OSError:
+                continue
+
+        added, updated = self._update(stats)
+
+        removed = [e.path for e in self.query(directory, extensions) if e.path not in stats]
+        self.conn.executemany("DELETE FROM files WHERE path = ?", [(str(p),) for p in removed])
+        self._drop_orphan_fingerprints()
+        self.conn.commit()
+        return RefreshResult(added, updated, removed)
+
+    def update_paths(self, paths: Iterable[Path],
+                     extensions: Set[str] = MEDIA_EXTENSIONS) -> RefreshResult:
+        """Refresh just the given paths (e.g. from filesystem events)."""
+        stats = {}
+        removed = []
+        for path in {Path(p).resolve() for p in paths}:
+            if path.suffix.lower() not in extensions:
+                continue
+            try:
+                stats[path] = path.stat()
+            except FileNotFoundError:
+                removed.append(path)
+            except OSError:
+                continue
+
+        added, updated = self._update(stats)
+        self.conn.executemany("DELETE FROM files WHERE path = ?", [(str(p),) for p in removed])
+        self._drop_orphan_fingerprints()
+        self.conn.commit()
+        return RefreshResult(added, updated, removed)
+
+    # -- watching ------------------------------------------------------------
+
+    def watch(self, directory: Path, on_change: Callable[[RefreshResult], None],
+              extensions: Set[str] = MEDIA_EXTENSIONS,
+              debounce: float = 2.0, poll_interval: float = 10.0) -> None:
+        """Block, keeping the catalog current and calling on_change for each drop.
+
+        Events are collected until the folder has been quiet for `debounce`
+        seconds, so a phone sync of many files is handled as one change.
+        """
+        directory = Path(directory).expanduser().resolve()
+        if not HAS_INOTIFY:
+            print("⚠️  inotify_simple not installed, polling for changes. "
+                  "Run: pip install inotify_simple")
+            while True:
+                time.sleep(poll_interval)
+                result = self.refresh(directory, extensions)
+                if result.changed or result.removed:
+                    on_change(result)
+
+        inotify = INotify()
+        mask = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+                | inotify_flags.DELETE | inotify_flags.CREATE)
+        watches = {}
+
+        def add_tree(root: Path) -> None:
+            for current, dirs, _ in os.walk(root):
+                try:
+                    watches[inotify.add_watch(current, mask)] = Path(current)
+                except OSError:
+                    continue
+
+        add_tree(directory)
+        while True:
+            events = inotify.read()
+            while True:
+                more = inotify.read(timeout=int(debounce * 1000))
+                if not more:
+                    break
+                events.extend(more)
+
+            touched = set()
+            for event in events:
+                parent = watches.get(event.wd)
+                if parent is None or not event.name:
+                    continue
+                path = parent / event.name
+                if event.mask & inotify_flags.ISDIR:
+                    if event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                        add_tree(path)
+                        touched.update(Path(e.path) for e in iter_media_entries(path, extensions))
+                    else:
+                        touched.update(e.path for e in self.query(path, extensions))
+                    continue
+                touched.add(path)
+
+            result = self.update_paths(touched, extensions)
+            if result.changed or result.removed:
+                on_change(result)
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
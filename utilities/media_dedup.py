@@ -0,0 +1,179 @@
+"""
+Library-wide perceptual-hash near-duplicate detection.
+
+Computes 64-bit pHash (DCT) and dHash (gradient) fingerprints for a whole
+batch of small grayscale thumbnails with vectorised NumPy, then finds
+near-duplicate pairs without comparing every pair:
+
+- a multi-index hash table over the pHash: the 64 bits are split into
+  radius+1 chunks, and by the pigeonhole principle any two hashes within
+  `radius` bits agree exactly on at least one chunk, so only hashes sharing a
+  chunk value are ever compared;
+- a sorted capture-time window, so burst shots taken seconds apart are
+  compared with a looser threshold.
+
+Candidate pairs are verified with vectorised Hamming distances and merged
+into clusters with union-find.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+HASH_SIZE = 8        # 8x8 = 64-bit hashes
+PHASH_INPUT = 32     # pHash takes the low frequencies of a 32x32 DCT
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, so dct(X) = C @ X @ C.T."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    c = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    c[0] /= np.sqrt(2.0)
+    return c
+
+
+def _area_matrix(out_size: int, in_size: int) -> np.ndarray:
+    """Box-filter resampling matrix (out_size x in_size) with fractional coverage."""
+    scale = in_size / out_size
+    m = np.zeros((out_size, in_size))
+    for o in range(out_size):
+        start, end = o * scale, (o + 1) * scale
+        for i in range(int(np.floor(start)), int(np.ceil(end))):
+            m[o, i] = min(end, i + 1) - max(start, i)
+    return m / m.sum(axis=1, keepdims=True)
+
+
+_DCT = _dct_matrix(PHASH_INPUT)
+
+
+def _pack_bits(bits: np.ndarray) -> np.ndarray:
+    """(N, 64) booleans -> (N,) uint64."""
+    return np.packbits(bits.astype(np.uint8), axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def resample(gray: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Area-resample a stack of grayscale images (N, H, W) to (N, height, width)."""
+    rows = _area_matrix(height, gray.shape[1])
+    cols = _area_matrix(width, gray.shape[2])
+    return rows @ gray @ cols.T
+
+
+def phash(gray: np.ndarray) -> np.ndarray:
+    """64-bit DCT perceptual hashes for a stack of grayscale images (N, H, W)."""
+    if gray.shape[1:] != (PHASH_INPUT, PHASH_INPUT):
+        gray = resample(gray, PHASH_INPUT, PHASH_INPUT)
+    low = (_DCT @ gray @ _DCT.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(gray), -1)
+    median = np.median(low[:, 1:], axis=1, keepdims=True)  # ignore the DC term
+    return _pack_bits(low > median)
+
+
+def dhash(gray: np.ndarray) -> np.ndarray:
+    """64-bit horizontal-gradient hashes for a stack of grayscale images (N, H, W)."""
+    small = resample(gray, HASH_SIZE, HASH_SIZE + 1)
+    return _pack_bits((small[:, :, 1:] > small[:, :, :-1]).reshape(len(gray), -1))
+
+
+def laplacian_variance(gray: np.ndarray) -> np.ndarray:
+    """Per-image variance of the 4-neighbour Laplacian (higher = sharper)."""
+    lap = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:]
+           - 4 * gray[:, 1:-1, 1:-1])
+    return lap.reshape(len(gray), -1).var(axis=1)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Element-wise Hamming distance between two uint64 arrays."""
+    x = np.bitwise_xor(a, b)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x).astype(np.int64)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+    return table[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def _forward_pairs(order: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """All pairs (order[p], order[q]) with p < q < ends[p], generated without Python loops."""
+    starts = np.arange(len(order))
+    counts = np.maximum(ends - starts - 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    p = np.repeat(starts, counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    return order[p], order[p + offsets]
+
+
+def multi_index_pairs(hashes: np.ndarray, radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Candidate pairs that agree exactly on at least one of radius+1 hash chunks."""
+    chunks = radius + 1
+    bounds = np.linspace(0, 64, chunks + 1).astype(int)
+    firsts, seconds = [], []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        mask = np.uint64((1 << int(end - start)) - 1)
+        keys = (hashes >> np.uint64(start)) & mask
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        ends = np.searchsorted(sorted_keys, sorted_keys, side='right')
+        i, j = _forward_pairs(order, ends)
+        firsts.append(i)
+        seconds.append(j)
+    return _unique_pairs(np.concatenate(firsts), np.concatenate(seconds), len(hashes))
+
+
+def time_window_pairs(timestamps: np.ndarray, window: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairs of items whose timestamps are within `window` seconds (NaN = unknown)."""
+    known = np.flatnonzero(~np.isnan(timestamps))
+    order = known[np.argsort(timestamps[known], kind='stable')]
+    sorted_times = timestamps[order]
+    ends = np.searchsorted(sorted_times, sorted_times + window, side='right')
+    i, j = _forward_pairs(order, ends)
+    return _unique_pairs(i, j, len(timestamps))
+
+
+def _unique_pairs(i: np.ndarray, j: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    lo, hi = np.minimum(i, j), np.maximum(i, j)
+    keys = np.unique(lo.astype(np.int64) * n + hi)
+    return keys // n, keys % n
+
+
+def group_near_duplicates(phashes: np.ndarray, dhashes: np.ndarray,
+                          timestamps: Optional[np.ndarray] = None,
+                          radius: int = 4, burst_radius: int = 12,
+                          burst_window: float = 10.0) -> List[List[int]]:
+    """Cluster near-duplicate items; returns only clusters with two or more members.
+
+    Two items are linked when their pHashes are within `radius` bits and their
+    dHashes within 2 * radius, or when they were captured within
+    `burst_window` seconds of each other and their pHashes are within
+    `burst_radius` bits. timestamps must be capture times from the file
+    metadata; pass NaN where only a modification time is known, or unrelated
+    files copied together would count as bursts.
+    """
+    n = len(phashes)
+    parent = list(range(n))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def link(i: np.ndarray, j: np.ndarray) -> None:
+        for a, b in zip(i.tolist(), j.tolist()):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+    i, j = multi_index_pairs(phashes, radius)
+    keep = (hamming(phashes[i], phashes[j]) <= radius) & (hamming(dhashes[i], dhashes[j]) <= 2 * radius)
+    link(i[keep], j[keep])
+
+    if timestamps is not None and burst_window > 0:
+        i, j = time_window_pairs(timestamps, burst_window)
+        keep = hamming(phashes[i], phashes[j]) <= burst_radius
+        link(i[keep], j[keep])
+
+    clusters = {}
+    for x in range(n):
+        clusters.setdefault(find(x), []).append(x)
+    return [members for members in clusters.values() if len(members) > 1]
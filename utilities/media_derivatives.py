@@ -0,0 +1,134 @@
+"""
+Responsive image derivatives for the website.
+
+Each source photo is decoded once and written at several widths in JPEG,
+WebP and AVIF, so the gallery can serve a <picture>/srcset and browsers
+download only what the viewport needs. Smaller widths are resized from the
+next larger one, so the cost stays close to a single resize.
+
+The largest JPEG keeps the plain `{stem}.jpg` name the site already links
+to; the other files are named `{stem}-{width}w.{ext}`. write_srcset_manifest
+records every file with its dimensions and byte size.
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence
+
+from PIL import Image, features
+
+import decode_budget
+import output_sync
+import pipeline_trace
+
+WIDTHS = (320, 640, 1024, 1600)
+FORMATS = ('avif', 'webp', 'jpeg')   # order of <source> elements, best first
+MANIFEST_NAME = 'responsive-images.json'
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'avif': '.avif', 'webp': '.webp', 'jpeg': '.jpg'}
+SAVE_OPTIONS = {
+    'avif': {'quality': 60, 'speed': 6},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+
+def supported_formats(formats: Iterable[str] = FORMATS) -> List[str]:
+    """The requested formats this Pillow build can encode (JPEG always can)."""
+    supported = []
+    for fmt in formats:
+        try:
+            ok = fmt == 'jpeg' or features.check(fmt)
+        except ValueError:  # Pillow too old to know the codec
+            ok = False
+        if ok:
+            supported.append(fmt)
+    return supported
+
+
+def derivative_widths(width: int, height: int, widths: Sequence[int] = WIDTHS,
+                      max_size: int = 1600) -> List[int]:
+    """Output widths for a source: the requested ones below the capped full size, plus it."""
+    top = int(width * min(max_size / max(width, height), 1.0))
+    return sorted(w for w in set(widths) if w < top) + [top]
+
+
+def _save_atomic(img: Image.Image, output_path: Path, fmt: str) -> int:
+    """Save and verify via a temp file in the same directory; returns the byte size."""
+    tmp_path = output_path.with_name(f".{output_path.stem}.{os.getpid()}.tmp{output_path.suffix}")
+    try:
+        img.save(tmp_path, fmt.upper(), **SAVE_OPTIONS[fmt])
+        with Image.open(tmp_path) as written:
+            written.verify()
+        os.replace(tmp_path, output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    size = output_path.stat().st_size
+    pipeline_trace.count('bytes_written', size)
+    return size
+
+
+def write_derivatives(input_path: Path, output_dir: Path, stem: str,
+                      widths: Sequence[int] = WIDTHS, formats: Iterable[str] = FORMATS,
+                      max_size: int = 1600) -> Dict:
+    """Decode input_path once and write every width/format; returns its manifest entry."""
+    formats = supported_formats(formats)
+    if 'jpeg' not in formats:
+        formats.append('jpeg')  # the fallback <img src> is always a JPEG
+
+    with Image.open(input_path) as src:
+        orientation = src.getexif().get(decode_budget.ORIENTATION_TAG, 1)
+        # Decode (or box-reduce right after decoding) to just above max_size,
+        # so the copies below never hold a full-resolution frame
+        scale = min(max_size / max(src.size), 1.0)
+        img = decode_budget.load_reduced(src, (int(src.width * scale), int(src.height * scale)))
+        img = decode_budget.upright(img, orientation)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+    base_url = output_sync.public_url(output_dir)
+    files = {fmt: [] for fmt in formats}
+    output_widths = derivative_widths(img.width, img.height, widths, max_size)
+    current = img
+    for width in reversed(output_widths):
+        height = max(1, round(img.height * width / img.width))
+        if current.size != (width, height):
+            current = current.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            if fmt == 'jpeg' and width == output_widths[-1]:
+                name = f"{stem}.jpg"
+            else:
+                name = f"{stem}-{width}w{EXTENSIONS[fmt]}"
+            size = _save_atomic(current, output_dir / name, fmt)
+            files[fmt].append({'url': f"{base_url}/{name}", 'width': width,
+                               'height': height, 'bytes': size})
+
+    top = files['jpeg'][0]
+    return {
+        'src': top['url'],
+        'width': top['width'],
+        'height': top['height'],
+        'sources': [
+            {
+                'type': MIME_TYPES[fmt],
+                'srcset': ', '.join(f"{f['url']} {f['width']}w" for f in reversed(files[fmt])),
+                'files': list(reversed(files[fmt])),
+            }
+            for fmt in FORMATS if fmt in files
+        ],
+    }
+
+
+def write_srcset_manifest(output_dir: Path, entries: Dict[str, Dict]) -> Path:
+    """Write output_dir/responsive-images.json mapping output stem -> entry (if it changed)."""
+    manifest_path = output_dir / MANIFEST_NAME
+    text = json.dumps({'images': entries}, indent=2, sort_keys=True)
+    if manifest_path.exists() and manifest_path.read_text() == text:
+        return manifest_path  # unchanged: keep the file (and its mtime) as it is
+    tmp_path = manifest_path.with_name(f".{manifest_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text)
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
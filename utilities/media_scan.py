@@ -0,0 +1,361 @@
+"""
+Header-only media scanner shared by the photo selection scripts.
+
+Walks a folder with os.scandir and reads capture dates straight from the
+container headers, touching only the first few KB of each file:
+
+- JPEG: EXIF in the APP1 segment
+- HEIC/HEIF: the 'Exif' item located through the meta/iinf/iloc boxes
+- PNG: the eXIf chunk
+- MOV/MP4/M4V: creation_time in the moov/mvhd box
+
+media_catalog runs scan_file on a thread pool (the work is I/O bound,
+which matters a lot on NAS mounts) for files that are new or changed.
+"""
+
+import os
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, NamedTuple, Optional, Set, Tuple
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.heic', '.heif'}
+VIDEO_EXTENSIONS = {'.mov', '.mp4', '.m4v', '.avi'}
+
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+# Tags in order of preference: DateTimeOriginal, DateTimeDigitized (Exif IFD), DateTime (IFD0)
+EXIF_IFD_POINTER = 0x8769
+EXIF_DATE_TAGS = (0x9003, 0x9004)
+IFD0_DATE_TAG = 0x0132
+
+# QuickTime timestamps count seconds from 1904-01-01 UTC
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+
+class ScannedFile(NamedTuple):
+    path: Path
+    date: Optional[datetime]
+    size: int
+    mtime: float
+    media_type: str  # 'image' or 'video'
+    date_from_metadata: bool = False  # False when date is the mtime fallback
+
+
+# ---------------------------------------------------------------------------
+# EXIF / TIFF
+# ---------------------------------------------------------------------------
+
+def _ifd_entries(tiff: bytes, offset: int, endian: str) -> Dict[int, Tuple[int, int, int]]:
+    """Map tag -> (type, count, offset of the value field) for one IFD."""
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    for i in range(count):
+        pos = offset + 2 + i * 12
+        if pos + 12 > len(tiff):
+            break
+        tag, typ, n = struct.unpack_from(endian + 'HHI', tiff, pos)
+        entries[tag] = (typ, n, pos + 8)
+    return entries
+
+
+def _ifd_ascii(tiff: bytes, entry: Tuple[int, int, int], endian: str) -> Optional[str]:
+    typ, count, field = entry
+    if typ != 2:
+        return None
+    start = field if count <= 4 else struct.unpack_from(endian + 'I', tiff, field)[0]
+    return tiff[start:start + count].split(b'\0', 1)[0].decode('ascii', 'ignore')
+
+
+def _ifd_long(tiff: bytes, entry: Tuple[int, int, int], endian: str) -> Optional[int]:
+    typ, _, field = entry
+    if typ == 4:
+        return struct.unpack_from(endian + 'I', tiff, field)[0]
+    if typ == 3:
+        return struct.unpack_from(endian + 'H', tiff, field)[0]
+    return None
+
+
+def _parse_exif_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip()[:19], EXIF_DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+def parse_tiff_date(tiff: bytes) -> Optional[datetime]:
+    """Capture date from a TIFF-structured EXIF block (starting at 'II'/'MM')."""
+    if tiff.startswith(b'Exif\0\0'):
+        tiff = tiff[6:]
+    endian = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if endian is None or len(tiff) < 8:
+        return None
+
+    try:
+        ifd0 = _ifd_entries(tiff, struct.unpack_from(endian + 'I', tiff, 4)[0], endian)
+        if EXIF_IFD_POINTER in ifd0:
+            exif_offset = _ifd_long(tiff, ifd0[EXIF_IFD_POINTER], endian)
+            exif_ifd = _ifd_entries(tiff, exif_offset, endian) if exif_offset else {}
+            for tag in EXIF_DATE_TAGS:
+                if tag in exif_ifd:
+                    date = _parse_exif_date(_ifd_ascii(tiff, exif_ifd[tag], endian))
+                    if date:
+                        return date
+        if IFD0_DATE_TAG in ifd0:
+            return _parse_exif_date(_ifd_ascii(tiff, ifd0[IFD0_DATE_TAG], endian))
+    except struct.error:
+        return None
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Container parsers
+# ---------------------------------------------------------------------------
+
+def _jpeg_exif(f: BinaryIO) -> Optional[bytes]:
+    """Return the APP1 EXIF payload, skipping every other segment by seeking."""
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:  # fill bytes
+            marker = marker[1:] + f.read(1)
+        code = marker[1]
+        if code in (0xD9, 0xDA):  # EOI / start of scan: no metadata after this
+            return None
+        if 0xD0 <= code <= 0xD7 or code == 0x01:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if code == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(b'Exif\0\0'):
+                return data[6:]
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def _png_exif(f: BinaryIO) -> Optional[bytes]:
+    """Return the eXIf chunk of a PNG, stopping at the first IDAT."""
+    if f.read(8) != b'\x89PNG\r\n\x1a\n':
+        return None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, ctype = struct.unpack('>I4s', header)
+        if ctype == b'eXIf':
+            return f.read(length)
+        if ctype in (b'IDAT', b'IEND'):
+            return None
+        f.seek(length + 4, os.SEEK_CUR)  # data + CRC
+
+
+def _iter_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload_start, box_end) for ISO BMFF boxes in [start, end)."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, btype = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size:
+            return
+        yield btype, pos + header_size, pos + size
+        pos += size
+
+
+def _find_box(f: BinaryIO, btype: bytes, start: int, end: int) -> Optional[Tuple[int, int]]:
+    for found, payload, box_end in _iter_boxes(f, start, end):
+        if found == btype:
+            return payload, box_end
+    return None
+
+
+def _read_uint(data: bytes, pos: int, size: int) -> Tuple[int, int]:
+    """Read a big-endian unsigned int of 0/2/4/8 bytes; returns (value, new_pos)."""
+    if size == 0:
+        return 0, pos
+    return int.from_bytes(data[pos:pos + size], 'big'), pos + size
+
+
+def _heif_exif_item(iinf: bytes) -> Optional[int]:
+    """Find the item ID of the 'Exif' item in an iinf box payload."""
+    version = iinf[0]
+    pos = 4 + (2 if version == 0 else 4)
+    while pos + 8 <= len(iinf):
+        size, btype = struct.unpack_from('>I4s', iinf, pos)
+        if size < 8:
+            return None
+        if btype == b'infe':
+            infe_version = iinf[pos + 8]
+            body = pos + 12
+            if infe_version >= 2:
+                id_size = 2 if infe_version == 2 else 4
+                item_id, body = _read_uint(iinf, body, id_size)
+                item_type = iinf[body + 2:body + 6]  # after item_protection_index
+                if item_type == b'Exif':
+                    return item_id
+        pos += size
+    return None
+
+
+def _heif_item_extent(iloc: bytes, wanted: int) -> Optional[Tuple[int, int]]:
+    """Return (file offset, length) of the first extent of an item from an iloc payload."""
+    version = iloc[0]
+    offset_size, length_size = iloc[4] >> 4, iloc[4] & 0x0F
+    base_offset_size = iloc[5] >> 4
+    index_size = iloc[5] & 0x0F if version in (1, 2) else 0
+    pos = 6
+    item_count, pos = _read_uint(iloc, pos, 2 if version < 2 else 4)
+
+    for _ in range(item_count):
+        item_id, pos = _read_uint(iloc, pos, 2 if version < 2 else 4)
+        construction_method = 0
+        if version in (1, 2):
+            construction_method, pos = _read_uint(iloc, pos, 2)
+            construction_method &= 0x0F
+        pos += 2  # data_reference_index
+        base_offset, pos = _read_uint(iloc, pos, base_offset_size)
+        extent_count, pos = _read_uint(iloc, pos, 2)
+        extents = []
+        for _ in range(extent_count):
+            pos += index_size
+            extent_offset, pos = _read_uint(iloc, pos, offset_size)
+            extent_length, pos = _read_uint(iloc, pos, length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+        if item_id == wanted:
+            # Only plain file offsets are supported (not idat-relative items)
+            return extents[0] if extents and construction_method == 0 else None
+    return None
+
+
+def _heif_exif(f: BinaryIO, file_size: int) -> Optional[bytes]:
+    meta = _find_box(f, b'meta', 0, file_size)
+    if meta is None:
+        return None
+    meta_start, meta_end = meta
+    iinf = _find_box(f, b'iinf', meta_start + 4, meta_end)  # meta is a FullBox
+    iloc = _find_box(f, b'iloc', meta_start + 4, meta_end)
+    if iinf is None or iloc is None:
+        return None
+
+    f.seek(iinf[0])
+    item_id = _heif_exif_item(f.read(iinf[1] - iinf[0]))
+    if item_id is None:
+        return None
+    f.seek(iloc[0])
+    extent = _heif_item_extent(f.read(iloc[1] - iloc[0]), item_id)
+    if extent is None:
+        return None
+
+    offset, length = extent
+    f.seek(offset)
+    data = f.read(min(length, 1 << 20))
+    # The Exif item starts with a 4-byte offset to the TIFF header
+    if len(data) < 4:
+        return None
+    tiff_offset = struct.unpack_from('>I', data)[0]
+    return data[4 + tiff_offset:]
+
+
+def _quicktime_creation_time(f: BinaryIO, file_size: int) -> Optional[datetime]:
+    moov = _find_box(f, b'moov', 0, file_size)
+    if moov is None:
+        return None
+    mvhd = _find_box(f, b'mvhd', moov[0], moov[1])
+    if mvhd is None:
+        return None
+
+    f.seek(mvhd[0])
+    data = f.read(12)
+    if len(data) < 8:
+        return None
+    if data[0] == 1:
+        seconds = struct.unpack_from('>Q', data, 4)[0]
+    else:
+        seconds = struct.unpack_from('>I', data, 4)[0]
+    if seconds <= QUICKTIME_EPOCH_OFFSET:
+        return None  # unset (zero) timestamps are common in re-encoded files
+    try:
+        return datetime.fromtimestamp(seconds - QUICKTIME_EPOCH_OFFSET)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def read_capture_date(filepath: Path, file_size: Optional[int] = None) -> Optional[datetime]:
+    """Capture date from the file's own metadata, or None if it has none."""
+    ext = filepath.suffix.lower()
+    try:
+        with open(filepath, 'rb') as f:
+            if file_size is None:
+                file_size = os.fstat(f.fileno()).st_size
+            if ext in ('.jpg', '.jpeg'):
+                exif = _jpeg_exif(f)
+            elif ext in ('.heic', '.heif'):
+                exif = _heif_exif(f, file_size)
+            elif ext == '.png':
+                exif = _png_exif(f)
+            elif ext in ('.mov', '.mp4', '.m4v'):
+                return _quicktime_creation_time(f, file_size)
+            else:
+                return None
+    except (OSError, struct.error, IndexError, ValueError):
+        return None
+    return parse_tiff_date(exif) if exif else None
+
+
+# ---------------------------------------------------------------------------
+# Directory scanning
+# ---------------------------------------------------------------------------
+
+def media_type_for(path: Path) -> Optional[str]:
+    ext = path.suffix.lower()
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in VIDEO_EXTENSIONS:
+        return 'video'
+    return None
+
+
+def iter_media_entries(directory: Path, extensions: Set[str]) -> Iterator[os.DirEntry]:
+    """Recursively yield DirEntry objects for files with the given extensions."""
+    stack = [str(directory)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                            yield entry
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def scan_file(path: Path, size: Optional[int] = None, mtime: Optional[float] = None) -> ScannedFile:
+    """Read one file's capture date, falling back to its modification time."""
+    if size is None or mtime is None:
+        st = path.stat()
+        size, mtime = st.st_size, st.st_mtime
+    date = read_capture_date(path, size)
+    return ScannedFile(path, date or datetime.fromtimestamp(mtime), size, mtime,
+                       media_type_for(path) or 'image', date is not None)
@@ -0,0 +1,118 @@
+"""
+Diversity-aware selection of the best media from a large candidate pool.
+
+Picks k items by Maximal Marginal Relevance (MMR): each step takes the item
+with the best trade-off between its own quality and its similarity to what
+has already been picked. Similarity mixes capture-time proximity, build
+phase and (when available) perceptual-hash distance.
+
+Because an item's similarity to the selected set can only grow as the set
+grows, its MMR score can only fall, so stale scores are upper bounds. That
+allows lazy greedy evaluation with a max-heap: an item is only rescored when
+it reaches the top, and only against items selected since it was last
+scored. Building the heap is O(n) and each pop is O(log n), so the whole
+selection is O(n log n) with k small.
+
+Per-phase quotas and a minimum time gap between picks are hard constraints;
+both only get tighter as the selection grows, so an item that violates one
+can be dropped for good.
+"""
+
+import heapq
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Sequence
+
+
+def _time_similarity(a: Optional[float], b: Optional[float], time_scale: float) -> float:
+    if a is None or b is None:
+        return 0.0
+    return 1.0 / (1.0 + abs(a - b) / time_scale)
+
+
+def _visual_similarity(a: Optional[int], b: Optional[int]) -> float:
+    if a is None or b is None:
+        return 0.0
+    # Unrelated 64-bit hashes differ in ~32 bits; treat that as zero similarity
+    return max(0.0, 1.0 - bin(a ^ b).count('1') / 32.0)
+
+
+def select_diverse(qualities: Sequence[float],
+                   timestamps: Sequence[Optional[float]],
+                   phases: Sequence[str],
+                   k: int,
+                   visual_hashes: Optional[Sequence[Optional[int]]] = None,
+                   diversity: float = 0.3,
+                   time_scale: float = 3 * 86400,
+                   phase_quotas: Optional[Dict[str, int]] = None,
+                   min_time_gap: float = 0.0,
+                   weights: Sequence[float] = (0.4, 0.3, 0.3)) -> List[int]:
+    """Return the indices of up to k items, in the order they were picked.
+
+    qualities are on the 0-10 quality_score scale; timestamps are in seconds
+    (None when unknown). `diversity` (0-1) trades quality for spread,
+    `time_scale` is the time difference at which two captures count as half
+    similar, and `weights` weight the time, phase and visual similarity terms.
+    """
+    n = len(qualities)
+    if k <= 0 or n == 0:
+        return []
+
+    w_time, w_phase, w_visual = weights
+    if visual_hashes is None or all(h is None for h in visual_hashes):
+        visual_hashes = [None] * n
+        w_visual = 0.0
+    total_weight = (w_time + w_phase + w_visual) or 1.0
+    phase_quotas = phase_quotas or {}
+
+    def similarity(i: int, j: int) -> float:
+        s = w_time * _time_similarity(timestamps[i], timestamps[j], time_scale)
+        if phases[i] == phases[j]:
+            s += w_phase
+        s += w_visual * _visual_similarity(visual_hashes[i], visual_hashes[j])
+        return s / total_weight
+
+    def mmr(i: int, max_sim: float) -> float:
+        return (1 - diversity) * qualities[i] / 10.0 - diversity * max_sim
+
+    selected: List[int] = []
+    selected_times: List[float] = []
+    phase_counts: Dict[str, int] = {}
+    # Per item: max similarity to selected[:seen[i]]
+    max_sims = [0.0] * n
+    seen = [0] * n
+
+    heap = [(-mmr(i, 0.0), i) for i in range(n)]
+    heapq.heapify(heap)
+
+    def allowed(i: int) -> bool:
+        quota = phase_quotas.get(phases[i])
+        if quota is not None and phase_counts.get(phases[i], 0) >= quota:
+            return False
+        t = timestamps[i]
+        if min_time_gap > 0 and t is not None and selected_times:
+            pos = bisect_left(selected_times, t)
+            for neighbour in selected_times[max(0, pos - 1):pos + 1]:
+                if abs(neighbour - t) < min_time_gap:
+                    return False
+        return True
+
+    while heap and len(selected) < k:
+        _, i = heapq.heappop(heap)
+        if not allowed(i):
+            continue
+
+        if seen[i] < len(selected):
+            for j in selected[seen[i]:]:
+                max_sims[i] = max(max_sims[i], similarity(i, j))
+            seen[i] = len(selected)
+            score = mmr(i, max_sims[i])
+            if heap and score < -heap[0][0]:
+                heapq.heappush(heap, (-score, i))
+                continue
+
+        selected.append(i)
+        phase_counts[phases[i]] = phase_counts.get(phases[i], 0) + 1
+        if timestamps[i] is not None:
+            insort(selected_times, timestamps[i])
+
+    return selected
@@ -0,0 +1,514 @@
+"""
+Vectorised quadric-error-metric mesh decimation with NumPy.
+
+Garland-Heckbert edge collapse, done in rounds instead of one edge at a
+time so every step is an array operation:
+
+1. Each vertex carries the summed plane quadrics of its triangles (area
+   weighted), plus steep planes along open borders so they do not shrink.
+2. Every edge is costed at the best of its endpoints, its midpoint and the
+   position minimising the quadric error.
+3. Edges that are the cheapest edge at both of their endpoints form a set
+   sharing no vertex; the cheapest of those are collapsed together, except
+   where the move would flip a neighbouring triangle.
+
+Rounds repeat until the triangle budget is met. Split vertices (seams
+between hard normals or UV islands) are welded by position first so the
+mesh is connected, and the decimated mesh gets crease-aware normals back.
+Each triangle corner keeps its wedge, the other attribute values of the
+vertex it came from, so UV and vertex-colour seams survive: a vertex on
+a seam never moves and only collapses along the seam, and output
+vertices are split again per wedge.
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+BOUNDARY_WEIGHT = 100.0    # border-preserving planes, relative to face-area weights
+CREASE_ANGLE = 35.0        # degrees; sharper edges keep split (flat) normals
+MAX_ROUNDS = 500
+MAX_ROUND_FRACTION = 0.2  # at most this share of the triangles removed per round
+SELECTION_PASSES = 4      # reselections per round after rejected collapses
+MIN_NORMAL_DOT = 0.2      # a triangle turning further than ~78 degrees counts as flipped
+# Attributes that are not part of a wedge: rebuilt (NORMAL) or following the geometry
+UNWEDGED_ATTRIBUTES = ('POSITION', 'NORMAL', 'TANGENT')
+
+
+# Cell offsets that, with the cell itself, cover each pair of neighbouring grid cells once
+HALF_NEIGHBOURHOOD = np.array([(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)
+                               if (x, y, z) > (0, 0, 0)], dtype=np.int64)
+
+
+def _cell_keys(cells: np.ndarray, dims: Tuple[int, int, int]) -> np.ndarray:
+    """Sortable scalar keys of non-negative integer grid cells (N, 3) below dims."""
+    if dims[0] * dims[1] * dims[2] < 1 << 62:
+        return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    # Grids too fine for one int64: big-endian bytes compare in numeric order
+    return np.ascontiguousarray(cells.astype('>i8')).view('V24').ravel()
+
+
+def close_pairs(points: np.ndarray, distance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairs (i, j) with i < j of points at most distance apart, sorted by i then j.
+
+    Points are binned into a grid of cell size distance, so only points in
+    the same or adjacent cells are ever compared.
+    """
+    cells = np.floor(points / distance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1  # keep neighbours of the lowest cells non-negative
+    dims = tuple(int(d) + 2 for d in cells.max(axis=0))
+    keys = _cell_keys(cells, dims)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    firsts, seconds = [], []
+    for offset in np.concatenate([np.zeros((1, 3), dtype=np.int64), HALF_NEIGHBOURHOOD]):
+        keys = _cell_keys(cells + offset, dims)
+        starts = np.searchsorted(sorted_keys, keys, side='left')
+        counts = np.searchsorted(sorted_keys, keys, side='right') - starts
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        i = np.repeat(np.arange(len(points)), counts)
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(starts, counts) + within]
+        firsts.append(np.minimum(i, j))
+        seconds.append(np.maximum(i, j))
+    if not firsts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    i, j = np.concatenate(firsts), np.concatenate(seconds)
+    keep = (i != j) & (np.linalg.norm(points[i] - points[j], axis=1) <= distance)
+    pairs = np.unique(np.stack([i[keep], j[keep]], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def weld_vertices(positions: np.ndarray, tolerance: float = 0.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Merge vertices within tolerance of each other (exact duplicates with 0).
+
+    As in Blender's merge by distance, each vertex is merged into the first
+    vertex within tolerance that is not itself merged away, so a run of
+    closely spaced vertices is not chained into a single one.
+
+    Returns (welded positions, index of each input vertex's welded vertex,
+    first input vertex of each welded vertex).
+    """
+    _, first, inverse = np.unique(positions, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if tolerance > 0 and len(first) > 1:
+        target = list(range(len(first)))
+        for a, b in zip(*(pairs.tolist() for pairs in close_pairs(positions[first], tolerance))):
+            if target[a] == a and target[b] == b:
+                target[b] = a
+        target = np.array(target)
+        kept = target == np.arange(len(first))
+        renumber = np.cumsum(kept) - 1
+        inverse = renumber[target][inverse]
+        first = first[kept]
+    return positions[first].astype(np.float64), inverse, first
+
+
+def attribute_wedges(attributes: Dict[str, np.ndarray],
+                     vertex_map: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Group input vertices into wedges: same welded vertex, same other attribute values.
+
+    Vertices welded together across a UV or vertex-colour seam end up in
+    different wedges. Returns (wedge of each input vertex, first input
+    vertex of each wedge).
+    """
+    columns = [np.ascontiguousarray(vertex_map.astype(np.int64)[:, None]).view(np.uint8)]
+    for name, values in sorted(attributes.items()):
+        if name not in UNWEDGED_ATTRIBUTES:
+            columns.append(np.ascontiguousarray(values.reshape(len(values), -1)).view(np.uint8))
+    _, first, inverse = np.unique(np.concatenate(columns, axis=1), axis=0,
+                                  return_index=True, return_inverse=True)
+    return inverse.reshape(-1), first
+
+
+def face_normals(positions: np.ndarray, faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(unit normals, areas) of triangles; degenerate triangles get a zero normal."""
+    v0, v1, v2 = (positions[faces[:, k]] for k in range(3))
+    cross = np.cross(v1 - v0, v2 - v0)
+    length = np.linalg.norm(cross, axis=1)
+    normals = np.divide(cross, length[:, None], out=np.zeros_like(cross), where=length[:, None] > 0)
+    return normals, length / 2
+
+
+def _plane_quadrics(normals: np.ndarray, points: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Weighted quadrics K = w * p p^T of planes (n, -n.x); shape (count, 4, 4)."""
+    planes = np.concatenate([normals, -(normals * points).sum(axis=1, keepdims=True)], axis=1)
+    return weights[:, None, None] * planes[:, :, None] * planes[:, None, :]
+
+
+def _accumulate(target_count: int, vertex_ids: np.ndarray, quadrics: np.ndarray) -> np.ndarray:
+    """Sum quadrics onto vertices (bincount per component; much faster than np.add.at)."""
+    flat = quadrics.reshape(len(quadrics), 16)
+    total = np.empty((target_count, 16))
+    for c in range(16):
+        total[:, c] = np.bincount(vertex_ids, weights=flat[:, c], minlength=target_count)
+    return total.reshape(target_count, 4, 4)
+
+
+def unique_edges(faces: np.ndarray, vertex_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(edges (E, 2) with a < b, is-boundary flag, one face of each edge)."""
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    owner = np.tile(np.arange(len(faces)), 3)
+    edges.sort(axis=1)
+    keys = edges[:, 0].astype(np.int64) * vertex_count + edges[:, 1]
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    return edges[first], counts == 1, owner[first]
+
+
+def vertex_quadrics(positions: np.ndarray, faces: np.ndarray) -> np.ndarray:
+    """Per-vertex error quadrics: triangle planes plus border-preserving planes."""
+    normals, areas = face_normals(positions, faces)
+    face_q = _plane_quadrics(normals, positions[faces[:, 0]], areas)
+    q = _accumulate(len(positions), faces.reshape(-1), np.repeat(face_q, 3, axis=0))
+
+    edges, boundary, owner = unique_edges(faces, len(positions))
+    if boundary.any():
+        a, b = edges[boundary, 0], edges[boundary, 1]
+        direction = positions[b] - positions[a]
+        side = np.cross(direction, normals[owner[boundary]])
+        length = np.linalg.norm(side, axis=1)
+        side = np.divide(side, length[:, None], out=np.zeros_like(side), where=length[:, None] > 0)
+        weight = BOUNDARY_WEIGHT * (direction ** 2).sum(axis=1)
+        edge_q = _plane_quadrics(side, positions[a], weight)
+        q += _accumulate(len(positions), np.concatenate([a, b]), np.concatenate([edge_q, edge_q]))
+    return q
+
+
+def _quadric_error(q: np.ndarray, points: np.ndarray) -> np.ndarray:
+    homogeneous = np.concatenate([points, np.ones((len(points), 1))], axis=1)
+    return np.einsum('ei,eij,ej->e', homogeneous, q, homogeneous)
+
+
+def collapse_costs(positions: np.ndarray, q: np.ndarray,
+                   edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(cost, target position) of collapsing each edge."""
+    a, b = edges[:, 0], edges[:, 1]
+    qe = q[a] + q[b]
+    pa, pb = positions[a], positions[b]
+    candidates = [pa, pb, (pa + pb) / 2]
+
+    # Optimal position where the 3x3 system is well conditioned and the
+    # solution stays near the edge (thin or flat regions make it unstable)
+    optimal = candidates[2].copy()
+    system = qe[:, :3, :3]
+    solvable = np.abs(np.linalg.det(system)) > 1e-12
+    if solvable.any():
+        solved = np.linalg.solve(system[solvable], -qe[solvable, :3, 3][:, :, None])[:, :, 0]
+        reach = np.linalg.norm(pb[solvable] - pa[solvable], axis=1)
+        near = np.linalg.norm(solved - candidates[2][solvable], axis=1) <= reach
+        optimal[np.flatnonzero(solvable)[near]] = solved[near]
+    candidates.append(optimal)
+
+    errors = np.stack([_quadric_error(qe, c) for c in candidates], axis=1)
+    best = np.argmin(errors, axis=1)
+    rows = np.arange(len(edges))
+    targets = np.stack(candidates, axis=1)[rows, best]
+    return np.maximum(errors[rows, best], 0.0), targets
+
+
+def _independent_cheapest(edges: np.ndarray, cost: np.ndarray, vertex_count: int) -> np.ndarray:
+    """Indices of edges that are the cheapest edge at both endpoints (so share no vertex)."""
+    order = np.argsort(cost, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    ends = edges[order].reshape(-1)
+    vertices, first = np.unique(ends, return_index=True)
+    best = np.full(vertex_count, len(order), dtype=np.int64)
+    best[vertices] = first // 2
+    chosen = (best[edges[:, 0]] == rank) & (best[edges[:, 1]] == rank)
+    picked = np.flatnonzero(chosen)
+    return picked[np.argsort(cost[picked], kind='stable')]
+
+
+def _kept_faces(faces: np.ndarray) -> np.ndarray:
+    """Indices, in order, of triangles that are neither collapsed (repeated vertex) nor duplicates."""
+    alive = np.flatnonzero((faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2])
+                           & (faces[:, 0] != faces[:, 2]))
+    _, first = np.unique(np.sort(faces[alive], axis=1), axis=0, return_index=True)
+    return alive[np.sort(first)]
+
+
+# Ordered corner pairs (keep corner, gone corner) of a triangle
+CORNER_PAIRS = np.array([(i, j) for i in range(3) for j in range(3) if i != j])
+
+
+def _wedge_moves(faces: np.ndarray, corners: np.ndarray, collapses: np.ndarray,
+                 vertex_count: int) -> np.ndarray:
+    """Unique (collapse, gone wedge, kept wedge) rows from the triangles holding both ends of a collapse.
+
+    Each row says that corners of the gone vertex in that wedge continue,
+    across the collapsed edge, in that wedge of the kept vertex.
+    """
+    if not len(collapses) or not len(faces):
+        return np.empty((0, 3), dtype=np.int64)
+    keys = collapses[:, 0] * vertex_count + collapses[:, 1]
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    keep_corner, gone_corner = CORNER_PAIRS[:, 0], CORNER_PAIRS[:, 1]
+    pair_keys = (faces[:, keep_corner] * vertex_count + faces[:, gone_corner]).reshape(-1)
+    slot = np.minimum(np.searchsorted(sorted_keys, pair_keys), len(keys) - 1)
+    hit = sorted_keys[slot] == pair_keys
+    moves = np.stack([order[slot[hit]], corners[:, gone_corner].reshape(-1)[hit],
+                      corners[:, keep_corner].reshape(-1)[hit]], axis=1)
+    return np.unique(moves, axis=0)
+
+
+def _hold_seams(positions: np.ndarray, q: np.ndarray, faces: np.ndarray, corners: np.ndarray,
+                edges: np.ndarray, cost: np.ndarray,
+                targets: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Restrict collapses at wedge seams; returns (edges as keep -> gone, cost, targets).
+
+    A seam vertex (corners in several wedges) never moves: edges from it
+    are turned so the other end collapses onto it. Every wedge of the gone
+    vertex must continue in exactly one wedge of the kept vertex, so seam
+    vertices only collapse into each other along the seam.
+    """
+    n = len(positions)
+    wedge_vertex = np.zeros(int(corners.max()) + 1, dtype=np.int64)
+    wedge_vertex[corners.reshape(-1)] = faces.reshape(-1)
+    wedge_count = np.bincount(wedge_vertex[np.unique(corners)], minlength=n)
+    seam = wedge_count > 1
+    held = np.flatnonzero(seam[edges].any(axis=1))
+    if not len(held):
+        return edges, cost, targets
+
+    turn = seam[edges[:, 1]] & ~seam[edges[:, 0]]
+    edges = np.where(turn[:, None], edges[:, ::-1], edges)
+    keep_vertex, gone = edges[held, 0], edges[held, 1]
+    targets[held] = positions[keep_vertex]
+    cost[held] = np.maximum(_quadric_error(q[keep_vertex] + q[gone], targets[held]), 0.0)
+
+    moves = _wedge_moves(faces, corners, edges[held], n)
+    pairs, targets_per_wedge = np.unique(moves[:, :2], axis=0, return_counts=True)
+    ambiguous = np.zeros(len(held), dtype=bool)
+    ambiguous[pairs[targets_per_wedge > 1, 0]] = True
+    mapped = np.bincount(pairs[:, 0], minlength=len(held))
+    cost[held[ambiguous | (mapped != wedge_count[gone])]] = np.inf
+    return edges, cost, targets
+
+
+def _flipping(positions: np.ndarray, faces: np.ndarray, collapses: np.ndarray,
+              targets: np.ndarray) -> np.ndarray:
+    """Which collapses (vertex-disjoint edges a -> b) would flip or flatten a triangle."""
+    n = len(positions)
+    keep_vertex, gone = collapses[:, 0], collapses[:, 1]
+    remap = np.arange(n)
+    remap[gone] = keep_vertex
+    moved = positions.copy()
+    moved[keep_vertex] = targets
+    edge_of = np.full(n, -1)
+    edge_of[keep_vertex] = np.arange(len(collapses))
+    edge_of[gone] = np.arange(len(collapses))
+
+    touched = faces[(edge_of[faces] >= 0).any(axis=1)]
+    after_faces = remap[touched]
+    alive = ((after_faces[:, 0] != after_faces[:, 1]) & (after_faces[:, 1] != after_faces[:, 2])
+             & (after_faces[:, 0] != after_faces[:, 2]))
+    before, area = face_normals(positions, touched[alive])
+    after, _ = face_normals(moved, after_faces[alive])
+    flipped = ((before * after).sum(axis=1) < MIN_NORMAL_DOT) & (area > 0)
+
+    bad = edge_of[touched[alive][flipped]]
+    rejected = np.zeros(len(collapses), dtype=bool)
+    rejected[bad[bad >= 0]] = True
+    return rejected
+
+
+def _collapse_rounds(positions: np.ndarray, faces: np.ndarray, target_faces: int,
+                     corners: Optional[np.ndarray] = None
+                     ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, float]]:
+    """Yield (positions, faces, corners, error) before the first round and after each one.
+
+    corners gives the wedge of each triangle corner (see attribute_wedges);
+    without it every vertex is its own wedge and corners is faces. error is
+    the largest RMS distance (quadric error over the area it was
+    accumulated from) of the collapses made in that round.
+    """
+    positions = positions.astype(np.float64, copy=True)
+    faces = faces.astype(np.int64)
+    wedged = corners is not None
+    kept = _kept_faces(faces)
+    faces = faces[kept]
+    corners = corners.astype(np.int64)[kept] if wedged else faces
+    q = vertex_quadrics(positions, faces)
+    n = len(positions)
+    _, areas = face_normals(positions, faces)
+    area = np.bincount(faces.reshape(-1), weights=np.repeat(areas, 3), minlength=n)
+    yield positions, faces, corners, 0.0
+
+    for _ in range(MAX_ROUNDS):
+        excess = len(faces) - target_faces
+        if excess <= 0:
+            break
+        edges, _, _ = unique_edges(faces, n)
+        cost, targets = collapse_costs(positions, q, edges)
+        if wedged:
+            edges, cost, targets = _hold_seams(positions, q, faces, corners, edges, cost, targets)
+        # Each interior collapse removes about two triangles; capping a round
+        # keeps the collapses cheapest-first across the whole mesh
+        quota = max(1, (min(excess, int(len(faces) * MAX_ROUND_FRACTION)) + 1) // 2)
+
+        # Collapses rejected for flipping a triangle are blocked and the
+        # selection rerun, so one bad cheapest edge does not stall its area
+        accepted = np.zeros(0, dtype=np.int64)
+        locked = np.zeros(n, dtype=bool)
+        for _ in range(SELECTION_PASSES):
+            available = np.where(locked[edges].any(axis=1), np.inf, cost)
+            picked = _independent_cheapest(edges, available, n)
+            picked = picked[np.isfinite(available[picked])][:quota - len(accepted)]
+            if not len(picked):
+                break
+            trial = np.concatenate([accepted, picked])
+            rejected = _flipping(positions, faces, edges[trial], targets[trial])[len(accepted):]
+            locked[edges[picked].reshape(-1)] = True
+            cost[picked[rejected]] = np.inf
+            accepted = np.concatenate([accepted, picked[~rejected]])
+            if len(accepted) >= quota:
+                break
+        if not len(accepted):
+            break
+
+        keep_vertex, gone = edges[accepted, 0], edges[accepted, 1]
+        support = np.maximum(area[keep_vertex] + area[gone], 1e-300)
+        error = float(np.sqrt(cost[accepted] / support).max())
+        positions[keep_vertex] = targets[accepted]
+        q[keep_vertex] += q[gone]
+        area[keep_vertex] += area[gone]
+        remap = np.arange(n)
+        remap[gone] = keep_vertex
+        if wedged:
+            moves = _wedge_moves(faces, corners, edges[accepted], n)
+            wedge_remap = np.arange(int(corners.max()) + 1)
+            wedge_remap[moves[:, 1]] = moves[:, 2]
+            corners = wedge_remap[corners]
+        faces = remap[faces]
+        kept = _kept_faces(faces)
+        faces = faces[kept]
+        corners = corners[kept] if wedged else faces
+        yield positions, faces, corners, error
+
+
+def simplify(positions: np.ndarray, faces: np.ndarray, target_faces: int,
+             corners: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Collapse edges until at most target_faces triangles remain (or nothing can collapse).
+
+    Returns (positions, faces, wedge of each output triangle corner), the
+    wedges being those of corners or, without it, the source vertices.
+    """
+    for positions, faces, corners, _ in _collapse_rounds(positions, faces, target_faces, corners):
+        pass
+    used, compact = np.unique(faces, return_inverse=True)
+    return positions[used], compact.reshape(-1, 3), corners
+
+
+def error_curve(positions: np.ndarray, faces: np.ndarray, floor_faces: int,
+                corners: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(error, triangle count) after each round of decimating down to floor_faces.
+
+    Errors are a running maximum, so both arrays are monotonic: keeping
+    counts[k] triangles costs an RMS surface error of about errors[k].
+    """
+    errors, counts = [], []
+    for _, faces, _, error in _collapse_rounds(positions, faces, floor_faces, corners):
+        errors.append(max(error, errors[-1] if errors else 0.0))
+        counts.append(len(faces))
+    return np.array(errors), np.array(counts)
+
+
+def crease_normals(positions: np.ndarray, faces: np.ndarray, crease_angle: float = CREASE_ANGLE,
+                   corners: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Smooth normals, split where the surface bends more than crease_angle.
+
+    Normals are smoothed across wedges, but corners in different wedges
+    never share an output vertex. Returns (normals, faces over the split
+    vertices, index into faces.reshape(-1) of a corner of each).
+    """
+    normals, areas = face_normals(positions, faces)
+    weighted = np.repeat(normals * areas[:, None], 3, axis=0)
+    smooth = np.stack([np.bincount(faces.reshape(-1), weights=weighted[:, c], minlength=len(positions))
+                       for c in range(3)], axis=1)
+    length = np.linalg.norm(smooth, axis=1, keepdims=True)
+    smooth = np.divide(smooth, length, out=np.zeros_like(smooth), where=length > 0)
+
+    corner_vertex = faces.reshape(-1)
+    corner_face_normal = np.repeat(normals, 3, axis=0)
+    sharp = (corner_face_normal * smooth[corner_vertex]).sum(axis=1) < np.cos(np.radians(crease_angle))
+    # Sharp corners share a vertex with coplanar neighbours only
+    direction = np.where(sharp[:, None], np.round(corner_face_normal * 64), 1000).astype(np.int64)
+    split = corner_vertex if corners is None else corners.reshape(-1)
+    keys = np.concatenate([corner_vertex[:, None], split[:, None], direction], axis=1)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    vertex_normals = np.where(sharp[first, None], corner_face_normal[first], smooth[corner_vertex[first]])
+    return vertex_normals, inverse.reshape(-1, 3), first
+
+
+def _weld_primitive(attributes: Dict[str, np.ndarray], indices: Optional[np.ndarray],
+                    weld_tolerance: float) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], np.ndarray]:
+    """(welded positions, faces, corner wedges or None, input vertex of each wedge) of a primitive."""
+    positions = attributes['POSITION']
+    if indices is None:
+        indices = np.arange(len(positions))
+    faces = indices.reshape(-1, 3)
+    welded, vertex_map, first = weld_vertices(positions, weld_tolerance)
+    wedge_of, wedge_first = attribute_wedges(attributes, vertex_map)
+    if len(wedge_first) == len(welded):
+        # No seams: each welded vertex is one wedge, so vertices are the wedges
+        return welded, vertex_map[faces], None, first
+    return welded, vertex_map[faces], wedge_of[faces], wedge_first
+
+
+def decimate_primitive(attributes: Dict[str, np.ndarray], indices: Optional[np.ndarray],
+                       ratio: float, weld_tolerance: float = 0.0,
+                       target_faces: Optional[int] = None) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """Decimate one triangle primitive to ratio (or target_faces) of its triangles.
+
+    attributes maps glTF attribute names to per-vertex arrays (POSITION is
+    required). Attributes other than POSITION and NORMAL are carried over
+    per triangle corner from an input vertex of the corner's wedge.
+    """
+    welded, faces, corners, wedge_first = _weld_primitive(attributes, indices, weld_tolerance)
+    if target_faces is None:
+        target_faces = max(1, int(len(faces) * ratio))
+
+    new_positions, new_faces, corners = simplify(welded, faces, target_faces, corners)
+    if 'NORMAL' in attributes:
+        normals, split_faces, corner = crease_normals(new_positions, new_faces, corners=corners)
+    else:
+        _, corner, inverse = np.unique(corners.reshape(-1), return_index=True, return_inverse=True)
+        split_faces = inverse.reshape(-1, 3)
+    new_positions = new_positions[new_faces.reshape(-1)[corner]]
+    new_faces = split_faces
+    origin = wedge_first[corners.reshape(-1)[corner]]  # an input vertex for every output vertex
+
+    result = {'POSITION': new_positions.astype(np.float32)}
+    if 'NORMAL' in attributes:
+        result['NORMAL'] = normals.astype(np.float32)
+    for name, values in attributes.items():
+        if name not in result:
+            result[name] = values[origin]
+
+    index_type = np.uint16 if len(new_positions) < 65535 else np.uint32
+    return result, new_faces.reshape(-1).astype(index_type)
+
+
+def primitive_error_curve(attributes: Dict[str, np.ndarray], indices: Optional[np.ndarray],
+                          weld_tolerance: float = 0.0,
+                          floor_faces: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """error_curve() of one primitive, welded and seam-held the way decimate_primitive() does it."""
+    welded, faces, corners, _ = _weld_primitive(attributes, indices, weld_tolerance)
+    return error_curve(welded, faces, floor_faces, corners)
+
+
+def decimate_mesh(primitives: List[Tuple[Dict[str, np.ndarray], Optional[np.ndarray]]],
+                  ratio: float, weld_tolerance: float = 0.0,
+                  targets: Optional[List[int]] = None) -> List[Tuple[Dict[str, np.ndarray], np.ndarray]]:
+    """Decimate every primitive of one mesh (process-pool entry point).
+
+    targets, if given, is a triangle count per primitive and overrides ratio.
+    """
+    targets = targets or [None] * len(primitives)
+    return [decimate_primitive(attributes, indices, ratio, weld_tolerance, target)
+            for (attributes, indices), target in zip(primitives, targets)]
@@ -0,0 +1,268 @@
+"""
+Repeated-part detection and instancing for glTF meshes.
+
+CAD exports store every screw, post and mount as its own mesh, usually with
+the part's placement baked into the vertices. find_repeats() groups meshes
+that are the same part: identical index buffers, vertex counts, attributes
+and materials, and vertices that one rigid transform maps onto the other's
+within a tolerance. The transform is solved directly (Kabsch) since copies
+keep their vertex order; a rotation-invariant signature (the spread of the
+vertices along their principal axes) only narrows which meshes are compared.
+
+instance_repeats() then keeps one mesh per part and places the copies
+either as nodes sharing it or as EXT_mesh_gpu_instancing attributes on a
+single node, which three.js draws as one InstancedMesh.
+"""
+
+import hashlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import gltf_io
+
+TOLERANCE = 1e-4          # model units; vertices further apart make a different part
+SPREAD_BUCKET = 100       # signature rounding, in tolerances (coarse: it is only a filter)
+DIRECTION_TOLERANCE = 1e-3
+EXTENSION = 'EXT_mesh_gpu_instancing'
+
+Repeats = Dict[int, Tuple[int, np.ndarray]]
+
+
+def _positions(source: 'gltf_io.GltfFile', mesh: Dict) -> np.ndarray:
+    return np.concatenate([source.accessor(p['attributes']['POSITION'])
+                           for p in mesh['primitives']]).astype(np.float64)
+
+
+def part_key(source: 'gltf_io.GltfFile', mesh: Dict, tolerance: float = TOLERANCE) -> Optional[Tuple]:
+    """Hashable key equal for every copy of a part (None if the mesh cannot be instanced)."""
+    primitives = mesh['primitives']
+    if not primitives or any('targets' in p or p.get('mode', gltf_io.MODE_TRIANGLES)
+                             != gltf_io.MODE_TRIANGLES for p in primitives):
+        return None
+    digest = hashlib.sha1()
+    layout = []
+    for primitive in primitives:
+        count = source.json['accessors'][primitive['attributes']['POSITION']]['count']
+        layout.append((primitive.get('material'), tuple(sorted(primitive['attributes'])), count))
+        if 'indices' in primitive:
+            digest.update(source.accessor(primitive['indices']).astype(np.uint32).tobytes())
+
+    positions = _positions(source, mesh)
+    centred = positions - positions.mean(axis=0)
+    variance = np.linalg.eigvalsh(centred.T @ centred / max(1, len(centred)))
+    spread = np.round(np.sqrt(np.maximum(variance, 0)) / (tolerance * SPREAD_BUCKET)).astype(int)
+    return tuple(layout), digest.hexdigest(), tuple(spread.tolist())
+
+
+def rigid_transform(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, float]:
+    """4x4 rotation+translation best mapping points a onto b, and the largest residual."""
+    ca, cb = a.mean(axis=0), b.mean(axis=0)
+    u, _, vt = np.linalg.svd((a - ca).T @ (b - cb))
+    flip = np.sign(np.linalg.det(vt.T @ u.T)) or 1.0
+    rotation = vt.T @ np.diag([1.0, 1.0, flip]) @ u.T
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation
+    matrix[:3, 3] = cb - rotation @ ca
+    residual = np.linalg.norm(a @ rotation.T + matrix[:3, 3] - b, axis=1).max(initial=0.0)
+    return matrix, float(residual)
+
+
+def match(source: 'gltf_io.GltfFile', part: Dict, mesh: Dict,
+          tolerance: float = TOLERANCE) -> Optional[np.ndarray]:
+    """Transform placing part's geometry onto mesh, if mesh is a copy of it."""
+    transform, residual = rigid_transform(_positions(source, part), _positions(source, mesh))
+    if residual > tolerance:
+        return None
+    rotation = transform[:3, :3]
+    for mine, theirs in zip(part['primitives'], mesh['primitives']):
+        for name, index in mine['attributes'].items():
+            if name == 'POSITION':
+                continue
+            a = source.accessor(index).astype(np.float64)
+            b = source.accessor(theirs['attributes'][name]).astype(np.float64)
+            if name in ('NORMAL', 'TANGENT'):
+                a = np.concatenate([a[:, :3] @ rotation.T, a[:, 3:]], axis=1)
+                if not np.allclose(a, b, atol=DIRECTION_TOLERANCE):
+                    return None
+            elif not np.array_equal(a, b):
+                return None
+    return transform
+
+
+def find_repeats(source: 'gltf_io.GltfFile', candidates: List[int],
+                 tolerance: float = TOLERANCE) -> Repeats:
+    """{copy mesh: (kept mesh, transform of the kept mesh's vertices onto the copy's)}."""
+    meshes = source.json.get('meshes', [])
+    buckets: Dict[Tuple, List[int]] = defaultdict(list)
+    for i in candidates:
+        key = part_key(source, meshes[i], tolerance)
+        if key is not None:
+            buckets[key].append(i)
+
+    repeats: Repeats = {}
+    for members in buckets.values():
+        parts: List[int] = []
+        for i in members:
+            for part in parts:
+                transform = match(source, meshes[part], meshes[i], tolerance)
+                if transform is not None:
+                    repeats[i] = (part, transform)
+                    break
+            else:
+                parts.append(i)
+    return repeats
+
+
+def node_matrix(node: Dict) -> np.ndarray:
+    """A node's local 4x4 transform (matrix, or translation * rotation * scale)."""
+    if 'matrix' in node:
+        return np.array(node['matrix'], dtype=np.float64).reshape(4, 4).T
+    x, y, z, w = node.get('rotation', (0.0, 0.0, 0.0, 1.0))
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.array(node.get('scale', (1.0, 1.0, 1.0)))
+    matrix[:3, 3] = node.get('translation', (0.0, 0.0, 0.0))
+    return matrix
+
+
+def decompose(matrix: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """(translation, quaternion xyzw, scale) of matrix, or None if it has shear."""
+    basis = matrix[:3, :3]
+    scale = np.linalg.norm(basis, axis=0)
+    if not scale.all():
+        return None
+    if np.linalg.det(basis) < 0:
+        scale[0] = -scale[0]
+    rotation = basis / scale
+    if not np.allclose(rotation.T @ rotation, np.eye(3), atol=1e-5):
+        return None
+
+    trace = np.trace(rotation)
+    r = rotation
+    if trace > 0:
+        s = 2 * np.sqrt(1 + trace)
+        quaternion = [(r[2, 1] - r[1, 2]) / s, (r[0, 2] - r[2, 0]) / s, (r[1, 0] - r[0, 1]) / s, s / 4]
+    elif r[0, 0] > r[1, 1] and r[0, 0] > r[2, 2]:
+        s = 2 * np.sqrt(1 + r[0, 0] - r[1, 1] - r[2, 2])
+        quaternion = [s / 4, (r[0, 1] + r[1, 0]) / s, (r[0, 2] + r[2, 0]) / s, (r[2, 1] - r[1, 2]) / s]
+    elif r[1, 1] > r[2, 2]:
+        s = 2 * np.sqrt(1 + r[1, 1] - r[0, 0] - r[2, 2])
+        quaternion = [(r[0, 1] + r[1, 0]) / s, s / 4, (r[1, 2] + r[2, 1]) / s, (r[0, 2] - r[2, 0]) / s]
+    else:
+        s = 2 * np.sqrt(1 + r[2, 2] - r[0, 0] - r[1, 1])
+        quaternion = [(r[0, 2] + r[2, 0]) / s, (r[1, 2] + r[2, 1]) / s, s / 4, (r[1, 0] - r[0, 1]) / s]
+    quaternion = np.array(quaternion)
+    return matrix[:3, 3], quaternion / np.linalg.norm(quaternion), scale
+
+
+def _world_matrices(document: Dict) -> Tuple[Dict[int, np.ndarray], Dict[int, int]]:
+    """({node: world matrix}, {node: scene}) for nodes reachable from a scene."""
+    nodes = document.get('nodes', [])
+    world, scene_of = {}, {}
+    for s, scene in enumerate(document.get('scenes', [])):
+        stack = [(root, np.eye(4)) for root in scene.get('nodes', [])]
+        while stack:
+            index, parent = stack.pop()
+            if index in world:
+                continue
+            world[index] = parent @ node_matrix(nodes[index])
+            scene_of[index] = s
+            stack.extend((child, world[index]) for child in nodes[index].get('children', []))
+    return world, scene_of
+
+
+def _animated_nodes(document: Dict) -> set:
+    """Nodes whose transform can change at runtime (animation targets and their descendants)."""
+    nodes = document.get('nodes', [])
+    stack = [channel['target']['node'] for animation in document.get('animations', [])
+             for channel in animation['channels'] if 'node' in channel['target']]
+    animated = set()
+    while stack:
+        index = stack.pop()
+        if index not in animated:
+            animated.add(index)
+            stack.extend(nodes[index].get('children', []))
+    return animated
+
+
+def _share_mesh(document: Dict, node_index: int, part: int, transform: np.ndarray) -> None:
+    """Point a node at the kept mesh, through a child node when the copy was moved."""
+    node = document['nodes'][node_index]
+    if np.allclose(transform, np.eye(4), atol=1e-9):
+        node['mesh'] = part
+        return
+    del node['mesh']
+    document['nodes'].append({'name': f"{node.get('name', 'node')} instance", 'mesh': part,
+                              'matrix': transform.T.reshape(-1).tolist()})
+    node.setdefault('children', []).append(len(document['nodes']) - 1)
+
+
+def instance_repeats(document: Dict, repeats: Repeats, writer: 'gltf_io.GlbWriter',
+                     gpu: bool = True) -> Dict[str, int]:
+    """Re-point nodes using copy meshes at the kept mesh; returns counts per placement kind.
+
+    With gpu, every static placement of a part (copies and the original)
+    becomes one instance of a single EXT_mesh_gpu_instancing node; animated,
+    skinned or sheared placements, and multi-scene files, share the mesh
+    through plain nodes instead.
+    """
+    nodes = document.get('nodes', [])
+    placements: Dict[int, List[Tuple[int, np.ndarray]]] = defaultdict(list)
+    for i, node in enumerate(nodes):
+        if 'mesh' not in node:
+            continue
+        part, transform = repeats.get(node['mesh'], (node['mesh'], np.eye(4)))
+        placements[part].append((i, transform))
+
+    counts = {'instanced': 0, 'shared': 0}
+    world, scene_of = _world_matrices(document)
+    animated = _animated_nodes(document)
+    for part, placed in placements.items():
+        if not any(nodes[i]['mesh'] in repeats for i, _ in placed):
+            continue
+        static = (gpu and len(document.get('scenes', [])) == 1 and len(placed) > 1
+                  and all(i in world and i not in animated and 'skin' not in nodes[i]
+                          and 'weights' not in nodes[i] for i, _ in placed))
+        instances = [decompose(world[i] @ transform) for i, transform in placed] if static else []
+        if static and all(t is not None for t in instances):
+            attributes = {
+                name: writer.add_accessor(np.array([t[k] for t in instances], dtype=np.float32))
+                for k, name in enumerate(('TRANSLATION', 'ROTATION', 'SCALE'))
+            }
+            for i, _ in placed:
+                del nodes[i]['mesh']
+            nodes.append({'name': f"{document['meshes'][part].get('name', 'part')} instances",
+                          'mesh': part, 'extensions': {EXTENSION: {'attributes': attributes}}})
+            document['scenes'][0]['nodes'].append(len(nodes) - 1)
+            counts['instanced'] += len(placed)
+            continue
+        for i, transform in placed:
+            if nodes[i]['mesh'] in repeats:
+                _share_mesh(document, i, part, transform)
+                counts['shared'] += 1
+
+    if counts['instanced']:
+        for key in ('extensionsUsed', 'extensionsRequired'):
+            if EXTENSION not in document.setdefault(key, []):
+                document[key].append(EXTENSION)
+    return counts
+
+
+def remove_unused_meshes(document: Dict) -> int:
+    """Drop meshes no node uses and renumber the rest."""
+    meshes = document.get('meshes', [])
+    used = sorted({node['mesh'] for node in document.get('nodes', []) if 'mesh' in node})
+    if len(used) == len(meshes):
+        return 0
+    new_index = {old: new for new, old in enumerate(used)}
+    document['meshes'] = [meshes[i] for i in used]
+    for node in document.get('nodes', []):
+        if 'mesh' in node:
+            node['mesh'] = new_index[node['mesh']]
+    return len(meshes) - len(used)
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Anthropic API
+====================================
+
+Answers the requests smart-media-selector.py makes, so the analysis
+pipeline, retries and --bulk mode can be exercised without an API key or
+spending tokens. Replies are plausible analyses derived from the file names
+in the prompt, so runs are repeatable. The server records when each
+request arrived, how many were in flight at once and which it refused, so
+a client's retry and rate-limit behaviour can be checked afterwards.
+
+Serves:
+    POST /v1/messages                         one analysis batch
+    POST /v1/messages/batches                 create a bulk job
+    GET  /v1/messages/batches/{id}            job status (ends after --batch-duration)
+    GET  /v1/messages/batches/{id}/results    JSONL results
+
+Usage:
+    python utilities/mock-anthropic-server.py --port 8765 --latency 0.5 --failure-rate 0.05
+
+    # Also answer 10% with 429 rate_limit_error, asking for a 2s pause, and
+    # refuse every request containing IMG_0042.jpg with a 400
+    python utilities/mock-anthropic-server.py --rate-limit-rate 0.1 --retry-after 2 \
+        --reject-file IMG_0042.jpg
+
+    ANTHROPIC_API_KEY=test python utilities/smart-media-selector.py \
+        --photos-dir "/path/to/photos" --api-base-url http://127.0.0.1:8765 --bulk
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PHASES = ['design', 'illumination', 'imaging', 'electronics', 'software', 'result', 'general']
+FILE_LIST = re.compile(r'in order: (.*)\)')
+
+
+def fake_analyses(file_names: List[str]) -> List[Dict]:
+    """Deterministic analyses: the same file name always gets the same answer."""
+    analyses = []
+    for i, name in enumerate(file_names, 1):
+        digest = hashlib.sha256(name.encode()).digest()
+        analyses.append({
+            'index': i,
+            'file': name,
+            'description': f"Build photo {name}",
+            'quality_score': round(digest[0] / 25.5, 1),
+            'build_phase': PHASES[digest[1] % len(PHASES)],
+            'is_duplicate': False,
+        })
+    return analyses
+
+
+def request_files(params: Dict) -> List[str]:
+    """File names of the images in one analysis request, from its prompt line."""
+    content = params['messages'][0]['content']
+    text = ' '.join(c.get('text', '') for c in content if c.get('type') == 'text')
+    match = FILE_LIST.search(text)
+    names = match.group(1).split(', ') if match else []
+    images = sum(1 for c in content if c.get('type') == 'image')
+    return (names + [f"image-{k}" for k in range(len(names), images)])[:images]
+
+
+def answer(params: Dict) -> Dict:
+    """A Messages API response to one analysis request."""
+    names = request_files(params)
+    images = len(names)
+    return {
+        'id': f"msg_{uuid.uuid4().hex[:24]}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': params.get('model', 'mock'),
+        'content': [{'type': 'text', 'text': json.dumps(fake_analyses(names))}],
+        'stop_reason': 'end_turn',
+        'stop_sequence': None,
+        'usage': {'input_tokens': 800 * images, 'output_tokens': 60 * images},
+    }
+
+
+def _timestamp(t: Optional[float]) -> Optional[str]:
+    if t is None:
+        return None
+    return datetime.fromtimestamp(t, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class MockState:
+    """Server settings, the bulk jobs created so far and a log of /v1/messages traffic.
+
+    Times are time.monotonic() values, comparable with a client in the same
+    process.
+    """
+
+    def __init__(self, latency: float, failure_rate: float, batch_duration: float, seed: int,
+                 rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 reject_files: Iterable[str] = ()):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.reject_files = set(reject_files)
+        self.batch_duration = batch_duration
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Dict] = {}
+        self.requests_served = 0
+        self.arrivals: List[float] = []
+        self.refusals: List[Tuple[float, int]] = []  # (time, status) of every error reply
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def fails(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.failure_rate
+
+    def transient_status(self) -> Optional[int]:
+        """529 or 429 for the requests drawn to fail, else None."""
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.failure_rate:
+            return 529
+        if draw < self.failure_rate + self.rate_limit_rate:
+            return 429
+        return None
+
+    def job_object(self, job: Dict, base_url: str) -> Dict:
+        total = len(job['requests'])
+        progress = min(1.0, (time.time() - job['created']) / self.batch_duration) \
+            if self.batch_duration > 0 else 1.0
+        done = int(total * progress)
+        ended = done == total
+        errored = sum(1 for r in job['requests'][:done] if r['errored'])
+        return {
+            'id': job['id'],
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {'processing': total - done, 'succeeded': done - errored,
+                               'errored': errored, 'canceled': 0, 'expired': 0},
+            'created_at': _timestamp(job['created']),
+            'expires_at': _timestamp(job['created'] + 86400),
+            'ended_at': _timestamp(job['created'] + self.batch_duration) if ended else None,
+            'cancel_initiated_at': None,
+            'archived_at': None,
+            'results_url': f"{base_url}/v1/messages/batches/{job['id']}/results" if ended else None,
+        }
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str = 'application/json',
+                  headers: Optional[Dict[str, str]] = None) -> None:
+            self.send_response(status)
+            self.send_header('content-type', content_type)
+            self.send_header('content-length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, obj: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+            self._send(status, json.dumps(obj).encode(), headers=headers)
+
+        def _error(self, status: int, kind: str, message: str) -> None:
+            self._json(status, {'type': 'error', 'error': {'type': kind, 'message': message}},
+                       {'retry-after': f"{state.retry_after:g}"} if status in (429, 529) else None)
+
+        def _messages(self, body: Dict) -> None:
+            time.sleep(state.latency)
+            rejected = state.reject_files.intersection(request_files(body))
+            status = 400 if rejected else state.transient_status()
+            if status is not None:
+                with state.lock:
+                    state.refusals.append((time.monotonic(), status))
+            if status == 400:
+                self._error(400, 'invalid_request_error',
+                            f"Could not process image {sorted(rejected)[0]} (mock)")
+            elif status == 529:
+                self._error(529, 'overloaded_error', 'Overloaded (mock)')
+            elif status == 429:
+                self._error(429, 'rate_limit_error', 'Rate limited (mock)')
+            else:
+                with state.lock:
+                    state.requests_served += 1
+                self._json(200, answer(body), {
+                    'anthropic-ratelimit-requests-limit': '1000',
+                    'anthropic-ratelimit-requests-remaining': '999',
+                })
+
+        @property
+        def base_url(self) -> str:
+            return f"http://{self.headers.get('host', 'localhost')}"
+
+        def do_POST(self) -> None:
+            body = json.loads(self.rfile.read(int(self.headers.get('content-length', 0))) or b'{}')
+            path = self.path.split('?')[0]
+
+            if path == '/v1/messages':
+                with state.lock:
+                    state.arrivals.append(time.monotonic())
+                    state.in_flight += 1
+                    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+                try:
+                    self._messages(body)
+                finally:
+                    with state.lock:
+                        state.in_flight -= 1
+            elif path == '/v1/messages/batches':
+                job_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+                job = {'id': job_id, 'created': time.time(), 'requests': [
+                    {'custom_id': r['custom_id'], 'params': r['params'], 'errored': state.fails()}
+                    for r in body.get('requests', [])
+                ]}
+                with state.lock:
+                    state.jobs[job_id] = job
+                self._json(200, state.job_object(job, self.base_url))
+            else:
+                self._error(404, 'not_found_error', f"No route for POST {path}")
+
+        def do_GET(self) -> None:
+            parts = self.path.split('?')[0].strip('/').split('/')
+            job = state.jobs.get(parts[3]) if len(parts) >= 4 and parts[:3] == ['v1', 'messages', 'batches'] else None
+            if job is None:
+                self._error(404, 'not_found_error', f"No route for GET {self.path}")
+            elif len(parts) == 4:
+                self._json(200, state.job_object(job, self.base_url))
+            elif len(parts) == 5 and parts[4] == 'results':
+                lines = []
+                for request in job['requests']:
+                    if request['errored']:
+                        result = {'type': 'errored', 'error': {'type': 'error', 'error': {
+                            'type': 'api_error', 'message': 'Internal error (mock)'}}}
+                    else:
+                        result = {'type': 'succeeded', 'message': answer(request['params'])}
+                    lines.append(json.dumps({'custom_id': request['custom_id'], 'result': result}))
+                self._send(200, ('\n'.join(lines) + '\n').encode(), 'application/x-jsonl')
+            else:
+                self._error(404, 'not_found_error', f"No route for GET {self.path}")
+
+    return Handler
+
+
+def serve(port: int = 8765, latency: float = 0.0, failure_rate: float = 0.0,
+          batch_duration: float = 5.0, seed: int = 0, rate_limit_rate: float = 0.0,
+          retry_after: float = 1.0, reject_files: Iterable[str] = ()) -> ThreadingHTTPServer:
+    """Start the server on a background thread and return it (call .shutdown() to stop)."""
+    state = MockState(latency, failure_rate, batch_duration, seed,
+                      rate_limit_rate, retry_after, reject_files)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Anthropic API')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (127.0.0.1)')
+    parser.add_argument('--latency', type=float, default=0.3, help='Seconds per /v1/messages reply')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Fraction of requests answered 529 (and bulk requests errored)')
+    parser.add_argument('--batch-duration', type=float, default=5.0,
+                        help='Seconds until a bulk job ends')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='Fraction of requests answered 429 rate_limit_error')
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                        help='Seconds sent in the retry-after header of 429/529 replies')
+    parser.add_argument('--reject-file', action='append', default=[], metavar='NAME',
+                        help='Answer 400 to every request containing this file (repeatable)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the failure draws')
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.failure_rate, args.batch_duration, args.seed,
+                   args.rate_limit_rate, args.retry_after, args.reject_file)
+    print(f"🧪 Mock Anthropic API on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
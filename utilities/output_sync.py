@@ -0,0 +1,131 @@
+"""
+Idempotent output sync for the website media folders.
+
+Each output directory keeps a small manifest (.media-sync.json) recording,
+for every output it owns, the source's content hash, a key over the
+conversion parameters, and the files that conversion wrote. A run then only
+converts selections whose source or parameters changed, and deletes the
+files of outputs that are no longer selected.
+
+Output names are derived from the source content (build-{date}-{hash}), not
+from the selection order, so adding or removing one photo leaves every
+other file name, and the website's cached copies of it, untouched. Only
+files listed in the manifest are ever pruned; anything else in the folder
+is left alone.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_NAME = '.media-sync.json'
+MANIFEST_VERSION = 1
+
+
+def params_key(**params) -> str:
+    """Short stable hash of conversion parameters (order-insensitive)."""
+    encoded = json.dumps(params, sort_keys=True, default=list)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+
+def public_url(path: Path) -> str:
+    """URL of a file under website/public (falls back to the plain path)."""
+    parts = Path(path).resolve().parts
+    if 'public' in parts:
+        return '/' + '/'.join(parts[len(parts) - parts[::-1].index('public'):])
+    return str(path)
+
+
+def output_stem(content_hash: str, date: Optional[datetime], prefix: str = 'build') -> str:
+    """Content-derived output name: stable across runs and selection order."""
+    date_str = date.strftime('%Y%m%d') if date else 'undated'
+    return f"{prefix}-{date_str}-{content_hash[:10]}"
+
+
+class OutputManifest:
+    """The outputs one directory owns, keyed by output stem."""
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.path = output_dir / MANIFEST_NAME
+        self.outputs: Dict[str, Dict] = {}
+        self.kept: set = set()
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get('version') == MANIFEST_VERSION:
+                self.outputs = data.get('outputs', {})
+        except (OSError, ValueError):
+            pass
+
+    def up_to_date(self, stem: str, source_hash: str, key: str) -> bool:
+        """True if stem was written from this source with these parameters and is still on disk."""
+        record = self.outputs.get(stem)
+        if (record is None or record['source_hash'] != source_hash
+                or record['params'] != key or not record['files']):
+            return False
+        return all((self.output_dir / name).exists() for name in record['files'])
+
+    def get(self, stem: str) -> Optional[Dict]:
+        return self.outputs.get(stem)
+
+    def keep(self, stem: str) -> None:
+        """Mark an output as still selected, so prune() leaves it."""
+        self.kept.add(stem)
+
+    def record(self, stem: str, source: Path, source_hash: str, key: str,
+               files: Iterable[str], entry: Optional[Dict] = None) -> None:
+        """Store a finished conversion; files are names relative to the output directory.
+
+        Files the previous conversion of stem wrote but this one did not (a
+        dropped format or width) are deleted, unless another kept output
+        still lists them.
+        """
+        files = sorted(set(files))
+        previous = self.outputs.get(stem)
+        if previous is not None:
+            still_owned = {name for other in self.kept if other != stem
+                           for name in self.outputs[other]['files']}
+            for name in set(previous['files']) - set(files) - still_owned:
+                self._remove(name)
+        self.outputs[stem] = {
+            'source': str(source),
+            'source_hash': source_hash,
+            'params': key,
+            'files': files,
+            'entry': entry,
+        }
+        self.kept.add(stem)
+
+    def prune(self) -> List[str]:
+        """Delete the files of every output not kept this run; returns the pruned stems."""
+        still_owned = {name for stem in self.kept for name in self.outputs[stem]['files']}
+        pruned = []
+        for stem in sorted(set(self.outputs) - self.kept):
+            for name in self.outputs.pop(stem)['files']:
+                if name not in still_owned:
+                    self._remove(name)
+            pruned.append(stem)
+        return pruned
+
+    def _remove(self, name: str) -> None:
+        path = self.output_dir / name
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        elif path.exists():
+            path.unlink()
+
+    def save(self) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({'version': MANIFEST_VERSION, 'outputs': self.outputs},
+                                       indent=2, sort_keys=True))
+        os.replace(tmp_path, self.path)
+
+
+def srcset_files(entry: Dict) -> List[str]:
+    """Names of every file a responsive-image manifest entry refers to."""
+    return [f['url'].rsplit('/', 1)[-1] for source in entry['sources'] for f in source['files']]
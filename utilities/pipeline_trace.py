@@ -0,0 +1,274 @@
+"""
+Opt-in tracing for the media scripts.
+
+Records stage and per-file spans, byte and token counters, and latency
+histograms (API requests, ffmpeg runs), then exports them as Chrome
+trace-event JSON (open in chrome://tracing or https://ui.perfetto.dev) and
+as a summary table. Tracing is off unless enable() is called; while off,
+span() returns a shared no-op context manager and the other calls return
+immediately, so instrumented code pays only a method call.
+
+Work done in process pools is traced by running it through pool_map() or
+run_in_executor(): the worker records into its own tracer and sends the
+events back with the result, so every process gets its own lane.
+"""
+
+import os
+import json
+import time
+import bisect
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def set(self, **args) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start', 'async_id')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Dict,
+                 async_id: Optional[int]):
+        self.tracer, self.name, self.cat, self.args = tracer, name, cat, args
+        self.async_id = async_id
+
+    def __enter__(self) -> '_Span':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.cat, self.start, time.perf_counter() - self.start,
+                           self.args, self.async_id)
+
+    def set(self, **args) -> None:
+        """Attach arguments known only once the work is done (sizes, token counts)."""
+        self.args.update(args)
+
+
+class Tracer:
+    """Events, counters and histograms for one process."""
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.events: List[Dict] = []
+        self.counters: Dict[str, float] = {}
+        self.samples: Dict[str, List[float]] = {}
+        self.next_async_id = 0
+
+    def span(self, name: str, cat: str = 'stage', overlapping: bool = False, **args):
+        """Context manager timing a block.
+
+        Spans that overlap others on the same thread (concurrent asyncio
+        requests) need overlapping=True so they get their own track.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        async_id = None
+        if overlapping:
+            with self.lock:
+                self.next_async_id += 1
+                async_id = self.next_async_id
+        return _Span(self, name, cat, args, async_id)
+
+    def record(self, name: str, cat: str, start: float, duration: float,
+               args: Optional[Dict] = None, async_id: Optional[int] = None) -> None:
+        event = {'name': name, 'cat': cat, 'ts': start, 'dur': duration,
+                 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args or {}}
+        if async_id is not None:
+            event['id'] = async_id
+        with self.lock:
+            self.events.append(event)
+            self.samples.setdefault(f"{cat}:{name}", []).append(duration)
+
+    def count(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_file(self, name: str, path: Path) -> None:
+        """Add a file's size to a byte counter (the stat only happens when enabled)."""
+        if not self.enabled:
+            return
+        try:
+            self.count(name, os.stat(path).st_size)
+        except OSError:
+            pass
+
+    def drain(self) -> Dict:
+        """Take everything recorded so far (used to ship worker events to the parent)."""
+        with self.lock:
+            payload = {'events': self.events, 'counters': self.counters}
+            self.events, self.counters, self.samples = [], {}, {}
+        return payload
+
+    def merge(self, payload: Dict) -> None:
+        with self.lock:
+            for event in payload['events']:
+                self.events.append(event)
+                self.samples.setdefault(f"{event['cat']}:{event['name']}", []).append(event['dur'])
+            for name, value in payload['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def chrome_trace(self) -> Dict:
+        """Trace-event JSON: complete events for spans, async begin/end pairs for overlapping ones."""
+        with self.lock:
+            events = list(self.events)
+            counters = dict(self.counters)
+        origin = min((e['ts'] for e in events), default=0.0)
+        trace = []
+        for e in events:
+            ts = round((e['ts'] - origin) * 1e6, 1)
+            base = {'name': e['name'], 'cat': e['cat'], 'pid': e['pid'], 'tid': e['tid']}
+            if 'id' in e:
+                trace.append({**base, 'ph': 'b', 'id': e['id'], 'ts': ts, 'args': e['args']})
+                trace.append({**base, 'ph': 'e', 'id': e['id'],
+                              'ts': round(ts + e['dur'] * 1e6, 1)})
+            else:
+                trace.append({**base, 'ph': 'X', 'ts': ts, 'dur': round(e['dur'] * 1e6, 1),
+                              'args': e['args']})
+        for pid in sorted({e['pid'] for e in events}):
+            label = 'main' if pid == os.getpid() else 'worker'
+            trace.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                          'args': {'name': f"{label} {pid}"}})
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms', 'otherData': {'counters': counters}}
+
+    def write_chrome_trace(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self.chrome_trace()))
+        os.replace(tmp_path, path)
+        return path
+
+    def print_summary(self) -> None:
+        """Per-stage and per-file timing table, counters and latency histograms."""
+        with self.lock:
+            samples = {k: sorted(v) for k, v in self.samples.items()}
+            counters = dict(self.counters)
+
+        print(f"\n🔬 Trace summary")
+        print(f"   {'span':<28} {'count':>7} {'total s':>9} {'mean s':>8} "
+              f"{'p50 s':>8} {'p95 s':>8} {'max s':>8}")
+        for key in sorted(samples, key=lambda k: -sum(samples[k])):
+            values = samples[key]
+            n = len(values)
+            print(f"   {key:<28} {n:>7} {sum(values):>9.2f} {sum(values) / n:>8.3f} "
+                  f"{values[n // 2]:>8.3f} {values[min(n - 1, int(n * 0.95))]:>8.3f} "
+                  f"{values[-1]:>8.3f}")
+
+        if counters:
+            print(f"\n   {'counter':<28} {'value':>14}")
+            for name in sorted(counters):
+                value = counters[name]
+                shown = f"{value / 1e6:,.1f} MB" if name.startswith('bytes') else f"{value:,.0f}"
+                print(f"   {name:<28} {shown:>14}")
+
+        for key in ('api:request', 'ffmpeg:ffmpeg'):
+            if key in samples:
+                print(f"\n   {key} latency histogram")
+                buckets = latency_histogram(samples[key])
+                used = [k for k, (_, n) in enumerate(buckets) if n]
+                for label, n in buckets[used[0]:used[-1] + 1]:
+                    print(f"   {label:>10} {n:>6}  {'█' * min(50, n)}")
+
+
+def latency_histogram(values: Iterable[float],
+                      buckets: Iterable[float] = LATENCY_BUCKETS) -> List[tuple]:
+    """[(label, count)] over the bucket upper bounds, plus an overflow bucket."""
+    bounds = list(buckets)
+    counts = [0] * (len(bounds) + 1)
+    for value in values:
+        counts[bisect.bisect_left(bounds, value)] += 1
+    labels = [f"≤{b:g}s" for b in bounds] + [f">{bounds[-1]:g}s"]
+    return list(zip(labels, counts))
+
+
+TRACER = Tracer()
+span = TRACER.span
+count = TRACER.count
+count_file = TRACER.count_file
+
+
+def enable() -> None:
+    TRACER.enabled = True
+
+
+def enabled() -> bool:
+    return TRACER.enabled
+
+
+def run(cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run, traced as an ffmpeg/ffprobe span when tracing is on."""
+    with span(Path(cmd[0]).name, cat='ffmpeg', cmd=' '.join(map(str, cmd[1:]))[:500]):
+        return subprocess.run(cmd, **kwargs)
+
+
+def _call_traced(fn: Callable, *args):
+    """Worker side of pool_map/run_in_executor: run fn with tracing, return (result, events)."""
+    TRACER.enabled = True
+    TRACER.drain()  # forked workers inherit the parent's buffers
+    result = fn(*args)
+    return result, TRACER.drain()
+
+
+def pool_map(pool, fn: Callable, iterable: Iterable, chunksize: int = 1) -> Iterator:
+    """pool.map that collects the workers' trace events when tracing is on."""
+    if not TRACER.enabled:
+        return pool.map(fn, iterable, chunksize=chunksize)
+
+    def unwrap(results: Iterator) -> Iterator:
+        for result, payload in results:
+            TRACER.merge(payload)
+            yield result
+
+    return unwrap(pool.map(_call_traced, itertools.repeat(fn), iterable, chunksize=chunksize))
+
+
+def submit(pool, fn: Callable, *args) -> Future:
+    """pool.submit that collects the worker's trace events when tracing is on."""
+    if not TRACER.enabled:
+        return pool.submit(fn, *args)
+    outer: Future = Future()
+
+    def done(inner: Future) -> None:
+        try:
+            result, payload = inner.result()
+        except BaseException as e:
+            outer.set_exception(e)
+            return
+        TRACER.merge(payload)
+        outer.set_result(result)
+
+    pool.submit(_call_traced, fn, *args).add_done_callback(done)
+    return outer
+
+
+async def run_in_executor(loop, pool, fn: Callable, *args):
+    """loop.run_in_executor that collects the worker's trace events when tracing is on."""
+    if not TRACER.enabled:
+        return await loop.run_in_executor(pool, fn, *args)
+    result, payload = await loop.run_in_executor(pool, _call_traced, fn, *args)
+    TRACER.merge(payload)
+    return result
@@ -4,35 +4,57 @@ Photo Selection and Conversion Script for rsLSM v1.1 Website
 
 This script:
 1. Scans the photos folder for images (HEIC, JPG, PNG)
-2. Reads metadata to get dates
+2. Reads capture dates from file headers (EXIF / QuickTime) into a catalog,
+   re-reading only files that changed since the last run
 3. Selects photos spread across the build timeline
-4. Converts HEIC to JPEG
-5. Copies selected photos to the website public folder
+4. Converts HEIC to JPEG, plus 320-1600px JPEG/WebP/AVIF copies for srcset
+5. Copies selected photos to the website public folder, with a
+   responsive-images.json manifest of every file's size and dimensions
+6. Skips photos already converted by an earlier run (tracked in
+   .media-sync.json) and removes outputs that are no longer selected
 
 Usage:
     python scripts/select-photos.py --photos-dir "/path/to/photos" --output-dir "website/public/images/photos" --count 12
 
+    Add --watch to keep running and pick up new photos as they are copied in.
+
+    --poster-video picks the best frame (sharpness, brightness, detail) as the
+    poster unless --poster-timestamp is given.
+
+    --trace run.json writes stage, per-file and ffmpeg timings as Chrome
+    trace-event JSON and prints a summary table.
+
 Requirements:
-    pip install Pillow pillow-heif exifread
+    pip install Pillow pillow-heif numpy
 """
 
-import os
 import sys
 import shutil
 import argparse
 from datetime import datetime
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import subprocess
 
+from media_catalog import DEFAULT_CATALOG_PATH, MediaCatalog
+import output_sync
+import pipeline_trace
+
 # Try to import optional dependencies
 try:
-    from PIL import Image
+    import media_derivatives
     HAS_PIL = True
 except ImportError:
     HAS_PIL = False
     print("Warning: Pillow not installed. Run: pip install Pillow")
 
+try:
+    import numpy as np
+    import media_quality
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 try:
     import pillow_heif
     pillow_heif.register_heif_opener()
@@ -41,63 +63,18 @@ except ImportError:
     HAS_HEIF = False
     print("Warning: pillow-heif not installed. Run: pip install pillow-heif")
 
-try:
-    import exifread
-    HAS_EXIF = True
-except ImportError:
-    HAS_EXIF = False
-    print("Warning: exifread not installed. Run: pip install exifread")
 
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.heic', '.heif', '.mov', '.mp4'}
 
-def get_image_date(filepath: Path) -> Optional[datetime]:
-    """Extract date from image metadata or filename."""
 
-    # Try EXIF data first
-    if HAS_EXIF:
-        try:
-            with open(filepath, 'rb') as f:
-                tags = exifread.process_file(f, details=False)
-
-            # Try different date tags
-            date_tags = [
-                'EXIF DateTimeOriginal',
-                'EXIF DateTimeDigitized',
-                'Image DateTime'
-            ]
-
-            for tag in date_tags:
-                if tag in tags:
-                    date_str = str(tags[tag])
-                    try:
-                        return datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-                    except ValueError:
-                        continue
-        except Exception:
-            pass
-
-    # Fall back to file modification time
-    try:
-        mtime = os.path.getmtime(filepath)
-        return datetime.fromtimestamp(mtime)
-    except Exception:
-        return None
-
-
-def find_images(photos_dir: Path) -> List[Tuple[Path, Optional[datetime]]]:
-    """Find all images and their dates in the photos directory."""
-
-    image_extensions = {'.jpg', '.jpeg', '.png', '.heic', '.heif', '.mov', '.mp4'}
-    images = []
+def find_images(photos_dir: Path, catalog: MediaCatalog) -> List[Tuple[Path, Optional[datetime]]]:
+    """Refresh the catalog for photos_dir and return all images with their dates."""
 
-    for root, dirs, files in os.walk(photos_dir):
-        for filename in files:
-            ext = Path(filename).suffix.lower()
-            if ext in image_extensions:
-                filepath = Path(root) / filename
-                date = get_image_date(filepath)
-                images.append((filepath, date))
+    result = catalog.refresh(photos_dir, IMAGE_EXTENSIONS)
+    print(f"   Catalog: {len(result.added)} new, {len(result.updated)} changed, "
+          f"{len(result.removed)} removed")
 
-    return images
+    return [(entry.path, entry.date) for entry in catalog.query(photos_dir, IMAGE_EXTENSIONS)]
 
 
 def select_photos_by_date(images: List[Tuple[Path, Optional[datetime]]], count: int) -> List[Path]:
@@ -121,8 +98,13 @@ def select_photos_by_date(images: List[Tuple[Path, Optional[datetime]]], count:
     return selected
 
 
-def convert_heic_to_jpeg(input_path: Path, output_path: Path) -> bool:
-    """Convert HEIC image to JPEG."""
+def convert_heic_to_jpeg(input_path: Path, output_path: Path,
+                         srcset_entries: Optional[Dict[str, Dict]] = None) -> bool:
+    """Convert an image to JPEG plus smaller responsive WebP/AVIF/JPEG copies.
+
+    output_path is the full-size JPEG; its srcset manifest entry is stored in
+    srcset_entries under the output stem.
+    """
 
     if not HAS_PIL:
         print(f"  Cannot convert {input_path.name}: Pillow not installed")
@@ -131,7 +113,7 @@ def convert_heic_to_jpeg(input_path: Path, output_path: Path) -> bool:
     if not HAS_HEIF and input_path.suffix.lower() in ['.heic', '.heif']:
         # Try using sips (macOS built-in)
         try:
-            subprocess.run([
+            pipeline_trace.run([
                 'sips', '-s', 'format', 'jpeg',
                 str(input_path), '--out', str(output_path)
             ], check=True, capture_output=True)
@@ -141,34 +123,30 @@ def convert_heic_to_jpeg(input_path: Path, output_path: Path) -> bool:
             return False
 
     try:
-        with Image.open(input_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-
-            # Resize if too large (max 2000px on longest side)
-            max_size = 2000
-            if max(img.size) > max_size:
-                ratio = max_size / max(img.size)
-                new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-                img = img.resize(new_size, Image.LANCZOS)
-
-            # Save as JPEG with good quality
-            img.save(output_path, 'JPEG', quality=85, optimize=True)
-
+        # One decode -> every srcset width in JPEG/WebP/AVIF (max 2000px on longest side)
+        with pipeline_trace.span('convert_image', cat='file', file=input_path.name):
+            pipeline_trace.count_file('bytes_read', input_path)
+            entry = media_derivatives.write_derivatives(input_path, output_path.parent,
+                                                        output_path.stem, max_size=2000)
+        if srcset_entries is not None:
+            srcset_entries[output_path.stem] = entry
         return True
     except Exception as e:
         print(f"  Error converting {input_path.name}: {e}")
         return False
 
 
-def process_photos(photos_dir: Path, output_dir: Path, count: int = 12) -> List[str]:
+def process_photos(photos_dir: Path, output_dir: Path, count: int = 12,
+                   catalog: Optional[MediaCatalog] = None) -> List[str]:
     """Main function to process and copy photos."""
 
     print(f"\n📷 Scanning for images in: {photos_dir}")
 
     # Find all images
-    images = find_images(photos_dir)
+    catalog = catalog or MediaCatalog()
+    with pipeline_trace.span('scan'):
+        images = find_images(photos_dir, catalog)
+    dates = dict(images)
     print(f"   Found {len(images)} images")
 
     if not images:
@@ -177,54 +155,132 @@ def process_photos(photos_dir: Path, output_dir: Path, count: int = 12) -> List[
 
     # Select photos spread across timeline
     print(f"\n📅 Selecting {count} photos spread across timeline...")
-    selected = select_photos_by_date(images, count)
+    with pipeline_trace.span('select'):
+        selected = select_photos_by_date(images, count)
     print(f"   Selected {len(selected)} photos")
 
     # Create output directory
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Process selected photos
+    # Process selected photos; unchanged outputs from earlier runs are kept as they are
     print(f"\n🔄 Processing and copying photos to: {output_dir}")
     processed = []
-
-    for i, filepath in enumerate(selected, 1):
-        ext = filepath.suffix.lower()
-
-        # Generate output filename
-        date = get_image_date(filepath)
-        date_str = date.strftime('%Y%m%d') if date else f'photo{i:02d}'
-        output_name = f"build-{date_str}-{i:02d}.jpg"
-        output_path = output_dir / output_name
-
-        print(f"   [{i}/{len(selected)}] {filepath.name} -> {output_name}")
-
-        if ext in ['.heic', '.heif']:
-            # Convert HEIC to JPEG
-            if convert_heic_to_jpeg(filepath, output_path):
+    srcset_entries = {}
+    sync = output_sync.OutputManifest(output_dir)
+    key = output_sync.params_key(max_size=2000, responsive=HAS_PIL)
+    hashes = catalog.ensure_hashes(selected)
+
+    with pipeline_trace.span('convert', files=len(selected)):
+        for i, filepath in enumerate(selected, 1):
+            ext = filepath.suffix.lower()
+            if ext in ['.mov', '.mp4']:
+                # Skip videos in photo selection
+                print(f"   [{i}/{len(selected)}] {filepath.name}: skipping video file")
+                continue
+            source_hash = hashes.get(filepath)
+            if not source_hash:
+                print(f"   [{i}/{len(selected)}] {filepath.name}: cannot read file")
+                continue
+
+            # Output name follows the content, so it survives changes to the selection
+            stem = output_sync.output_stem(source_hash, dates.get(filepath))
+            output_name = f"{stem}.jpg"
+            output_path = output_dir / output_name
+
+            if sync.up_to_date(stem, source_hash, key):
+                print(f"   [{i}/{len(selected)}] {filepath.name} -> {output_name} (unchanged)")
+                sync.keep(stem)
+                if sync.get(stem)['entry'] is not None:
+                    srcset_entries[stem] = sync.get(stem)['entry']
                 processed.append(output_name)
-        elif ext in ['.jpg', '.jpeg', '.png']:
-            # Copy and optionally resize
-            if HAS_PIL:
-                convert_heic_to_jpeg(filepath, output_path)  # Reuse for resizing
+                continue
+
+            print(f"   [{i}/{len(selected)}] {filepath.name} -> {output_name}")
+            entries = {}
+            if HAS_PIL or ext in ['.heic', '.heif']:
+                # Convert HEIC to JPEG (also used to resize JPEG/PNG)
+                if not convert_heic_to_jpeg(filepath, output_path, entries):
+                    continue
             else:
                 shutil.copy2(filepath, output_path)
+            entry = entries.get(stem)
+            if entry is not None:
+                srcset_entries[stem] = entry
+            sync.record(stem, filepath, source_hash, key,
+                        output_sync.srcset_files(entry) if entry else [output_name], entry)
             processed.append(output_name)
-        elif ext in ['.mov', '.mp4']:
-            # Skip videos in photo selection
-            print(f"      Skipping video file")
+
+        pruned = sync.prune()
+        sync.save()
+        if pruned:
+            print(f"   Removed {len(pruned)} photos that are no longer selected")
+
+        if HAS_PIL and (srcset_entries or pruned):
+            manifest_path = media_derivatives.write_srcset_manifest(output_dir, srcset_entries)
+            print(f"   Wrote srcset manifest: {manifest_path}")
 
     print(f"\n✅ Processed {len(processed)} photos")
     return processed
 
 
-def extract_poster_frame(video_path: Path, output_path: Path, timestamp: float = 1.0) -> bool:
-    """Extract a frame from video to use as poster image."""
+def find_poster_timestamp(video_path: Path, sample_rate: float = 2.0, size: int = 256,
+                          chunk_frames: int = 256) -> Optional[float]:
+    """Time (seconds) of the best poster frame, from one downscaled decode pass.
+
+    ffmpeg samples `sample_rate` frames per second, scales them to size x size
+    grayscale and streams them as raw bytes; they are scored in chunks with
+    NumPy so memory stays flat however long the video is.
+    """
+    cmd = [
+        'ffmpeg', '-v', 'error', '-nostdin', '-i', str(video_path),
+        '-vf', f'fps={sample_rate},scale={size}:{size},format=gray',
+        '-f', 'rawvideo', 'pipe:1'
+    ]
+    with pipeline_trace.span('ffmpeg', cat='ffmpeg', cmd=' '.join(cmd[1:])):
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        frame_bytes = size * size
+        best_score, best_index, index = -1.0, None, 0
+        while True:
+            data = process.stdout.read(frame_bytes * chunk_frames)
+            count = len(data) // frame_bytes
+            if count == 0:
+                break
+            frames = np.frombuffer(data[:count * frame_bytes], dtype=np.uint8).reshape(count, size, size)
+            scores = media_quality.poster_scores(frames)
+            k = int(np.argmax(scores))
+            if scores[k] > best_score:
+                best_score, best_index = float(scores[k]), index + k
+            index += count
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode != 0 or best_index is None:
+        return None
+    return best_index / sample_rate
+
+
+def extract_poster_frame(video_path: Path, output_path: Path,
+                         timestamp: Optional[float] = None, sample_rate: float = 2.0) -> bool:
+    """Extract a frame from video to use as poster image.
+
+    Without a timestamp the sharpest, best-exposed, most detailed frame is
+    found first (see find_poster_timestamp); the chosen frame is then
+    extracted at full resolution with fast input seeking.
+    """
 
     try:
-        subprocess.run([
+        if timestamp is None:
+            if HAS_NUMPY:
+                timestamp = find_poster_timestamp(video_path, sample_rate)
+            if timestamp is None:
+                timestamp = 1.0
+            else:
+                print(f"   Best poster frame at {timestamp:.1f}s")
+
+        pipeline_trace.run([
             'ffmpeg', '-y',
-            '-i', str(video_path),
             '-ss', str(timestamp),
+            '-i', str(video_path),
             '-vframes', '1',
             '-q:v', '2',
             str(output_path)
@@ -242,9 +298,19 @@ def main():
     parser.add_argument('--output-dir', default='website/public/images/photos', help='Output directory')
     parser.add_argument('--count', type=int, default=12, help='Number of photos to select')
     parser.add_argument('--poster-video', help='Video file to extract poster frame from')
+    parser.add_argument('--poster-timestamp', type=float,
+                        help='Poster frame time in seconds (default: pick the best frame automatically)')
+    parser.add_argument('--poster-sample-rate', type=float, default=2.0,
+                        help='Frames per second scored when picking the poster automatically')
     parser.add_argument('--poster-output', default='website/public/images/zebrafish-poster.jpg', help='Poster output path')
+    parser.add_argument('--catalog-path', default=str(DEFAULT_CATALOG_PATH), help='SQLite file for the media catalog')
+    parser.add_argument('--watch', action='store_true', help='Keep running and process new photos as they arrive')
+    parser.add_argument('--trace', metavar='TRACE_JSON',
+                        help='Record stage/file/ffmpeg timings to a Chrome trace file and print a summary')
 
     args = parser.parse_args()
+    if args.trace:
+        pipeline_trace.enable()
 
     photos_dir = Path(args.photos_dir).expanduser()
     output_dir = Path(args.output_dir)
@@ -254,14 +320,17 @@ def main():
         sys.exit(1)
 
     # Process photos
-    processed = process_photos(photos_dir, output_dir, args.count)
+    catalog = MediaCatalog(Path(args.catalog_path))
+    processed = process_photos(photos_dir, output_dir, args.count, catalog)
 
     # Extract poster frame if requested
     if args.poster_video:
         video_path = Path(args.poster_video).expanduser()
         poster_path = Path(args.poster_output)
         poster_path.parent.mkdir(parents=True, exist_ok=True)
-        extract_poster_frame(video_path, poster_path)
+        with pipeline_trace.span('poster'):
+            extract_poster_frame(video_path, poster_path, args.poster_timestamp,
+                                 args.poster_sample_rate)
 
     print(f"\n🎉 Done! {len(processed)} photos ready in {output_dir}")
     print("\nNext steps:")
@@ -269,6 +338,21 @@ def main():
     print("2. npm run dev")
     print("3. Open http://localhost:3000")
 
+    if args.watch:
+        print(f"\n👀 Watching {photos_dir} for new photos (Ctrl+C to stop)...")
+        try:
+            catalog.watch(photos_dir, lambda changes: process_photos(photos_dir, output_dir,
+                                                                     args.count, catalog),
+                          extensions=IMAGE_EXTENSIONS)
+        except KeyboardInterrupt:
+            print("\n   Stopped watching")
+
+    catalog.close()
+
+    if args.trace:
+        pipeline_trace.TRACER.print_summary()
+        print(f"\n   Trace written to {pipeline_trace.TRACER.write_chrome_trace(Path(args.trace))}")
+
 
 if __name__ == '__main__':
     main()
@@ -9,9 +9,18 @@ from your build documentation folder.
 Features:
 - Analyzes images using Claude Vision to understand content
 - Selects diverse, high-quality photos across the build timeline
-- Converts HEIC to JPEG, MOV to MP4
+- Converts photos to responsive JPEG/WebP/AVIF sets for srcset, MOV to MP4
+  (or an adaptive-bitrate HLS ladder)
 - Deletes source files after conversion (optional)
 - Organizes by build phase
+- Caches analysis results on disk so re-runs only send new or changed files
+- Scores photos locally (sharpness, exposure, contrast, noise) with --no-ai
+- Collapses near-duplicate shots (perceptual hashes + capture time) so only
+  one of each cluster is sent for analysis
+- Keeps several analysis batches in flight, throttled to the API rate limits
+- Prepares thumbnails in a process pool while earlier batches are with the API
+- Schedules image decodes against a RAM budget (--memory-budget-mb), sized
+  from each file's header, and reduces huge images while decoding them
 
 Usage:
     export ANTHROPIC_API_KEY="your-key-here"  # or it reads from ~/.zshrc
@@ -22,22 +31,56 @@ Usage:
         --videos-output-dir "website/public/videos" \
         --count 12
 
+    Analysis results are cached in ~/.cache/rslsm/analysis-cache.sqlite3, keyed
+    by file content hash and prompt/model version. Use --clear-cache to start
+    over or --no-cache to bypass it for a run.
+
+    File metadata lives in a catalog (~/.cache/rslsm/media-catalog.sqlite3)
+    that is refreshed incrementally. Add --watch to keep running and process
+    new drops from the phone as they land.
+
+    For very large libraries, --bulk sends everything as asynchronous message
+    batch jobs (about half the price, results within hours). Job IDs are kept
+    in ~/.cache/rslsm/bulk-jobs.json; --bulk-no-wait submits and exits, and a
+    later --bulk run collects the results. utilities/mock-anthropic-server.py
+    stands in for the API when testing (--api-base-url http://127.0.0.1:8765).
+
+    --trace run.json records stage, per-file, API and ffmpeg timings plus
+    bytes and tokens, writes them as Chrome trace-event JSON (chrome://tracing
+    or ui.perfetto.dev) and prints a summary table at the end.
+
 Requirements:
-    pip install anthropic Pillow pillow-heif
+    pip install anthropic Pillow pillow-heif numpy
 """
 
+import io
 import os
+import math
 import sys
 import json
+import time
+import random
+import asyncio
 import base64
+import sqlite3
 import shutil
 import subprocess
 import argparse
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Sequence, Tuple
+from functools import partial
+from contextlib import contextmanager
 from dataclasses import dataclass
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from media_scan import IMAGE_EXTENSIONS, VIDEO_EXTENSIONS
+from media_catalog import DEFAULT_CATALOG_PATH, MediaCatalog, file_content_hash
+from media_selection import select_diverse
+import output_sync
+import pipeline_trace
+import video_frames
 
 # Try to import required packages
 try:
@@ -48,7 +91,9 @@ except ImportError:
     print("⚠️  anthropic not installed. Run: pip install anthropic")
 
 try:
-    from PIL import Image
+    from PIL import Image, ExifTags
+    import decode_budget
+    import media_derivatives
     HAS_PIL = True
 except ImportError:
     HAS_PIL = False
@@ -62,18 +107,141 @@ except ImportError:
     HAS_HEIF = False
     print("⚠️  pillow-heif not installed. Run: pip install pillow-heif")
 
+try:
+    import numpy as np
+    import media_dedup
+    import media_quality
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+    print("⚠️  numpy not installed. Run: pip install numpy")
+
 
 @dataclass
 class MediaFile:
     path: Path
     date: Optional[datetime]
     media_type: str  # 'image' or 'video'
+    date_from_metadata: bool = False  # False when date is the file's mtime
     description: str = ""
     quality_score: float = 0.0
     build_phase: str = ""
+    is_duplicate: bool = False
+    content_hash: str = ""
+    visual_hash: Optional[int] = None  # 64-bit pHash, set by the dedup stage
     selected: bool = False
 
 
+# Model used for analysis. Bump ANALYSIS_PROMPT_VERSION whenever the prompt or
+# the meaning of the returned fields changes so stale cache entries are ignored.
+ANALYSIS_MODEL = "claude-sonnet-4-20250514"
+ANALYSIS_PROMPT_VERSION = 3
+
+DEFAULT_CACHE_PATH = Path.home() / '.cache' / 'rslsm' / 'analysis-cache.sqlite3'
+
+
+class AnalysisCache:
+    """On-disk SQLite cache of Claude Vision results.
+
+    Entries are keyed by file content hash plus model/prompt version, so
+    renamed or moved files still hit the cache while edited files and prompt
+    changes miss it.
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_CACHE_PATH,
+                 max_age_days: Optional[float] = 90,
+                 max_entries: Optional[int] = 50000):
+        self.db_path = Path(db_path).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+        self.analysis_key = f"{ANALYSIS_MODEL}:v{ANALYSIS_PROMPT_VERSION}"
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                content_hash TEXT NOT NULL,
+                analysis_key TEXT NOT NULL,
+                description TEXT NOT NULL,
+                quality_score REAL NOT NULL,
+                build_phase TEXT NOT NULL,
+                is_duplicate INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, analysis_key)
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, content_hash: str) -> Optional[Dict]:
+        """Return the cached analysis for a file, or None on a miss."""
+        row = self.conn.execute(
+            "SELECT description, quality_score, build_phase, is_duplicate, created_at "
+            "FROM analyses WHERE content_hash = ? AND analysis_key = ?",
+            (content_hash, self.analysis_key)
+        ).fetchone()
+
+        now = time.time()
+        if row is None or (self.max_age_days is not None
+                           and now - row[4] > self.max_age_days * 86400):
+            self.misses += 1
+            return None
+
+        self.conn.execute(
+            "UPDATE analyses SET accessed_at = ? WHERE content_hash = ? AND analysis_key = ?",
+            (now, content_hash, self.analysis_key)
+        )
+        self.hits += 1
+        return {
+            'description': row[0],
+            'quality_score': row[1],
+            'build_phase': row[2],
+            'is_duplicate': bool(row[3]),
+        }
+
+    def put(self, content_hash: str, analysis: Dict) -> None:
+        """Store the raw (un-penalised) analysis for a file."""
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (content_hash, self.analysis_key,
+             str(analysis.get('description', '')),
+             float(analysis.get('quality_score', 5.0)),
+             str(analysis.get('build_phase', 'general')),
+             int(bool(analysis.get('is_duplicate', False))),
+             now, now)
+        )
+        self.conn.commit()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones over max_entries."""
+        removed = 0
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            removed += self.conn.execute(
+                "DELETE FROM analyses WHERE created_at < ?", (cutoff,)
+            ).rowcount
+        if self.max_entries is not None:
+            removed += self.conn.execute(
+                "DELETE FROM analyses WHERE rowid IN ("
+                "SELECT rowid FROM analyses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+        self.conn.commit()
+        return removed
+
+    def clear(self) -> None:
+        """Invalidate every cached analysis."""
+        self.conn.execute("DELETE FROM analyses")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+
 def get_api_key() -> Optional[str]:
     """Get Anthropic API key from environment or ~/.zshrc"""
     # Check environment first
@@ -101,152 +269,303 @@ def get_api_key() -> Optional[str]:
     return None
 
 
-def get_file_date(filepath: Path) -> Optional[datetime]:
-    """Extract date from file metadata."""
-    try:
-        # Try to get EXIF data for images
-        if filepath.suffix.lower() in ['.jpg', '.jpeg', '.heic', '.heif', '.png']:
-            try:
-                import exifread
-                with open(filepath, 'rb') as f:
-                    tags = exifread.process_file(f, details=False)
-                for tag in ['EXIF DateTimeOriginal', 'EXIF DateTimeDigitized', 'Image DateTime']:
-                    if tag in tags:
-                        date_str = str(tags[tag])
-                        return datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-            except:
-                pass
+def load_media_files(catalog: MediaCatalog, directory: Path) -> List[MediaFile]:
+    """Build MediaFile records from the catalog instead of walking the folder."""
+    return [
+        MediaFile(path=entry.path, date=entry.date, media_type=entry.media_type,
+                  date_from_metadata=entry.date_from_metadata,
+                  content_hash=entry.content_hash or "")
+        for entry in catalog.query(directory, IMAGE_EXTENSIONS | VIDEO_EXTENSIONS)
+    ]
+
+
+THUMBNAIL_MAX_SIZE = 800  # long side of the thumbnails sent for analysis
+EXIF_THUMBNAIL_OFFSET_TAG = 0x0201
+EXIF_THUMBNAIL_LENGTH_TAG = 0x0202
 
-        # Fall back to file modification time
-        mtime = os.path.getmtime(filepath)
-        return datetime.fromtimestamp(mtime)
-    except:
+
+def _embedded_thumbnail(img: 'Image.Image', min_size: int) -> Optional['Image.Image']:
+    """Return the embedded EXIF/HEIF preview if its long side is at least min_size."""
+    thumb = None
+
+    if img.format == 'HEIF' and HAS_HEIF and hasattr(pillow_heif, 'thumbnail'):
+        try:
+            candidate = pillow_heif.thumbnail(img, min_box=min_size)
+            if candidate is not img:
+                thumb = candidate
+        except Exception:
+            thumb = None
+
+    exif_bytes = img.info.get('exif')
+    ifd1_tag = getattr(ExifTags.IFD, 'IFD1', None)
+    if thumb is None and exif_bytes and ifd1_tag is not None:
+        try:
+            ifd1 = img.getexif().get_ifd(ifd1_tag)
+            offset = ifd1.get(EXIF_THUMBNAIL_OFFSET_TAG)
+            length = ifd1.get(EXIF_THUMBNAIL_LENGTH_TAG)
+            if offset and length:
+                # Offsets are relative to the TIFF header, which follows b'Exif\0\0'
+                tiff_start = 6 if exif_bytes.startswith(b'Exif') else 0
+                data = exif_bytes[tiff_start + offset:tiff_start + offset + length]
+                thumb = Image.open(io.BytesIO(data))
+                thumb.load()
+        except Exception:
+            thumb = None
+
+    if thumb is None or max(thumb.size) < min_size:
         return None
+    return thumb
+
 
+def load_reduced_image(filepath: Path, max_size: int, fast: bool = True) -> 'Image.Image':
+    """Open an image upright and no larger than max_size on its long side.
 
-def find_media_files(directory: Path) -> List[MediaFile]:
-    """Find all images and videos in directory."""
-    image_exts = {'.jpg', '.jpeg', '.png', '.heic', '.heif'}
-    video_exts = {'.mov', '.mp4', '.m4v', '.avi'}
+    The fast path tries, in order: the embedded EXIF/HEIF thumbnail when it is
+    big enough, then a reduced decode (see decode_budget.load_reduced).
+    fast=False always does the full decode (the original behaviour).
+    """
+    with Image.open(filepath) as img:
+        orientation = img.getexif().get(decode_budget.ORIENTATION_TAG, 1)
 
-    media_files = []
+        reduced = _embedded_thumbnail(img, max_size) if fast else None
+        if reduced is None:
+            if fast:
+                # JPEG decodes at 1/2, 1/4 or 1/8 scale, other formats are
+                # box-reduced straight after decoding; never below max_size
+                reduced = decode_budget.load_reduced(img, (max_size, max_size))
+            else:
+                img.load()
+                reduced = img
 
-    for root, dirs, files in os.walk(directory):
-        for filename in files:
-            ext = Path(filename).suffix.lower()
-            filepath = Path(root) / filename
+        if reduced.mode not in ('RGB', 'L'):
+            reduced = reduced.convert('RGB')
 
-            if ext in image_exts:
-                media_files.append(MediaFile(
-                    path=filepath,
-                    date=get_file_date(filepath),
-                    media_type='image'
-                ))
-            elif ext in video_exts:
-                media_files.append(MediaFile(
-                    path=filepath,
-                    date=get_file_date(filepath),
-                    media_type='video'
-                ))
+        # Resize for API (smaller = faster + cheaper)
+        if max(reduced.size) > max_size:
+            if fast:
+                reduced.thumbnail((max_size, max_size), Image.LANCZOS)
+            else:
+                ratio = min(max_size / reduced.width, max_size / reduced.height)
+                new_size = (int(reduced.width * ratio), int(reduced.height * ratio))
+                reduced = reduced.resize(new_size, Image.LANCZOS)
 
-    return media_files
+        # pillow-heif applies HEIF rotation itself and resets the EXIF tag to 1
+        return decode_budget.upright(reduced, orientation)
 
 
-def convert_to_jpeg_thumbnail(filepath: Path, max_size: int = 800) -> Optional[bytes]:
+def convert_to_jpeg_thumbnail(filepath: Path, max_size: int = THUMBNAIL_MAX_SIZE,
+                              fast: bool = True) -> Optional[bytes]:
     """Convert image to small JPEG for API analysis."""
     if not HAS_PIL:
         return None
 
     try:
-        with Image.open(filepath) as img:
-            # Convert to RGB
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-
-            # Resize for API (smaller = faster + cheaper)
-            ratio = min(max_size / img.width, max_size / img.height)
-            if ratio < 1:
-                new_size = (int(img.width * ratio), int(img.height * ratio))
-                img = img.resize(new_size, Image.LANCZOS)
-
-            # Save to bytes
-            import io
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=70)
-            return buffer.getvalue()
+        img = load_reduced_image(filepath, max_size, fast=fast)
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=70)
+        return buffer.getvalue()
     except Exception as e:
         print(f"  Error converting {filepath.name}: {e}")
         return None
 
 
-def extract_video_frame(video_path: Path) -> Optional[bytes]:
-    """Extract a frame from video for analysis."""
+def best_video_frame(frames: List[bytes], size: int = 256) -> Optional[bytes]:
+    """The frame that scores best locally (sharp, well exposed), else the middle one."""
+    if not frames:
+        return None
+    if not HAS_NUMPY or len(frames) == 1:
+        return frames[len(frames) // 2]
+    grays = np.stack([
+        np.asarray(Image.open(io.BytesIO(f)).convert('L').resize((size, size), Image.BILINEAR),
+                   dtype=np.float32)
+        for f in frames
+    ])
+    return frames[int(np.argmax(media_quality.quality_scores(grays)))]
+
+
+def extract_video_frame(video_path: Path, frames: int = 4,
+                        scene_threshold: Optional[float] = None) -> Optional[bytes]:
+    """Sample several keyframes in memory and return the best one for analysis."""
     try:
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-            tmp_path = tmp.name
-
-        subprocess.run([
-            'ffmpeg', '-y', '-i', str(video_path),
-            '-ss', '1', '-vframes', '1',
-            '-q:v', '2', tmp_path
-        ], capture_output=True, check=True)
-
-        with open(tmp_path, 'rb') as f:
-            data = f.read()
-
-        os.unlink(tmp_path)
-        return data
+        return best_video_frame(video_frames.sample_frames(video_path, frames,
+                                                           scene_threshold=scene_threshold))
     except Exception as e:
         print(f"  Could not extract frame from {video_path.name}: {e}")
         return None
 
 
-def analyze_media_with_claude(client: anthropic.Anthropic, media_files: List[MediaFile],
-                               batch_size: int = 10) -> List[MediaFile]:
-    """Use Claude Vision to analyze and score media files."""
-
-    print(f"\n🤖 Analyzing {len(media_files)} files with Claude Vision...")
-
-    analyzed = []
-
-    for i in range(0, len(media_files), batch_size):
-        batch = media_files[i:i+batch_size]
-        print(f"\n  Processing batch {i//batch_size + 1}/{(len(media_files)-1)//batch_size + 1}...")
+def load_hash_thumbnail(path: Path, size: int = 64) -> Optional['np.ndarray']:
+    """Small grayscale array for perceptual hashing (runs in a process pool)."""
+    try:
+        with pipeline_trace.span('hash_thumbnail', cat='file', file=path.name):
+            # 128px is small enough that the embedded EXIF thumbnail usually qualifies
+            img = load_reduced_image(path, 128)
+            gray = img.convert('L').resize((size, size), Image.BILINEAR)
+            return np.asarray(gray, dtype=np.float32)
+    except Exception:
+        return None
 
-        # Prepare images for this batch
-        content = []
-        valid_indices = []
 
-        for j, media in enumerate(batch):
-            print(f"    [{i+j+1}/{len(media_files)}] Preparing: {media.path.name}")
+def image_fingerprints(media_files: List[MediaFile], catalog: MediaCatalog,
+                       workers: Optional[int] = None
+                       ) -> Tuple[List[int], 'np.ndarray', 'np.ndarray', 'np.ndarray']:
+    """(indices, pHashes, dHashes, sharpness) of the images in media_files.
+
+    Fingerprints are kept in the catalog by content hash, so only new or
+    changed images are decoded. Sets each image's visual_hash.
+    """
+    indices = [i for i, m in enumerate(media_files) if m.media_type == 'image']
+    hashes = catalog.ensure_hashes(media_files[i].path for i in indices)
+    for i in indices:
+        media_files[i].content_hash = hashes.get(media_files[i].path, media_files[i].content_hash)
+    indices = [i for i in indices if media_files[i].content_hash]
+
+    known = catalog.fingerprints(media_files[i].content_hash for i in indices)
+    missing = [i for i in indices if media_files[i].content_hash not in known]
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            thumbs = list(pipeline_trace.pool_map(pool, load_hash_thumbnail,
+                                                  [media_files[i].path for i in missing],
+                                                  chunksize=16))
+        loaded = [(i, t) for i, t in zip(missing, thumbs) if t is not None]
+        if loaded:
+            gray = np.stack([t for _, t in loaded])
+            small = media_dedup.resample(gray, media_dedup.PHASH_INPUT, media_dedup.PHASH_INPUT)
+            computed = {media_files[i].content_hash: (int(p), int(d), float(v))
+                        for (i, _), p, d, v in zip(loaded, media_dedup.phash(small),
+                                                   media_dedup.dhash(small),
+                                                   media_dedup.laplacian_variance(gray))}
+            catalog.store_fingerprints(computed)
+            known.update(computed)
+
+    indices = [i for i in indices if media_files[i].content_hash in known]
+    rows = [known[media_files[i].content_hash] for i in indices]
+    for i, (phash, _, _) in zip(indices, rows):
+        media_files[i].visual_hash = phash
+    phashes = np.array([r[0] for r in rows], dtype=np.uint64)
+    dhashes = np.array([r[1] for r in rows], dtype=np.uint64)
+    sharpness = np.array([r[2] for r in rows], dtype=np.float64)
+    return indices, phashes, dhashes, sharpness
+
+
+def find_near_duplicates(media_files: List[MediaFile], catalog: MediaCatalog,
+                         workers: Optional[int] = None,
+                         radius: int = 4, burst_window: float = 10.0) -> Dict[int, int]:
+    """Map index of each near-duplicate image to the index of its cluster's representative.
+
+    The representative of each cluster is its sharpest member. Videos are
+    never collapsed.
+    """
+    indices, phashes, dhashes, sharpness = image_fingerprints(media_files, catalog, workers)
+    if len(indices) < 2:
+        return {}
+    # Only real capture times say two shots were a burst; mtimes of a copied folder all agree
+    timestamps = np.array([media_files[i].date.timestamp() if media_files[i].date_from_metadata
+                           else np.nan for i in indices])
+
+    duplicates = {}
+    for cluster in media_dedup.group_near_duplicates(phashes, dhashes, timestamps,
+                                                     radius=radius, burst_window=burst_window):
+        best = max(cluster, key=lambda k: sharpness[k])
+        for k in cluster:
+            if k != best:
+                duplicates[indices[k]] = indices[best]
+    return duplicates
+
+
+def copy_analysis_to_duplicates(media_files: List[MediaFile], duplicates: Dict[int, int]) -> None:
+    """Give each collapsed duplicate its representative's analysis, penalised."""
+    for dup, rep in duplicates.items():
+        source, target = media_files[rep], media_files[dup]
+        target.description = source.description
+        target.build_phase = source.build_phase
+        target.is_duplicate = True
+        target.quality_score = source.quality_score * 0.5  # Penalize duplicates
+
+
+def score_media_chunk(items: List[Tuple[Path, str]], size: int = 256, video_frame_count: int = 4,
+                      scene_threshold: Optional[float] = None) -> List[Optional[float]]:
+    """Score a chunk of files with one batched NumPy pass (runs in a process pool).
+
+    The chunk's videos are sampled concurrently; a video scores as its best frame.
+    """
+    videos = [path for path, media_type in items if media_type == 'video']
+    sampled = video_frames.sample_videos(videos, video_frame_count, size, scene_threshold) if videos else {}
+
+    grays = []
+    positions = []
+    for k, (path, media_type) in enumerate(items):
+        try:
+            if media_type == 'image':
+                imgs = [load_reduced_image(path, size)]
+            else:
+                imgs = [Image.open(io.BytesIO(frame)) for frame in sampled.get(path, [])]
+            for img in imgs:
+                gray = img.convert('L').resize((size, size), Image.BILINEAR)
+                grays.append(np.asarray(gray, dtype=np.float32))
+                positions.append(k)
+        except Exception:
+            continue
 
-            if media.media_type == 'image':
-                image_data = convert_to_jpeg_thumbnail(media.path)
-            else:  # video
-                image_data = extract_video_frame(media.path)
+    scores: List[Optional[float]] = [None] * len(items)
+    if grays:
+        for k, score in zip(positions, media_quality.quality_scores(np.stack(grays))):
+            scores[k] = max(scores[k] or 0.0, float(score))
+    return scores
+
+
+def score_media_locally(media_files: List[MediaFile], workers: Optional[int] = None,
+                        chunk_size: int = 32, video_frame_count: int = 4,
+                        scene_threshold: Optional[float] = None) -> None:
+    """Set quality_score from local image metrics, without calling any API."""
+    chunks = [media_files[i:i+chunk_size] for i in range(0, len(media_files), chunk_size)]
+    score_chunk = partial(score_media_chunk, video_frame_count=video_frame_count,
+                          scene_threshold=scene_threshold)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        jobs = [[(m.path, m.media_type) for m in chunk] for chunk in chunks]
+        for chunk, scores in zip(chunks, pipeline_trace.pool_map(pool, score_chunk, jobs)):
+            for media, score in zip(chunk, scores):
+                # Unreadable files should never be picked
+                media.quality_score = score if score is not None else 0.0
+
+
+def apply_analysis(media: MediaFile, analysis: Dict) -> None:
+    """Copy one analysis result onto a MediaFile."""
+    media.description = analysis.get('description', '')
+    media.quality_score = float(analysis.get('quality_score', 5.0))
+    media.build_phase = analysis.get('build_phase', 'general')
+    media.is_duplicate = bool(analysis.get('is_duplicate', False))
+    if media.is_duplicate:
+        media.quality_score *= 0.5  # Penalize duplicates
+
+
+def apply_cached_analyses(media_files: List[MediaFile],
+                          cache: AnalysisCache) -> List[MediaFile]:
+    """Fill in cached results and return the files that still need analysis."""
+    pending = []
+    for media in media_files:
+        try:
+            if not media.content_hash:
+                media.content_hash = file_content_hash(media.path)
+        except OSError as e:
+            print(f"  Could not hash {media.path.name}: {e}")
+            pending.append(media)
+            continue
 
-            if image_data:
-                content.append({
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/jpeg",
-                        "data": base64.standard_b64encode(image_data).decode('utf-8')
-                    }
-                })
-                valid_indices.append(j)
+        cached = cache.get(media.content_hash)
+        if cached is None:
+            pending.append(media)
+        else:
+            apply_analysis(media, cached)
+    return pending
 
-        if not content:
-            analyzed.extend(batch)
-            continue
 
-        # Add the analysis prompt
-        file_names = [batch[j].path.name for j in valid_indices]
-        content.append({
-            "type": "text",
-            "text": f"""Analyze these {len(valid_indices)} images from a microscope build project.
+# Static instructions go in the system prompt, marked cacheable, so repeat
+# requests can reuse them; only the per-batch line below changes.
+ANALYSIS_INSTRUCTIONS = """You are shown images from a microscope build project.
 
-For each image (in order: {', '.join(file_names)}), provide a JSON response with:
+For each image, in the order given, provide a JSON object with:
+0. index and file: the image's 1-based position and its file name, as listed
 1. description: Brief description of what's shown (equipment, assembly step, etc.)
 2. quality_score: 0-10 rating based on:
    - Clarity/focus (is it sharp?)
@@ -256,193 +575,1237 @@ For each image (in order: {', '.join(file_names)}), provide a JSON response with
 3. build_phase: One of: "design", "illumination", "imaging", "electronics", "software", "general", "result"
 4. is_duplicate: true if very similar to another image in this batch
 
-Return ONLY valid JSON array, no other text:
-[{{"description": "...", "quality_score": 8.5, "build_phase": "illumination", "is_duplicate": false}}, ...]"""
+Return ONLY a valid JSON array with one object per image, no other text:
+[{"index": 1, "file": "IMG_0001.HEIC", "description": "...", "quality_score": 8.5, "build_phase": "illumination", "is_duplicate": false}, ...]"""
+
+ANALYSIS_PROMPT = "Analyze these {count} images (in order: {file_names})."
+
+BUILD_PHASES = {'design', 'illumination', 'imaging', 'electronics', 'software', 'general', 'result'}
+
+# Vision input costs about width * height / 750 tokens, after the API scales
+# images down to at most 1568 px on the long side and ~1.15 megapixels.
+IMAGE_TOKEN_DIVISOR = 750
+MAX_IMAGE_EDGE = 1568
+MAX_IMAGE_PIXELS = 1_150_000
+# Output: one short JSON object per file, plus room for the array and fences
+OUTPUT_TOKENS_PER_ITEM = 150
+RESPONSE_OVERHEAD_TOKENS = 200
+MAX_OUTPUT_TOKENS = 16000
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Approximate input tokens for one image of the given size."""
+    scale = min(1.0, MAX_IMAGE_EDGE / max(width, height),
+                math.sqrt(MAX_IMAGE_PIXELS / (width * height)))
+    return math.ceil((width * scale) * (height * scale) / IMAGE_TOKEN_DIVISOR)
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Rough token count for English text (about four characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+def response_token_budget(count: int) -> int:
+    """max_tokens for a batch of count files, so the JSON array is never cut off."""
+    return min(MAX_OUTPUT_TOKENS, RESPONSE_OVERHEAD_TOKENS + OUTPUT_TOKENS_PER_ITEM * count)
+
+
+# Status codes that mean "slow down and try again" rather than "this request is bad"
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# Status codes that blame the batch contents, so splitting or resending it can help
+CONTENT_STATUS_CODES = {400, 413}
+
+
+def is_content_error(error: Exception) -> bool:
+    """True if the API rejected this batch's contents rather than the account or service.
+
+    Billing problems also arrive as 400s but fail every request alike, so
+    they abort the run like auth errors do.
+    """
+    if (not isinstance(error, anthropic.APIStatusError)
+            or error.status_code not in CONTENT_STATUS_CODES):
+        return False
+    detail = error.body.get('error', {}) if isinstance(error.body, dict) else {}
+    message = str(detail.get('message', error.message)).lower()
+    return detail.get('type') != 'billing_error' and 'credit balance' not in message
+
+
+def encode_media_for_analysis(path: Path, media_type: str, video_frame_count: int = 4,
+                              scene_threshold: Optional[float] = None
+                              ) -> Tuple[Optional[str], Tuple[int, int], float]:
+    """Thumbnail and base64-encode one file; returns (data, (width, height), seconds spent).
+
+    Runs inside the preparation process pool, so it only takes picklable
+    arguments and does no printing on the success path.
+    """
+    start = time.perf_counter()
+    with pipeline_trace.span('thumbnail', cat='file', file=path.name, type=media_type):
+        pipeline_trace.count_file('bytes_read', path)
+        if media_type == 'image':
+            image_data = convert_to_jpeg_thumbnail(path)
+        else:  # video
+            image_data = extract_video_frame(path, video_frame_count, scene_threshold)
+
+    if not image_data:
+        return None, (0, 0), time.perf_counter() - start
+    with Image.open(io.BytesIO(image_data)) as img:
+        size = img.size
+    encoded = base64.standard_b64encode(image_data).decode('utf-8')
+    return encoded, size, time.perf_counter() - start
+
+
+def build_batch_content(batch: List[MediaFile],
+                        encoded_images: List[Optional[str]]) -> Tuple[List[Dict], List[int]]:
+    """Build the message content for a batch; returns (content, valid_indices)."""
+    content = []
+    valid_indices = []
+
+    for j, data in enumerate(encoded_images):
+        if data:
+            content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/jpeg",
+                    "data": data
+                }
+            })
+            valid_indices.append(j)
+
+    if content:
+        file_names = [batch[j].path.name for j in valid_indices]
+        content.append({
+            "type": "text",
+            "text": ANALYSIS_PROMPT.format(count=len(valid_indices),
+                                           file_names=', '.join(file_names))
         })
 
+    return content, valid_indices
+
+
+@dataclass
+class PlannedBatch:
+    """Files packed into one request, with their encoded thumbnails."""
+    items: List[MediaFile]
+    encoded: List[str]
+    input_tokens: int
+    payload_bytes: int
+
+
+class BatchPlanner:
+    """Packs prepared thumbnails into requests under token, byte and file budgets.
+
+    Files arrive one at a time in order; add() returns the finished batch
+    whenever the next file would push the current one over a budget.
+    """
+
+    def __init__(self, token_budget: int = 16000, byte_budget: int = 16_000_000,
+                 max_items: int = 20):
+        self.token_budget = token_budget
+        self.byte_budget = byte_budget
+        # Keep the response for a full batch within MAX_OUTPUT_TOKENS
+        self.max_items = max(1, min(max_items, (MAX_OUTPUT_TOKENS - RESPONSE_OVERHEAD_TOKENS)
+                                    // OUTPUT_TOKENS_PER_ITEM))
+        self.base_tokens = estimate_text_tokens(ANALYSIS_INSTRUCTIONS)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.items: List[MediaFile] = []
+        self.encoded: List[str] = []
+        self.tokens = self.base_tokens
+        self.bytes = 0
+
+    def add(self, media: MediaFile, data: str, image_tokens: int) -> Optional[PlannedBatch]:
+        # File names appear in the per-batch prompt line too
+        tokens = image_tokens + estimate_text_tokens(media.path.name) + 1
+        full = self.items and (len(self.items) >= self.max_items
+                               or self.tokens + tokens > self.token_budget
+                               or self.bytes + len(data) > self.byte_budget)
+        finished = self.flush() if full else None
+        self.items.append(media)
+        self.encoded.append(data)
+        self.tokens += tokens
+        self.bytes += len(data)
+        return finished
+
+    def flush(self) -> Optional[PlannedBatch]:
+        if not self.items:
+            return None
+        batch = PlannedBatch(self.items, self.encoded, self.tokens, self.bytes)
+        self._reset()
+        return batch
+
+
+def parse_analysis_response(response_text: str) -> List[Dict]:
+    """Parse the JSON array returned by Claude, tolerating ``` fences."""
+    response_text = response_text.strip()
+    if response_text.startswith('```'):
+        response_text = response_text.split('```')[1]
+        if response_text.startswith('json'):
+            response_text = response_text[4:]
+    return json.loads(response_text)
+
+
+def _valid_analysis(item: Dict) -> Optional[Dict]:
+    """A cleaned copy of one returned analysis, or None if it is unusable."""
+    try:
+        score = float(item['quality_score'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not 0 <= score <= 10:
+        return None
+    phase = item.get('build_phase')
+    return {
+        'description': str(item.get('description') or ''),
+        'quality_score': score,
+        'build_phase': phase if phase in BUILD_PHASES else 'general',
+        'is_duplicate': item.get('is_duplicate') is True,
+    }
+
+
+def validate_analyses(analyses, file_names: List[str]) -> Dict[int, Dict]:
+    """Match returned analyses to batch positions; returns {position: analysis}.
+
+    Items are matched by their 1-based index (checked against the file name
+    when both are given), then by a unique file name, and only by array
+    position when the array has exactly one entry per file. Items that match
+    nothing, repeat a position or fail validation are dropped, so the caller
+    can resubmit just the positions that are missing.
+    """
+    if not isinstance(analyses, list):
+        raise ValueError(f"expected a JSON array, got {type(analyses).__name__}")
+
+    n = len(file_names)
+    positions_by_name = {}
+    for j, name in enumerate(file_names):
+        positions_by_name.setdefault(name, []).append(j)
+
+    results = {}
+    for position, item in enumerate(analyses):
+        if not isinstance(item, dict):
+            continue
+        index, name = item.get('index'), item.get('file')
+        if isinstance(index, int) and 1 <= index <= n and name in (None, file_names[index - 1]):
+            j = index - 1
+        elif len(positions_by_name.get(name, ())) == 1:
+            j = positions_by_name[name][0]
+        elif len(analyses) == n:
+            j = position
+        else:
+            continue
+        analysis = _valid_analysis(item)
+        if analysis is not None and j not in results:
+            results[j] = analysis
+    return results
+
+
+def _seconds_until(timestamp: str) -> float:
+    """Seconds from now until an RFC 3339 timestamp (as sent in reset headers)."""
+    try:
+        reset = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        return 0.0
+    return max(0.0, reset.timestamp() - time.time())
+
+
+class RateLimiter:
+    """Token bucket shared by all in-flight requests.
+
+    Refills at the configured requests-per-minute, tightens itself to the
+    limit the API reports in its rate-limit headers, and pauses every request
+    when the API says a limit is exhausted or asks us to retry later.
+    """
+
+    def __init__(self, requests_per_minute: float = 50.0, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every request for at least `seconds`."""
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers) -> None:
+        """Honour anthropic-ratelimit-* and retry-after response headers."""
+        limit = headers.get('anthropic-ratelimit-requests-limit')
+        if limit and limit.isdigit() and int(limit) > 0:
+            self.rate = min(self.rate, int(limit) / 60.0)
+
+        for kind in ('requests', 'tokens', 'input-tokens', 'output-tokens'):
+            remaining = headers.get(f'anthropic-ratelimit-{kind}-remaining')
+            reset = headers.get(f'anthropic-ratelimit-{kind}-reset')
+            if remaining is not None and reset and remaining.isdigit() and int(remaining) == 0:
+                self.pause(_seconds_until(reset))
+
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            try:
+                self.pause(float(retry_after))
+            except ValueError:
+                pass
+
+
+def analysis_request_params(content: List[Dict], max_tokens: int) -> Dict:
+    """Messages API parameters for one analysis batch (shared by live and bulk mode)."""
+    return {
+        'model': ANALYSIS_MODEL,
+        'max_tokens': max_tokens,
+        'system': [{"type": "text", "text": ANALYSIS_INSTRUCTIONS,
+                    "cache_control": {"type": "ephemeral"}}],
+        'messages': [{"role": "user", "content": content}],
+    }
+
+
+def record_token_usage(span, usage) -> None:
+    """Attach a response's token usage to its trace span and the run's token counters."""
+    tokens = {
+        'input_tokens': usage.input_tokens,
+        'output_tokens': usage.output_tokens,
+        'cache_read_input_tokens': getattr(usage, 'cache_read_input_tokens', None) or 0,
+        'cache_creation_input_tokens': getattr(usage, 'cache_creation_input_tokens', None) or 0,
+    }
+    span.set(**tokens)
+    for name, value in tokens.items():
+        pipeline_trace.count(name, value)
+
+
+async def send_analysis_request(client: 'anthropic.AsyncAnthropic', content: List[Dict],
+                                limiter: RateLimiter, max_tokens: int = 2000,
+                                max_attempts: int = 6, max_backoff: float = 60.0) -> str:
+    """Send one batch, retrying rate-limit/overload errors with jittered backoff."""
+    for attempt in range(max_attempts):
+        await limiter.acquire()
         try:
-            response = client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=2000,
-                messages=[{"role": "user", "content": content}]
-            )
+            with pipeline_trace.span('request', cat='api', overlapping=True,
+                                     attempt=attempt + 1) as span:
+                raw = await client.messages.with_raw_response.create(
+                    **analysis_request_params(content, max_tokens))
+                limiter.update_from_headers(raw.headers)
+                response = await raw.parse()
+                if pipeline_trace.enabled():
+                    record_token_usage(span, response.usage)
+            return response.content[0].text
+        except anthropic.APIStatusError as e:
+            if e.status_code not in RETRYABLE_STATUS_CODES or attempt == max_attempts - 1:
+                raise
+            limiter.update_from_headers(e.response.headers)
+            reason = f"HTTP {e.status_code}"
+        except anthropic.APIConnectionError:
+            if attempt == max_attempts - 1:
+                raise
+            reason = "connection error"
+
+        pipeline_trace.count('api_retries')
+        delay = min(max_backoff, 2 ** attempt) * random.uniform(0.5, 1.0)
+        limiter.pause(delay)
+        print(f"    ⏳ {reason}, retrying in {delay:.1f}s (attempt {attempt + 2}/{max_attempts})")
+
+    raise RuntimeError("unreachable")
+
+
+@dataclass
+class StageStats:
+    """Busy/wait accounting for one pipeline stage."""
+    name: str
+    slots: int
+    busy: float = 0.0
+    waiting: float = 0.0
+    items: int = 0
+
+    def utilisation(self, wall: float) -> float:
+        return self.busy / (wall * self.slots) if wall > 0 and self.slots else 0.0
+
+
+def print_pipeline_report(stages: List[StageStats], wall: float) -> None:
+    """Print per-stage utilisation and name the likely bottleneck."""
+    print(f"\n📈 Pipeline utilisation ({wall:.1f}s wall):")
+    for stage in stages:
+        per_item = stage.busy / stage.items if stage.items else 0.0
+        print(f"   {stage.name:<8} {stage.utilisation(wall)*100:5.1f}% busy  "
+              f"({stage.slots} slots, {stage.items} items, {per_item:.2f}s/item, "
+              f"{stage.waiting:.1f}s waiting)")
+
+    prepare, api = stages
+    # API waiting is summed over its request slots; compare per-slot idle time
+    if api.waiting / max(1, api.slots) > prepare.waiting:
+        print("   → API stage was starved for thumbnails: preparation is the bottleneck")
+    elif prepare.waiting > 0:
+        print("   → Prepared batches queued up behind the API: requests are the bottleneck")
+
+
+async def prepare_batches(media_files: List[MediaFile], planner: BatchPlanner,
+                          prep_workers: int, video_frame_count: int = 4,
+                          scene_threshold: Optional[float] = None,
+                          stats: Optional[StageStats] = None,
+                          memory_budget: Optional[int] = None) -> AsyncIterator[PlannedBatch]:
+    """Thumbnail files in a process pool and yield them packed into batches, in order.
+
+    Only about two files per worker are prepared ahead of the one being
+    packed, so memory stays bounded however slowly batches are consumed.
+    Files are also only started while their estimated decode footprints fit
+    memory_budget bytes (default: half the RAM), so a run of huge panoramas
+    is decoded a few at a time instead of all at once.
+    """
+    loop = asyncio.get_running_loop()
+    items = iter(media_files)
+    in_flight = deque()
+    budget = decode_budget.MemoryBudget(memory_budget or decode_budget.default_budget_bytes())
+    upcoming = None  # (file, cost) waiting for budget
+
+    with ProcessPoolExecutor(max_workers=prep_workers) as pool:
+        def submit_next() -> bool:
+            nonlocal upcoming
+            if upcoming is None:
+                m = next(items, None)
+                if m is None:
+                    return False
+                cost = (decode_budget.estimate_decode_bytes(m.path, THUMBNAIL_MAX_SIZE)
+                        if m.media_type == 'image' else decode_budget.VIDEO_DECODE_BYTES)
+                upcoming = (m, cost)
+            m, cost = upcoming
+            if not budget.try_reserve(cost):
+                return False
+            upcoming = None
+            future = asyncio.ensure_future(pipeline_trace.run_in_executor(
+                loop, pool, encode_media_for_analysis, m.path, m.media_type,
+                video_frame_count, scene_threshold))
+            future.add_done_callback(lambda _, cost=cost: budget.release(cost))
+            in_flight.append((m, future))
+            return True
 
-            # Parse response
-            response_text = response.content[0].text.strip()
-            # Clean up response if needed
-            if response_text.startswith('```'):
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
+        def fill() -> None:
+            # Keep every worker busy while the head of the line is packed
+            while len(in_flight) < 2 * prep_workers and submit_next():
+                pass
 
-            analyses = json.loads(response_text)
+        fill()
+        while in_flight:
+            m, future = in_flight.popleft()
+            data, (width, height), elapsed = await future
+            fill()
+            if stats is not None:
+                stats.busy += elapsed
+                stats.items += 1
+            if data is None:
+                continue
+            planned = planner.add(m, data, estimate_image_tokens(width, height))
+            if planned is not None:
+                yield planned
+
+        planned = planner.flush()
+        if planned is not None:
+            yield planned
+
+
+async def analyze_media_async(client: 'anthropic.AsyncAnthropic', media_files: List[MediaFile],
+                              batch_size: int = 20,
+                              cache: Optional[AnalysisCache] = None,
+                              concurrency: int = 4,
+                              requests_per_minute: float = 50.0,
+                              prep_workers: Optional[int] = None,
+                              queue_depth: int = 4,
+                              video_frame_count: int = 4,
+                              scene_threshold: Optional[float] = None,
+                              token_budget: int = 16000,
+                              byte_budget: int = 16_000_000,
+                              max_item_retries: int = 2,
+                              memory_budget: Optional[int] = None) -> List[MediaFile]:
+    """Analyze media with a thumbnail pipeline feeding concurrent API requests.
+
+    A process pool prepares thumbnails for upcoming batches while up to
+    `concurrency` requests are in flight. At most `queue_depth` prepared
+    batches wait for the API at any time, which bounds memory use, and
+    thumbnails are only decoded while they fit memory_budget bytes.
+
+    Prepared thumbnails are packed into requests of up to `batch_size` files,
+    `token_budget` estimated input tokens and `byte_budget` bytes of image
+    data, and each request's max_tokens is sized to its file count.
+
+    Results are written back onto the MediaFile objects, so the returned list
+    keeps the original order regardless of which batch finishes first.
+    """
+
+    pending = media_files
+    if cache is not None:
+        pending = apply_cached_analyses(media_files, cache)
+        print(f"\n♻️  {cache.hits} files loaded from analysis cache, {len(pending)} to analyze")
+
+    prep_workers = prep_workers or os.cpu_count() or 1
+    print(f"\n🤖 Analyzing {len(pending)} files with Claude Vision "
+          f"({prep_workers} preparation workers, {concurrency} batches in flight)...")
+
+    if not pending:
+        return media_files
+
+    limiter = RateLimiter(requests_per_minute, burst=concurrency)
+    queue: asyncio.Queue = asyncio.Queue()
+    queue_slots = asyncio.Semaphore(max(1, queue_depth))
+    prepare_stats = StageStats('prepare', prep_workers)
+    api_stats = StageStats('api', concurrency)
+    started = time.perf_counter()
+    batch_count = 0
+
+    async def emit(planned: PlannedBatch) -> None:
+        nonlocal batch_count
+        wait_start = time.perf_counter()
+        await queue_slots.acquire()
+        prepare_stats.waiting += time.perf_counter() - wait_start
+        print(f"  Prepared batch {batch_count + 1} ({len(planned.items)} files, "
+              f"~{planned.input_tokens} tokens, {planned.payload_bytes / 1e6:.1f} MB)")
+        await queue.put((str(batch_count + 1), planned.items, planned.encoded))
+        batch_count += 1
+
+    async def produce() -> None:
+        planner = BatchPlanner(token_budget, byte_budget, batch_size)
+        async for planned in prepare_batches(pending, planner, prep_workers,
+                                             video_frame_count, scene_threshold, prepare_stats,
+                                             memory_budget):
+            await emit(planned)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    failed: List[MediaFile] = []
+
+    async def analyze_batch(label: str, batch: List[MediaFile], encoded: List[str],
+                            retries_left: int = max_item_retries) -> None:
+        """Send one batch; resubmit what is missing, bisecting batches that fail outright."""
+        content, valid_indices = build_batch_content(batch, encoded)
+        file_names = [m.path.name for m in batch]
+
+        request_start = time.perf_counter()
+        results: Dict[int, Dict] = {}
+        try:
+            response_text = await send_analysis_request(
+                client, content, limiter, max_tokens=response_token_budget(len(valid_indices)))
+            results = validate_analyses(parse_analysis_response(response_text), file_names)
+        except ValueError as e:  # includes json.JSONDecodeError
+            print(f"    ⚠️  Batch {label}: could not parse Claude response: {e}")
+        except anthropic.APIStatusError as e:
+            # Auth, permission, billing and exhausted retries fail every batch: abort
+            if not is_content_error(e):
+                raise
+            print(f"    ⚠️  Batch {label}: request rejected: {e}")
+        finally:
+            api_stats.busy += time.perf_counter() - request_start
+            api_stats.items += 1
+
+        for j, analysis in results.items():
+            apply_analysis(batch[j], analysis)
+            if cache is not None and batch[j].content_hash:
+                cache.put(batch[j].content_hash, analysis)
+
+        missing = [j for j in range(len(batch)) if j not in results]
+        if not missing:
+            print(f"    ✓ Batch {label}: analyzed {len(results)} files")
+            return
+
+        if results:
+            # Partial answer: ask again for just the files that were skipped or invalid
+            print(f"    ↻ Batch {label}: analyzed {len(results)} files, resubmitting {len(missing)}")
+            await analyze_batch(f"{label}r", [batch[j] for j in missing],
+                                [encoded[j] for j in missing], retries_left)
+        elif len(batch) > 1:
+            # Nothing usable: split so one bad file cannot sink the rest
+            half = len(batch) // 2
+            print(f"    ↻ Batch {label}: splitting {len(batch)} files in two")
+            await asyncio.gather(
+                analyze_batch(f"{label}a", batch[:half], encoded[:half], retries_left),
+                analyze_batch(f"{label}b", batch[half:], encoded[half:], retries_left))
+        elif retries_left > 0:
+            await analyze_batch(f"{label}r", batch, encoded, retries_left - 1)
+        else:
+            print(f"    ✗ {batch[0].path.name}: no usable analysis, keeping default score")
+            failed.append(batch[0])
+
+    async def consume() -> None:
+        while True:
+            wait_start = time.perf_counter()
+            item = await queue.get()
+            api_stats.waiting += time.perf_counter() - wait_start
+            if item is None:
+                return
+            queue_slots.release()
+            await analyze_batch(*item)
+
+    await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+    print_pipeline_report([prepare_stats, api_stats], time.perf_counter() - started)
+    if failed:
+        print(f"   ⚠️  {len(failed)} files could not be analyzed and keep the default score")
+    return media_files
 
-            # Apply analyses to media files
-            for j, analysis in zip(valid_indices, analyses):
-                batch[j].description = analysis.get('description', '')
-                batch[j].quality_score = float(analysis.get('quality_score', 5.0))
-                batch[j].build_phase = analysis.get('build_phase', 'general')
-                if analysis.get('is_duplicate', False):
-                    batch[j].quality_score *= 0.5  # Penalize duplicates
 
-            print(f"    ✓ Analyzed {len(analyses)} files")
+def analyze_media_with_claude(client: 'anthropic.AsyncAnthropic', media_files: List[MediaFile],
+                               batch_size: int = 20,
+                               cache: Optional[AnalysisCache] = None,
+                               concurrency: int = 4,
+                               requests_per_minute: float = 50.0,
+                               prep_workers: Optional[int] = None,
+                               queue_depth: int = 4,
+                               video_frame_count: int = 4,
+                               scene_threshold: Optional[float] = None,
+                               token_budget: int = 16000,
+                               byte_budget: int = 16_000_000,
+                               max_item_retries: int = 2,
+                               memory_budget: Optional[int] = None) -> List[MediaFile]:
+    """Use Claude Vision to analyze and score media files."""
+    return asyncio.run(analyze_media_async(client, media_files, batch_size, cache,
+                                           concurrency, requests_per_minute,
+                                           prep_workers, queue_depth,
+                                           video_frame_count, scene_threshold,
+                                           token_budget, byte_budget, max_item_retries,
+                                           memory_budget))
 
-        except json.JSONDecodeError as e:
-            print(f"    ⚠️  Could not parse Claude response: {e}")
-        except Exception as e:
-            print(f"    ⚠️  API error: {e}")
 
-        analyzed.extend(batch)
+# Bulk mode submits asynchronous message batch jobs; the API accepts up to
+# 100,000 requests or 256 MB per job, so jobs are cut well below both.
+DEFAULT_BULK_STATE_PATH = Path.home() / '.cache' / 'rslsm' / 'bulk-jobs.json'
+BULK_JOB_MAX_REQUESTS = 10000
+BULK_JOB_MAX_BYTES = 200_000_000
 
-    return analyzed
+
+def load_bulk_state(state_path: Path) -> Dict:
+    """Submitted-but-unmerged bulk jobs: {"jobs": [{"id", "submitted", "requests"}]}."""
+    try:
+        return json.loads(state_path.read_text())
+    except FileNotFoundError:
+        return {'jobs': []}
+
+
+def save_bulk_state(state_path: Path, state: Dict) -> None:
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_output(state_path) as tmp_path:
+        tmp_path.write_text(json.dumps(state, indent=2))
+
+
+async def submit_bulk_jobs(client: 'anthropic.AsyncAnthropic', media_files: List[MediaFile],
+                           state: Dict, state_path: Path, planner: BatchPlanner,
+                           prep_workers: int, video_frame_count: int = 4,
+                           scene_threshold: Optional[float] = None,
+                           memory_budget: Optional[int] = None) -> int:
+    """Prepare media_files and submit them as message batch jobs; returns the job count.
+
+    Each request's custom_id maps to its files' (path, content hash) pairs in
+    the state file, which is saved after every job so an interrupted run
+    never submits the same files twice.
+    """
+    submitted = 0
+    requests, files, job_bytes = [], {}, 0
+
+    async def submit() -> None:
+        nonlocal submitted, requests, files, job_bytes
+        job = await client.messages.batches.create(requests=requests)
+        state['jobs'].append({'id': job.id, 'submitted': datetime.now().isoformat(),
+                              'requests': files})
+        save_bulk_state(state_path, state)
+        print(f"  📦 Submitted job {job.id} ({len(requests)} requests, "
+              f"{sum(len(v) for v in files.values())} files)")
+        submitted += 1
+        requests, files, job_bytes = [], {}, 0
+
+    async for planned in prepare_batches(media_files, planner, prep_workers,
+                                         video_frame_count, scene_threshold,
+                                         memory_budget=memory_budget):
+        if requests and (len(requests) >= BULK_JOB_MAX_REQUESTS
+                         or job_bytes + planned.payload_bytes > BULK_JOB_MAX_BYTES):
+            await submit()
+        content, valid_indices = build_batch_content(planned.items, planned.encoded)
+        custom_id = f"r{len(requests):06d}"
+        requests.append({'custom_id': custom_id,
+                         'params': analysis_request_params(
+                             content, response_token_budget(len(valid_indices)))})
+        files[custom_id] = [[str(m.path), m.content_hash] for m in planned.items]
+        job_bytes += planned.payload_bytes
+
+    if requests:
+        await submit()
+    return submitted
+
+
+async def merge_bulk_results(client: 'anthropic.AsyncAnthropic', job: Dict,
+                             media_by_path: Dict[str, MediaFile],
+                             cache: Optional[AnalysisCache]) -> Tuple[int, int]:
+    """Apply a finished job's results by custom_id; returns (analyzed, failed) file counts.
+
+    Results are cached by content hash even for files no longer in this run,
+    so nothing paid for is lost. Failed files are simply submitted again by
+    the next run, since they have no cache entry and no open job.
+    """
+    analyzed = failed = 0
+    async for entry in await client.messages.batches.results(job['id']):
+        files = job['requests'].get(entry.custom_id)
+        if files is None:
+            continue
+        results = {}
+        if entry.result.type == 'succeeded':
+            if pipeline_trace.enabled():
+                record_token_usage(pipeline_trace.NULL_SPAN, entry.result.message.usage)
+            try:
+                results = validate_analyses(
+                    parse_analysis_response(entry.result.message.content[0].text),
+                    [Path(path).name for path, _ in files])
+            except ValueError:
+                pass
+        for j, (path, content_hash) in enumerate(files):
+            analysis = results.get(j)
+            if analysis is None:
+                failed += 1
+                continue
+            analyzed += 1
+            if path in media_by_path:
+                apply_analysis(media_by_path[path], analysis)
+            if cache is not None and content_hash:
+                cache.put(content_hash, analysis)
+    return analyzed, failed
+
+
+async def analyze_media_bulk(client: 'anthropic.AsyncAnthropic', media_files: List[MediaFile],
+                             state_path: Path = DEFAULT_BULK_STATE_PATH,
+                             batch_size: int = 20,
+                             cache: Optional[AnalysisCache] = None,
+                             prep_workers: Optional[int] = None,
+                             video_frame_count: int = 4,
+                             scene_threshold: Optional[float] = None,
+                             token_budget: int = 16000,
+                             byte_budget: int = 16_000_000,
+                             wait: bool = True,
+                             poll_interval: float = 60.0,
+                             memory_budget: Optional[int] = None) -> bool:
+    """Analyze media through asynchronous message batch jobs (cheaper, not interactive).
+
+    Files without a cached analysis or an open job are submitted; then open
+    jobs are polled until they end and their results are merged. With
+    wait=False it returns after submitting, and a later run resumes from the
+    state file. Returns True once every job has been merged.
+    """
+    # Only a handful of calls here, so let the SDK retry them itself
+    client = client.with_options(max_retries=5)
+    state = load_bulk_state(state_path)
+    pending = media_files
+    if cache is not None:
+        pending = apply_cached_analyses(media_files, cache)
+        print(f"\n♻️  {cache.hits} files loaded from analysis cache")
+
+    queued = {path for job in state['jobs'] for files in job['requests'].values()
+              for path, _ in files}
+    to_submit = [m for m in pending if str(m.path) not in queued]
+    print(f"\n📦 Bulk analysis: {len(state['jobs'])} open jobs, {len(to_submit)} files to submit")
+    if to_submit:
+        planner = BatchPlanner(token_budget, byte_budget, batch_size)
+        await submit_bulk_jobs(client, to_submit, state, state_path, planner,
+                               prep_workers or os.cpu_count() or 1,
+                               video_frame_count, scene_threshold, memory_budget)
+
+    media_by_path = {str(m.path): m for m in media_files}
+    while state['jobs']:
+        for job in list(state['jobs']):
+            batch = await client.messages.batches.retrieve(job['id'])
+            counts = batch.request_counts
+            print(f"  {job['id']}: {batch.processing_status} — {counts.succeeded} succeeded, "
+                  f"{counts.errored} errored, {counts.processing} processing")
+            if batch.processing_status != 'ended':
+                continue
+            analyzed, failed = await merge_bulk_results(client, job, media_by_path, cache)
+            print(f"    ✓ Merged {analyzed} analyses ({failed} files will be resubmitted next run)")
+            state['jobs'].remove(job)
+            save_bulk_state(state_path, state)
+
+        if state['jobs']:
+            if not wait:
+                print(f"   Jobs still running; re-run with --bulk to collect results "
+                      f"(state: {state_path})")
+                return False
+            await asyncio.sleep(poll_interval)
+    return True
 
 
 def select_best_media(media_files: List[MediaFile],
                        image_count: int = 12,
-                       video_count: int = 2) -> Tuple[List[MediaFile], List[MediaFile]]:
-    """Select the best diverse set of images and videos."""
+                       video_count: int = 2,
+                       diversity: float = 0.3,
+                       phase_quotas: Optional[Dict[str, int]] = None,
+                       min_time_gap: float = 0.0) -> Tuple[List[MediaFile], List[MediaFile]]:
+    """Select the best diverse set of images and videos.
+
+    Balances quality against similarity in capture time, build phase and
+    appearance (see media_selection.select_diverse). phase_quotas caps how
+    many images come from one phase; min_time_gap (seconds) keeps picks from
+    clustering around a single moment.
+    """
+
+    def pick(items: List[MediaFile], count: int, quotas: Optional[Dict[str, int]]) -> List[MediaFile]:
+        order = select_diverse(
+            [m.quality_score for m in items],
+            [m.date.timestamp() if m.date else None for m in items],
+            [m.build_phase or 'general' for m in items],
+            count,
+            visual_hashes=[m.visual_hash for m in items],
+            diversity=diversity,
+            phase_quotas=quotas,
+            min_time_gap=min_time_gap
+        )
+        return [items[i] for i in order]
 
     # Separate images and videos
     images = [m for m in media_files if m.media_type == 'image']
     videos = [m for m in media_files if m.media_type == 'video']
 
-    # Sort by quality score
-    images.sort(key=lambda x: x.quality_score, reverse=True)
-    videos.sort(key=lambda x: x.quality_score, reverse=True)
-
-    # Select images with diversity (different phases, spread across time)
-    selected_images = []
-    phases_covered = set()
-
-    # First pass: get best from each phase
-    for phase in ['design', 'illumination', 'imaging', 'electronics', 'software', 'result', 'general']:
-        phase_images = [m for m in images if m.build_phase == phase and m not in selected_images]
-        if phase_images and len(selected_images) < image_count:
-            best = phase_images[0]
-            selected_images.append(best)
-            phases_covered.add(phase)
-
-    # Second pass: fill remaining with highest quality
-    remaining = [m for m in images if m not in selected_images]
-    for img in remaining:
-        if len(selected_images) >= image_count:
-            break
-        selected_images.append(img)
+    selected_images = pick(images, image_count, phase_quotas)
+    selected_videos = pick(videos, video_count, None)
 
     # Sort selected by date for chronological display
     selected_images.sort(key=lambda x: x.date or datetime.min)
 
-    # Select videos
-    selected_videos = videos[:video_count] if videos else []
-
     return selected_images, selected_videos
 
 
-def convert_heic_to_jpeg(input_path: Path, output_path: Path, max_size: int = 1600) -> bool:
-    """Convert HEIC to optimized JPEG."""
-    if not HAS_PIL:
-        # Try sips on macOS
-        try:
+@contextmanager
+def atomic_output(output_path: Path) -> Iterator[Path]:
+    """Yield a temp path next to output_path and rename it into place on success.
+
+    A killed or failed conversion leaves at most a hidden temp file, never a
+    truncated file under the real name.
+    """
+    tmp_path = output_path.with_name(f".{output_path.stem}.{os.getpid()}.tmp{output_path.suffix}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, output_path)
+        pipeline_trace.count_file('bytes_written', output_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def write_web_jpeg(input_path: Path, output_path: Path, max_size: int = 1600) -> None:
+    """Write a resized, optimized JPEG atomically; raises on any failure."""
+    with atomic_output(output_path) as tmp_path:
+        if not HAS_PIL:
+            # Try sips on macOS
             subprocess.run([
                 'sips', '-s', 'format', 'jpeg',
-                str(input_path), '--out', str(output_path)
+                str(input_path), '--out', str(tmp_path)
             ], check=True, capture_output=True)
-            return True
-        except:
-            return False
+        else:
+            with Image.open(input_path) as img:
+                # Resize if too large (reduced while decoding, see decode_budget)
+                ratio = min(max_size / img.width, max_size / img.height, 1.0)
+                new_size = (int(img.width * ratio), int(img.height * ratio))
+                img = decode_budget.load_reduced(img, new_size)
+                if img.mode in ('RGBA', 'P'):
+                    img = img.convert('RGB')
+                if img.size != new_size:
+                    img = img.resize(new_size, Image.LANCZOS)
 
-    try:
-        with Image.open(input_path) as img:
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
+                img.save(tmp_path, 'JPEG', quality=85, optimize=True)
 
-            # Resize if too large
-            ratio = min(max_size / img.width, max_size / img.height, 1.0)
-            if ratio < 1:
-                new_size = (int(img.width * ratio), int(img.height * ratio))
-                img = img.resize(new_size, Image.LANCZOS)
+            # Re-read the file so a bad write is caught before it replaces anything
+            with Image.open(tmp_path) as written:
+                written.verify()
 
-            img.save(output_path, 'JPEG', quality=85, optimize=True)
+
+def convert_heic_to_jpeg(input_path: Path, output_path: Path, max_size: int = 1600) -> bool:
+    """Convert HEIC to optimized JPEG."""
+    try:
+        write_web_jpeg(input_path, output_path, max_size)
         return True
     except Exception as e:
         print(f"  Error converting {input_path.name}: {e}")
         return False
 
 
+def convert_image_job(job: Tuple[Path, Path, Sequence[int], Sequence[str]]
+                      ) -> Tuple[Optional[Dict], Optional[str]]:
+    """Process-pool worker: write one image's responsive derivatives.
+
+    Returns (srcset manifest entry, None) or (None, error message). Without
+    Pillow only the single web JPEG is written and the entry is None.
+    """
+    input_path, output_path, widths, formats = job
+    try:
+        with pipeline_trace.span('convert_image', cat='file', file=input_path.name):
+            pipeline_trace.count_file('bytes_read', input_path)
+            if not HAS_PIL:
+                write_web_jpeg(input_path, output_path)
+                return None, None
+            entry = media_derivatives.write_derivatives(
+                input_path, output_path.parent, output_path.stem, widths, formats)
+            return entry, None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
 def convert_mov_to_mp4(input_path: Path, output_path: Path) -> bool:
     """Convert MOV to web-optimized MP4."""
     try:
-        subprocess.run([
-            'ffmpeg', '-y', '-i', str(input_path),
-            '-c:v', 'libx264', '-crf', '23', '-preset', 'medium',
-            '-c:a', 'aac', '-b:a', '128k',
-            '-movflags', '+faststart',
-            '-vf', 'scale=1920:-2',
-            str(output_path)
-        ], check=True, capture_output=True)
+        with pipeline_trace.span('convert_video', cat='file', file=input_path.name), \
+                atomic_output(output_path) as tmp_path:
+            pipeline_trace.count_file('bytes_read', input_path)
+            pipeline_trace.run([
+                'ffmpeg', '-y', '-i', str(input_path),
+                '-c:v', 'libx264', '-crf', '23', '-preset', 'medium',
+                '-c:a', 'aac', '-b:a', '128k',
+                '-movflags', '+faststart',
+                '-vf', 'scale=1920:-2',
+                str(tmp_path)
+            ], check=True, capture_output=True)
         return True
     except Exception as e:
         print(f"  Error converting {input_path.name}: {e}")
         return False
 
 
+# Adaptive-bitrate ladder: (height, video bitrate, max rate, audio bitrate)
+HLS_LADDER = [
+    (360, '800k', '1200k', '96k'),
+    (720, '2800k', '4200k', '128k'),
+    (1080, '5000k', '7500k', '128k'),
+]
+
+
+def probe_video(video_path: Path) -> Dict:
+    """Width, height (as displayed, after rotation), duration and audio presence."""
+    result = pipeline_trace.run([
+        'ffprobe', '-v', 'error', '-print_format', 'json',
+        '-show_streams', '-show_format', str(video_path)
+    ], check=True, capture_output=True, text=True)
+    info = json.loads(result.stdout)
+
+    video = next(s for s in info['streams'] if s.get('codec_type') == 'video')
+    width, height = int(video['width']), int(video['height'])
+    rotation = abs(int(video.get('tags', {}).get('rotate', 0)))
+    for side_data in video.get('side_data_list', []):
+        rotation = abs(int(side_data.get('rotation', rotation)))
+    if rotation in (90, 270):
+        width, height = height, width
+
+    return {
+        'width': width,
+        'height': height,
+        'duration': float(info.get('format', {}).get('duration', 0) or 0),
+        'has_audio': any(s.get('codec_type') == 'audio' for s in info['streams']),
+    }
+
+
+def convert_mov_to_hls(input_path: Path, output_dir: Path,
+                       segment_seconds: int = 4) -> Optional[Dict]:
+    """Encode an HLS rendition ladder plus a progressive MP4 in one decode pass.
+
+    The source is decoded once and split into one scaled stream per rung
+    (never upscaling). Each rung is written as fMP4/CMAF segments with aligned
+    keyframes and a master playlist. A 720p progressive MP4 is written too,
+    for browsers without HLS support. Returns the manifest that is also
+    saved as manifest.json in output_dir, or None on failure.
+    """
+    try:
+        info = probe_video(input_path)
+        rungs = [r for r in HLS_LADDER if r[0] <= info['height']] or [HLS_LADDER[0]]
+        fallback_height = min(720, info['height'])
+
+        tmp_dir = output_dir.with_name(f".{output_dir.name}.{os.getpid()}.tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        outputs = len(rungs) + 1
+        graph = f"[0:v]split={outputs}" + ''.join(f"[s{k}]" for k in range(outputs)) + ';'
+        graph += ';'.join(f"[s{k}]scale=-2:{height}[v{k}]" for k, (height, *_) in enumerate(rungs))
+        graph += f";[s{len(rungs)}]scale=-2:{fallback_height}[vmp4]"
+
+        cmd = ['ffmpeg', '-y', '-i', str(input_path), '-filter_complex', graph]
+        stream_map = []
+        for k, (height, bitrate, maxrate, audio_bitrate) in enumerate(rungs):
+            cmd += ['-map', f'[v{k}]', f'-c:v:{k}', 'libx264', f'-b:v:{k}', bitrate,
+                    f'-maxrate:v:{k}', maxrate, f'-bufsize:v:{k}', maxrate]
+            if info['has_audio']:
+                cmd += ['-map', '0:a:0', f'-c:a:{k}', 'aac', f'-b:a:{k}', audio_bitrate]
+                stream_map.append(f'v:{k},a:{k},name:{height}p')
+            else:
+                stream_map.append(f'v:{k},name:{height}p')
+        cmd += [
+            '-preset', 'medium', '-pix_fmt', 'yuv420p',
+            # Keyframes on segment boundaries in every rung so players can switch cleanly
+            '-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})', '-sc_threshold', '0',
+            '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+            '-hls_segment_type', 'fmp4', '-hls_flags', 'independent_segments',
+            '-hls_fmp4_init_filename', 'init.mp4',
+            '-hls_segment_filename', str(tmp_dir / '%v' / 'seg_%03d.m4s'),
+            '-master_pl_name', 'master.m3u8',
+            '-var_stream_map', ' '.join(stream_map),
+            str(tmp_dir / '%v' / 'index.m3u8'),
+            # Second output from the same decode: progressive fallback
+            '-map', '[vmp4]', '-c:v', 'libx264', '-crf', '23', '-preset', 'medium',
+            '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+        ]
+        if info['has_audio']:
+            cmd += ['-map', '0:a:0', '-c:a', 'aac', '-b:a', '128k']
+        cmd.append(str(tmp_dir / 'fallback.mp4'))
+
+        with pipeline_trace.span('convert_video', cat='file', file=input_path.name, format='hls'):
+            pipeline_trace.count_file('bytes_read', input_path)
+            pipeline_trace.run(cmd, check=True, capture_output=True)
+
+        base_url = output_sync.public_url(output_dir)
+        renditions = []
+        for height, bitrate, _, audio_bitrate in rungs:
+            stream_dir = tmp_dir / f'{height}p'
+            width = int(round(info['width'] * height / info['height'] / 2)) * 2
+            renditions.append({
+                'width': width,
+                'height': height,
+                'bandwidth': (int(bitrate[:-1]) + (int(audio_bitrate[:-1]) if info['has_audio'] else 0)) * 1000,
+                'playlist': f"{base_url}/{height}p/index.m3u8",
+                'bytes': sum(f.stat().st_size for f in stream_dir.iterdir()),
+            })
+
+        manifest = {
+            'source': input_path.name,
+            'duration': round(info['duration'], 3),
+            'hls': f"{base_url}/master.m3u8",
+            'mp4': f"{base_url}/fallback.mp4",
+            'renditions': renditions,
+        }
+        (tmp_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+
+        # Swap the finished directory into place
+        old_dir = output_dir.with_name(f".{output_dir.name}.{os.getpid()}.old")
+        if output_dir.exists():
+            os.replace(output_dir, old_dir)
+        os.replace(tmp_dir, output_dir)
+        if old_dir.exists():
+            shutil.rmtree(old_dir)
+        if pipeline_trace.enabled():
+            pipeline_trace.count('bytes_written', sum(
+                f.stat().st_size for f in output_dir.rglob('*') if f.is_file()))
+        return manifest
+    except Exception as e:
+        print(f"  Error converting {input_path.name} to HLS: {e}")
+        if 'tmp_dir' in locals() and tmp_dir.exists():
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None
+
+
+def copy_file_atomic(input_path: Path, output_path: Path) -> bool:
+    """Copy a file into place via a temp file and rename."""
+    try:
+        with atomic_output(output_path) as tmp_path:
+            shutil.copy2(input_path, tmp_path)
+        return True
+    except Exception as e:
+        print(f"  Error copying {input_path.name}: {e}")
+        return False
+
+
+def delete_original(source: Path, output_path: Path) -> None:
+    """Delete a source file, but only once its converted output is safely on disk."""
+    try:
+        if output_path.stat().st_size > 0:
+            source.unlink()
+            print(f"           Deleted original")
+    except OSError:
+        pass
+
+
 def process_selected_media(images: List[MediaFile], videos: List[MediaFile],
                            images_output_dir: Path, videos_output_dir: Path,
-                           delete_originals: bool = False) -> None:
-    """Process and copy selected media to output directories."""
+                           delete_originals: bool = False,
+                           workers: Optional[int] = None,
+                           video_format: str = 'mp4',
+                           image_widths: Sequence[int] = (320, 640, 1024, 1600),
+                           image_formats: Sequence[str] = ('avif', 'webp', 'jpeg'),
+                           memory_budget: Optional[int] = None) -> None:
+    """Process and copy selected media to output directories.
+
+    Images are converted in parallel across `workers` processes; results are
+    reported in selection order and one failing file does not stop the rest.
+    A conversion only starts while the estimated decode footprints of those
+    running fit memory_budget bytes (default: half the RAM).
+    Each image is decoded once into every width in image_widths and every
+    format in image_formats; images_output_dir/responsive-images.json lists
+    them for srcset. With video_format='hls' each video becomes an adaptive-bitrate ladder and
+    videos_output_dir/manifest.json lists them for the website.
+
+    Outputs are named after the source content and tracked in each directory's
+    sync manifest (see output_sync): selections whose source and settings are
+    unchanged are not converted again, and outputs that are no longer
+    selected are deleted.
+    """
 
     images_output_dir.mkdir(parents=True, exist_ok=True)
     videos_output_dir.mkdir(parents=True, exist_ok=True)
 
     print(f"\n📸 Processing {len(images)} selected images...")
 
-    for i, img in enumerate(images, 1):
-        date_str = img.date.strftime('%Y%m%d') if img.date else f'photo{i:02d}'
-        output_name = f"build-{date_str}-{i:02d}.jpg"
-        output_path = images_output_dir / output_name
-
-        print(f"  [{i}/{len(images)}] {img.path.name} → {output_name}")
-        print(f"           Phase: {img.build_phase}, Score: {img.quality_score:.1f}")
-        print(f"           {img.description[:60]}...")
-
-        ext = img.path.suffix.lower()
-        if ext in ['.heic', '.heif']:
-            success = convert_heic_to_jpeg(img.path, output_path)
+    images_sync = output_sync.OutputManifest(images_output_dir)
+    image_key = output_sync.params_key(widths=sorted(image_widths), formats=sorted(image_formats),
+                                       responsive=HAS_PIL)
+    plans = []
+    jobs = []
+    for img in images:
+        try:
+            img.content_hash = img.content_hash or file_content_hash(img.path)
+        except OSError as e:
+            plans.append((img, None, False))
+            print(f"  Cannot read {img.path.name}: {e}")
+            continue
+        output_path = images_output_dir / f"{output_sync.output_stem(img.content_hash, img.date)}.jpg"
+        # A byte-identical copy selected twice shares the first one's output
+        fresh = (images_sync.up_to_date(output_path.stem, img.content_hash, image_key)
+                 or any(path == output_path for _, path, _ in plans))
+        plans.append((img, output_path, fresh))
+        if not fresh:
+            jobs.append((img.path, output_path, image_widths, image_formats))
+
+    srcset_entries = {}
+    converted = 0
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+    budget = None
+    costs = [0] * len(jobs)
+    if HAS_PIL:
+        budget = decode_budget.MemoryBudget(memory_budget or decode_budget.default_budget_bytes())
+        max_size = min(1600, max(image_widths))
+        costs = [decode_budget.estimate_decode_bytes(job[0], max_size) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if budget is not None:
+            submit = partial(pipeline_trace.submit, pool, convert_image_job)
+            results = decode_budget.budgeted_map(submit, jobs, costs, budget, workers)
         else:
-            success = convert_heic_to_jpeg(img.path, output_path)  # Reuse for resizing
-
-        if success and delete_originals:
-            try:
-                img.path.unlink()
-                print(f"           Deleted original")
-            except:
-                pass
+            results = pipeline_trace.pool_map(pool, convert_image_job, jobs)
+        for i, (img, output_path, fresh) in enumerate(plans, 1):
+            if output_path is None:
+                continue
+            stem = output_path.stem
+            print(f"  [{i}/{len(images)}] {img.path.name} → {output_path.name}"
+                  f"{' (unchanged)' if fresh else ''}")
+            print(f"           Phase: {img.build_phase}, Score: {img.quality_score:.1f}")
+            print(f"           {img.description[:60]}...")
+
+            if fresh:
+                record = images_sync.get(stem)
+                if record is None:  # the copy it shares an output with failed
+                    continue
+                images_sync.keep(stem)
+                entry = record['entry']
+            else:
+                entry, error = next(results)
+                if error:
+                    print(f"           ⚠️  Error converting: {error}")
+                    continue
+                files = output_sync.srcset_files(entry) if entry else [output_path.name]
+                images_sync.record(stem, img.path, img.content_hash, image_key, files, entry)
+                converted += 1
+            if entry is not None:
+                srcset_entries[stem] = entry
+            if delete_originals:
+                delete_original(img.path, output_path)
+
+    pruned = images_sync.prune()
+    images_sync.save()
+    unchanged = sum(1 for _, _, fresh in plans if fresh)
+    print(f"   {converted} converted, {unchanged} unchanged, {len(pruned)} removed")
+
+    if HAS_PIL and (srcset_entries or pruned):
+        manifest_path = media_derivatives.write_srcset_manifest(images_output_dir, srcset_entries)
+        print(f"   Wrote srcset manifest: {manifest_path}")
 
     print(f"\n🎬 Processing {len(videos)} selected videos...")
 
+    videos_sync = output_sync.OutputManifest(videos_output_dir)
+    video_key = output_sync.params_key(format=video_format,
+                                       ladder=HLS_LADDER if video_format == 'hls' else None)
+    video_manifests = []
     for i, vid in enumerate(videos, 1):
-        date_str = vid.date.strftime('%Y%m%d') if vid.date else f'video{i:02d}'
-        output_name = f"build-{date_str}-{i:02d}.mp4"
-        output_path = videos_output_dir / output_name
+        try:
+            vid.content_hash = vid.content_hash or file_content_hash(vid.path)
+        except OSError as e:
+            print(f"  Cannot read {vid.path.name}: {e}")
+            continue
+        stem = output_sync.output_stem(vid.content_hash, vid.date)
+        fresh = videos_sync.up_to_date(stem, vid.content_hash, video_key)
+
+        if video_format == 'hls':
+            output_path = videos_output_dir / stem
+            print(f"  [{i}/{len(videos)}] {vid.path.name} → {output_path.name}/master.m3u8"
+                  f"{' (unchanged)' if fresh else ''}")
+            print(f"           Phase: {vid.build_phase}, Score: {vid.quality_score:.1f}")
+            if fresh:
+                videos_sync.keep(stem)
+                manifest = videos_sync.get(stem)['entry']
+            else:
+                manifest = convert_mov_to_hls(vid.path, output_path)
+                if manifest is None:
+                    continue
+                videos_sync.record(stem, vid.path, vid.content_hash, video_key, [stem], manifest)
+            video_manifests.append(dict(manifest, phase=vid.build_phase,
+                                        description=vid.description))
+            if delete_originals:
+                delete_original(vid.path, output_path / 'master.m3u8')
+            continue
 
-        print(f"  [{i}/{len(videos)}] {vid.path.name} → {output_name}")
+        output_path = videos_output_dir / f"{stem}.mp4"
+        print(f"  [{i}/{len(videos)}] {vid.path.name} → {output_path.name}"
+              f"{' (unchanged)' if fresh else ''}")
         print(f"           Phase: {vid.build_phase}, Score: {vid.quality_score:.1f}")
 
-        ext = vid.path.suffix.lower()
-        if ext == '.mov':
-            success = convert_mov_to_mp4(vid.path, output_path)
-        elif ext == '.mp4':
-            shutil.copy2(vid.path, output_path)
+        if fresh:
+            videos_sync.keep(stem)
             success = True
         else:
-            success = convert_mov_to_mp4(vid.path, output_path)
+            ext = vid.path.suffix.lower()
+            if ext == '.mp4':
+                success = copy_file_atomic(vid.path, output_path)
+            else:
+                success = convert_mov_to_mp4(vid.path, output_path)
+            if success:
+                videos_sync.record(stem, vid.path, vid.content_hash, video_key, [output_path.name])
 
         if success and delete_originals:
-            try:
-                vid.path.unlink()
-                print(f"           Deleted original")
-            except:
-                pass
+            delete_original(vid.path, output_path)
+
+    pruned = videos_sync.prune()
+    videos_sync.save()
+    if pruned:
+        print(f"   Removed {len(pruned)} videos that are no longer selected")
+
+    if video_manifests or pruned:
+        manifest_path = videos_output_dir / 'manifest.json'
+        text = json.dumps({'videos': video_manifests}, indent=2)
+        if not manifest_path.exists() or manifest_path.read_text() != text:
+            with atomic_output(manifest_path) as tmp_path:
+                tmp_path.write_text(text)
+        print(f"   Wrote streaming manifest: {manifest_path}")
+
+
+def phase_quota(value: str) -> Tuple[str, int]:
+    """argparse type for --phase-quota PHASE=N."""
+    phase, sep, limit = value.partition('=')
+    phase = phase.strip()
+    if not sep or phase not in BUILD_PHASES:
+        raise argparse.ArgumentTypeError(
+            f"expected PHASE=N with PHASE one of {', '.join(sorted(BUILD_PHASES))}, got {value!r}")
+    try:
+        count = int(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"quota for {phase} is not a whole number: {limit!r}")
+    if count < 0:
+        raise argparse.ArgumentTypeError(f"quota for {phase} must not be negative")
+    return phase, count
 
 
 def main():
@@ -452,22 +1815,80 @@ def main():
     parser.add_argument('--videos-output-dir', default='website/public/videos', help='Output directory for videos')
     parser.add_argument('--count', type=int, default=12, help='Number of images to select')
     parser.add_argument('--video-count', type=int, default=2, help='Number of videos to select')
+    parser.add_argument('--video-frames', type=int, default=4,
+                        help='Keyframes sampled per video; the best one is analyzed')
+    parser.add_argument('--scene-threshold', type=float,
+                        help='Prefer scene-change keyframes (ffmpeg scene score, e.g. 0.3)')
+    parser.add_argument('--image-widths', type=int, nargs='+', default=[320, 640, 1024, 1600],
+                        help='Widths written for each selected image (the largest is capped at 1600px)')
+    parser.add_argument('--image-formats', nargs='+', choices=['avif', 'webp', 'jpeg'],
+                        default=['avif', 'webp', 'jpeg'],
+                        help='Formats written at every width (JPEG is always included)')
+    parser.add_argument('--video-format', choices=['mp4', 'hls'], default='mp4',
+                        help='mp4: one 1080p file; hls: 360p/720p/1080p adaptive ladder + manifest.json')
     parser.add_argument('--delete-originals', action='store_true', help='Delete original files after conversion')
+    parser.add_argument('--convert-workers', type=int, help='Processes converting selected images (default: CPU count)')
+    parser.add_argument('--memory-budget-mb', type=float,
+                        help='RAM the image decodes in flight may use together (default: half of RAM)')
     parser.add_argument('--no-ai', action='store_true', help='Skip AI analysis (faster but less intelligent)')
+    parser.add_argument('--diversity', type=float, default=0.3,
+                        help='0 = pick purely by score, 1 = maximise spread across time/phase/appearance')
+    parser.add_argument('--phase-quota', action='append', type=phase_quota, metavar='PHASE=N',
+                        help='Select at most N images from a build phase (repeatable)')
+    parser.add_argument('--min-gap-minutes', type=float, default=0, help='Minimum time between selected images')
+    parser.add_argument('--no-dedup', action='store_true', help='Send near-duplicate shots for analysis too')
+    parser.add_argument('--dedup-radius', type=int, default=4, help='Max pHash bit difference for near-duplicates')
+    parser.add_argument('--burst-window', type=float, default=10.0,
+                        help='Seconds between shots to compare with a looser burst threshold')
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help='Most files per analysis request')
+    parser.add_argument('--batch-tokens', type=int, default=16000,
+                        help='Estimated input-token budget per analysis request')
+    parser.add_argument('--batch-mb', type=float, default=16.0,
+                        help='Image payload budget per analysis request, in MB of base64')
+    parser.add_argument('--max-item-retries', type=int, default=2,
+                        help='Extra attempts for a single file whose analysis keeps failing')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Analyze through asynchronous message batch jobs (cheaper, slower)')
+    parser.add_argument('--bulk-state', default=str(DEFAULT_BULK_STATE_PATH),
+                        help='JSON file tracking submitted bulk jobs')
+    parser.add_argument('--bulk-no-wait', action='store_true',
+                        help='Submit bulk jobs and exit; a later --bulk run collects the results')
+    parser.add_argument('--bulk-poll-interval', type=float, default=60.0,
+                        help='Seconds between bulk job status checks')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of analysis batches in flight at once')
+    parser.add_argument('--requests-per-minute', type=float, default=50, help='Client-side cap on API request rate')
+    parser.add_argument('--prep-workers', type=int, help='Processes preparing thumbnails (default: CPU count)')
+    parser.add_argument('--queue-depth', type=int, default=4, help='Max prepared batches waiting for the API')
+    parser.add_argument('--api-base-url', help='Override the Anthropic API URL (e.g. a local test server)')
+    parser.add_argument('--cache-path', default=str(DEFAULT_CACHE_PATH), help='SQLite file for cached analysis results')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the analysis cache')
+    parser.add_argument('--clear-cache', action='store_true', help='Invalidate all cached analysis results before running')
+    parser.add_argument('--cache-max-age-days', type=float, default=90, help='Evict cached results older than this')
+    parser.add_argument('--cache-max-entries', type=int, default=50000, help='Keep at most this many cached results')
+    parser.add_argument('--catalog-path', default=str(DEFAULT_CATALOG_PATH), help='SQLite file for the media catalog')
+    parser.add_argument('--watch', action='store_true', help='Keep running and process new files as they arrive')
+    parser.add_argument('--trace', metavar='TRACE_JSON',
+                        help='Record stage/file/API/ffmpeg timings to a Chrome trace file and print a summary')
 
     args = parser.parse_args()
+    if args.trace:
+        pipeline_trace.enable()
 
     photos_dir = Path(args.photos_dir).expanduser()
-    images_output_dir = Path(args.output_dir)
-    videos_output_dir = Path(args.videos_output_dir)
 
     if not photos_dir.exists():
         print(f"❌ Error: Photos directory does not exist: {photos_dir}")
         sys.exit(1)
 
-    # Find all media files
+    # Bring the catalog up to date (only new or changed files are read)
     print(f"\n🔍 Scanning for media in: {photos_dir}")
-    media_files = find_media_files(photos_dir)
+    catalog = MediaCatalog(Path(args.catalog_path))
+    with pipeline_trace.span('scan'):
+        result = catalog.refresh(photos_dir)
+        media_files = load_media_files(catalog, photos_dir)
+    print(f"   Catalog: {len(result.added)} new, {len(result.updated)} changed, "
+          f"{len(result.removed)} removed")
 
     images = [m for m in media_files if m.media_type == 'image']
     videos = [m for m in media_files if m.media_type == 'video']
@@ -476,38 +1897,154 @@ def main():
 
     if not media_files:
         print("❌ No media files found!")
-        sys.exit(1)
+        if not args.watch:
+            sys.exit(1)
+    else:
+        run_pipeline(args, catalog, media_files)
+
+    if args.watch:
+        print(f"\n👀 Watching {photos_dir} for new media (Ctrl+C to stop)...")
+
+        def on_change(changes):
+            print(f"\n📥 {len(changes.added)} new, {len(changes.updated)} changed, "
+                  f"{len(changes.removed)} removed")
+            run_pipeline(args, catalog, load_media_files(catalog, photos_dir))
+
+        try:
+            catalog.watch(photos_dir, on_change)
+        except KeyboardInterrupt:
+            print("\n   Stopped watching")
+
+    catalog.close()
+
+    if args.trace:
+        pipeline_trace.TRACER.print_summary()
+        print(f"\n   Trace written to {pipeline_trace.TRACER.write_chrome_trace(Path(args.trace))}")
+
+
+def run_pipeline(args: argparse.Namespace, catalog: MediaCatalog,
+                 media_files: List[MediaFile]) -> None:
+    """Analyze, select and convert one snapshot of the catalog."""
+    images_output_dir = Path(args.output_dir)
+    videos_output_dir = Path(args.videos_output_dir)
+    memory_budget = int(args.memory_budget_mb * 1e6) if args.memory_budget_mb else None
+    use_ai = not args.no_ai
 
     # AI Analysis
-    if not args.no_ai:
+    if use_ai:
         if not HAS_ANTHROPIC:
             print("⚠️  anthropic package not installed. Using fallback selection.")
-            args.no_ai = True
+            use_ai = False
         else:
             api_key = get_api_key()
             if not api_key:
                 print("⚠️  No ANTHROPIC_API_KEY found. Using fallback selection.")
                 print("   Set it with: export ANTHROPIC_API_KEY='your-key'")
-                args.no_ai = True
+                use_ai = False
             else:
-                client = anthropic.Anthropic(api_key=api_key)
-                media_files = analyze_media_with_claude(client, media_files)
-
-    if args.no_ai:
-        # Fallback: sort by date and take evenly spaced
-        print("\n📊 Using date-based selection (no AI)...")
+                # Retries are handled by our own rate-limit-aware scheduler
+                client = anthropic.AsyncAnthropic(api_key=api_key, base_url=args.api_base_url,
+                                                  max_retries=0)
+                cache = None
+                if not args.no_cache:
+                    cache = AnalysisCache(Path(args.cache_path),
+                                          max_age_days=args.cache_max_age_days,
+                                          max_entries=args.cache_max_entries)
+                    if args.clear_cache:
+                        cache.clear()
+                        args.clear_cache = False  # only once, not on every watch update
+                        print("🗑️  Cleared analysis cache")
+                    with pipeline_trace.span('hash'):
+                        hashes = catalog.ensure_hashes(m.path for m in media_files)
+                    for m in media_files:
+                        m.content_hash = hashes.get(m.path, m.content_hash)
+                duplicates = {}
+                if not args.no_dedup and HAS_NUMPY:
+                    print(f"\n🧬 Looking for near-duplicate shots...")
+                    with pipeline_trace.span('dedup'):
+                        duplicates = find_near_duplicates(media_files, catalog, args.prep_workers,
+                                                          radius=args.dedup_radius,
+                                                          burst_window=args.burst_window)
+                    print(f"   Collapsed {len(duplicates)} near-duplicates into "
+                          f"{len(set(duplicates.values()))} representatives")
+                to_analyze = [m for i, m in enumerate(media_files) if i not in duplicates]
+                try:
+                    with pipeline_trace.span('analyse', files=len(to_analyze)):
+                        if args.bulk:
+                            finished = asyncio.run(analyze_media_bulk(
+                                client, to_analyze, Path(args.bulk_state),
+                                batch_size=args.batch_size, cache=cache,
+                                prep_workers=args.prep_workers,
+                                video_frame_count=args.video_frames,
+                                scene_threshold=args.scene_threshold,
+                                token_budget=args.batch_tokens,
+                                byte_budget=int(args.batch_mb * 1e6),
+                                wait=not args.bulk_no_wait,
+                                poll_interval=args.bulk_poll_interval,
+                                memory_budget=memory_budget
+                            ))
+                            if not finished:
+                                return
+                        else:
+                            analyze_media_with_claude(
+                                client, to_analyze, batch_size=args.batch_size, cache=cache,
+                                concurrency=args.concurrency,
+                                requests_per_minute=args.requests_per_minute,
+                                prep_workers=args.prep_workers,
+                                queue_depth=args.queue_depth,
+                                video_frame_count=args.video_frames,
+                                scene_threshold=args.scene_threshold,
+                                token_budget=args.batch_tokens,
+                                byte_budget=int(args.batch_mb * 1e6),
+                                max_item_retries=args.max_item_retries,
+                                memory_budget=memory_budget
+                            )
+                    copy_analysis_to_duplicates(media_files, duplicates)
+                except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+                    print(f"❌ Claude API error, aborting analysis: {e}")
+                    sys.exit(1)
+                finally:
+                    if cache is not None:
+                        evicted = cache.evict()
+                        if evicted:
+                            print(f"   Evicted {evicted} stale cache entries")
+                        cache.close()
+
+    if not use_ai:
         for m in media_files:
             m.quality_score = 5.0
             m.build_phase = 'general'
             m.description = m.path.name
 
+        if HAS_NUMPY and HAS_PIL:
+            print("\n📊 Scoring media locally (no AI)...")
+            with pipeline_trace.span('score'):
+                score_media_locally(media_files, args.prep_workers,
+                                    video_frame_count=args.video_frames,
+                                    scene_threshold=args.scene_threshold)
+        else:
+            # Fallback: sort by date and take evenly spaced
+            print("\n📊 Using date-based selection (no AI)...")
+
+    phase_quotas = dict(args.phase_quota or [])
+
+    # Appearance diversity needs every image's pHash, whether or not dedup ran
+    if (HAS_NUMPY and args.diversity > 0
+            and any(m.media_type == 'image' and m.visual_hash is None for m in media_files)):
+        with pipeline_trace.span('fingerprint'):
+            image_fingerprints(media_files, catalog, args.prep_workers)
+
     # Select best media
     print(f"\n🎯 Selecting best {args.count} images and {args.video_count} videos...")
-    selected_images, selected_videos = select_best_media(
-        media_files,
-        image_count=args.count,
-        video_count=args.video_count
-    )
+    with pipeline_trace.span('select'):
+        selected_images, selected_videos = select_best_media(
+            media_files,
+            image_count=args.count,
+            video_count=args.video_count,
+            diversity=args.diversity,
+            phase_quotas=phase_quotas,
+            min_time_gap=args.min_gap_minutes * 60
+        )
 
     # Show selection summary
     print(f"\n📋 Selected {len(selected_images)} images:")
@@ -520,13 +2057,19 @@ def main():
             print(f"   • {vid.path.name} ({vid.build_phase}, score: {vid.quality_score:.1f})")
 
     # Process selected media
-    process_selected_media(
-        selected_images,
-        selected_videos,
-        images_output_dir,
-        videos_output_dir,
-        delete_originals=args.delete_originals
-    )
+    with pipeline_trace.span('convert'):
+        process_selected_media(
+            selected_images,
+            selected_videos,
+            images_output_dir,
+            videos_output_dir,
+            delete_originals=args.delete_originals,
+            workers=args.convert_workers,
+            video_format=args.video_format,
+            image_widths=args.image_widths,
+            image_formats=args.image_formats,
+            memory_budget=memory_budget
+        )
 
     print(f"\n✅ Done!")
     print(f"   Images saved to: {images_output_dir}")
@@ -0,0 +1,129 @@
+"""
+In-memory video frame sampling with ffmpeg.
+
+Frames are streamed as MJPEG over image2pipe straight into memory instead
+of going through temp files. Every sample point is opened with input
+seeking (-ss before -i), so ffmpeg jumps via the container index to the
+nearest keyframe instead of decoding everything in front of it, and
+-skip_frame nokey makes the decoder drop every non-keyframe. All sample
+points of one video come out of a single ffmpeg process.
+
+Scene mode instead decodes the keyframes of the whole clip and keeps those
+where the picture changes (ffmpeg's scene score), which lands on distinct
+shots rather than fades, black leaders or the same view four times.
+"""
+
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+import pipeline_trace
+
+JPEG_EOI = b'\xff\xd9'
+
+
+def probe_duration(video_path: Path) -> Optional[float]:
+    """Container duration in seconds, or None if ffprobe is missing or fails."""
+    try:
+        result = pipeline_trace.run([
+            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1', str(video_path)
+        ], check=True, capture_output=True, text=True, timeout=30)
+        return float(result.stdout.strip())
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return None
+
+
+def split_jpeg_stream(data: bytes) -> List[bytes]:
+    """Split concatenated JPEGs from image2pipe.
+
+    Entropy-coded JPEG data stuffs every 0xFF with 0x00, so an FFD9 marker
+    can only be a real end-of-image.
+    """
+    frames = []
+    start = 0
+    while True:
+        end = data.find(JPEG_EOI, start)
+        if end < 0:
+            break
+        frames.append(data[start:end + 2])
+        start = end + 2
+    return frames
+
+
+def sample_timestamps(duration: Optional[float], count: int) -> List[float]:
+    """Evenly spaced sample points, avoiding the first and last moments of the clip."""
+    if not duration or duration <= 0:
+        return [0.0]
+    return [duration * (k + 0.5) / count for k in range(count)]
+
+
+def _scale_filter(max_size: int) -> str:
+    return (f"scale='min({max_size},iw)':'min({max_size},ih)'"
+            f":force_original_aspect_ratio=decrease")
+
+
+def _run_pipe(cmd: List[str], timeout: float) -> List[bytes]:
+    result = pipeline_trace.run(cmd + ['-f', 'image2pipe', '-c:v', 'mjpeg', '-q:v', '3', 'pipe:1'],
+                                check=True, capture_output=True, timeout=timeout)
+    return split_jpeg_stream(result.stdout)
+
+
+def keyframes_at(video_path: Path, timestamps: Sequence[float], max_size: int = 800,
+                 timeout: float = 60.0) -> List[bytes]:
+    """The keyframe at or before each timestamp, one ffmpeg process for all of them."""
+    cmd = ['ffmpeg', '-v', 'error', '-nostdin']
+    for t in timestamps:
+        cmd += ['-skip_frame', 'nokey', '-noaccurate_seek', '-ss', f'{t:.3f}', '-i', str(video_path)]
+    n = len(timestamps)
+    graph = ';'.join(f"[{k}:v:0]trim=end_frame=1,setpts=PTS-STARTPTS,"
+                     f"{_scale_filter(max_size)},setsar=1[f{k}]"
+                     for k in range(n))
+    graph += ';' + ''.join(f"[f{k}]" for k in range(n)) + f"concat=n={n}:v=1:a=0,setpts=N/TB[out]"
+    return _run_pipe(cmd + ['-filter_complex', graph, '-map', '[out]', '-fps_mode', 'passthrough'],
+                     timeout)
+
+
+def scene_keyframes(video_path: Path, limit: int, threshold: float = 0.3,
+                    max_size: int = 800, timeout: float = 120.0) -> List[bytes]:
+    """Keyframes where the scene score exceeds threshold (the first frame always counts)."""
+    cmd = ['ffmpeg', '-v', 'error', '-nostdin', '-skip_frame', 'nokey', '-i', str(video_path),
+           '-vf', f"select='eq(n,0)+gt(scene,{threshold})',{_scale_filter(max_size)}",
+           '-fps_mode', 'vfr', '-frames:v', str(limit)]
+    return _run_pipe(cmd, timeout)
+
+
+def sample_frames(video_path: Path, count: int = 4, max_size: int = 800,
+                  scene_threshold: Optional[float] = None) -> List[bytes]:
+    """Up to `count` JPEG frames spread across the video, fetched in memory.
+
+    With scene_threshold, scene-change keyframes are preferred (evenly thinned
+    if there are more than count) and topped up with evenly spaced samples.
+    """
+    frames: List[bytes] = []
+    if scene_threshold is not None:
+        scenes = scene_keyframes(video_path, 4 * count, scene_threshold, max_size)
+        step = max(1.0, len(scenes) / count)
+        frames = [scenes[int(k * step)] for k in range(min(count, len(scenes)))]
+    if len(frames) < count:
+        timestamps = sample_timestamps(probe_duration(video_path), count - len(frames))
+        frames += keyframes_at(video_path, timestamps, max_size)
+    return frames
+
+
+def sample_videos(video_paths: Sequence[Path], count: int = 4, max_size: int = 800,
+                  scene_threshold: Optional[float] = None,
+                  workers: int = 4) -> Dict[Path, List[bytes]]:
+    """sample_frames for several videos at once (ffmpeg does the work, so threads suffice).
+
+    Videos that fail map to an empty list.
+    """
+    def sample(path: Path) -> List[bytes]:
+        try:
+            return sample_frames(path, count, max_size, scene_threshold)
+        except (subprocess.SubprocessError, OSError):
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(video_paths, pool.map(sample, video_paths)))